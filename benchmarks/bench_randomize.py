@@ -0,0 +1,115 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import sys
+import time
+from argparse import ArgumentParser
+
+from benchmarks import results
+from benchmarks.synthetic_rom import build_synthetic_rom
+from randomizer.counters import HotPathCounters
+from randomizer.flags import Flags
+from randomizer.randomize import randomize
+from randomizer.timing import StageTimer
+
+
+def run_benchmark(seeds: int, flags: Flags, max_workers: int = 1) -> dict:
+    """Randomizes the synthetic ROM with a number of seeds, and times each stage and each full seed.
+
+    :param seeds: Number of seeds to randomize.
+    :param flags: Flags to randomize with.
+    :param max_workers: Number of stages that may run at once.
+    :return: Dictionary of the results.
+    """
+    rom_data = build_synthetic_rom()
+
+    # One seed to warm up (load the data files, compile regular expressions, etc.) that isn't counted.
+    randomize(rom_data, "warmup", flags)
+
+    stage_samples = {}
+    seed_samples = []
+    for index in range(seeds):
+        timer = StageTimer()
+        start = time.perf_counter()
+        randomize(rom_data, f"bench{index}", flags, timer, max_workers=max_workers)
+        seed_samples.append((time.perf_counter() - start) * 1000)
+
+        for record in timer.stages():
+            stage_samples.setdefault(record.name, []).append(record.elapsed_ns / 1000000)
+
+    total_ms = sum(seed_samples)
+    return {
+        "environment": results.environment(),
+        "flags": flags.encode(),
+        "seeds": seeds,
+        "max_workers": max_workers,
+        "seeds_per_second": round(seeds / (total_ms / 1000), 3),
+        "timings": dict(
+            [("seed", results.summarize(seed_samples))] +
+            [(name, results.summarize(samples)) for name, samples in stage_samples.items()]
+        )
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmark randomize() on a synthetic ROM")
+    parser.add_argument("--seeds", type=int, default=20, help="Number of seeds to time")
+    parser.add_argument("--workers", type=int, default=1, help="Number of stages that may run at once")
+    parser.add_argument("--original-progression", dest="no_shuffle", action="store_true",
+                        help="Do not shuffle key items (always the case if clingo isn't installed)")
+    parser.add_argument("--counters", action="store_true",
+                        help="Also randomize one more seed with the hot path counters on, and print them")
+    parser.add_argument("--baseline", default="randomize", help="Name of the baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="How much slower a median may be than the baseline before it's a regression")
+    parser.add_argument("--tail-tolerance", dest="tail_tolerance", type=float, default=0.5,
+                        help="How much slower a p95 may be than the baseline before it's a regression")
+    parsed = parser.parse_args()
+
+    flags = Flags()
+    flags.no_shuffle = parsed.no_shuffle or importlib.util.find_spec("clingo") is None
+
+    current = run_benchmark(parsed.seeds, flags, parsed.workers)
+    if parsed.counters:
+        counters = HotPathCounters()
+        with counters.counting():
+            randomize(build_synthetic_rom(), "counters", flags)
+        print(counters.report())
+    baseline = results.load_baseline(parsed.baseline)
+    comparable = baseline is not None and baseline["flags"] == current["flags"]
+
+    results.print_table(f"randomize() with flags {current['flags']}, {current['seeds']} seeds "
+                        f"({current['seeds_per_second']} seeds/s)",
+                        current["timings"], baseline["timings"] if comparable else None)
+
+    if parsed.save_baseline:
+        results.save_baseline(parsed.baseline, current)
+        print(f"Saved baseline to {results.baseline_path(parsed.baseline)}")
+        return 0
+
+    if comparable:
+        regressions = results.compare(current["timings"], baseline["timings"], parsed.tolerance,
+                                      tail_tolerance=parsed.tail_tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if len(regressions) > 0 else 0
+    if baseline is not None:
+        print(f"Not compared: the baseline was recorded with flags {baseline['flags']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
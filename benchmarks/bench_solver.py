@@ -0,0 +1,152 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+from benchmarks import results
+from randomizer.placement import PROGRAM_FILES
+
+# Solver seeds are drawn from this, so every run (and every variant) solves the same corpus.
+CORPUS_SEED = 0x5eed
+
+CURRENT = "current"
+
+# The counts for a seed don't change between runs of the same programs, but a few more conflicts or choices don't
+# make a difference to solve times, so smaller changes aren't regressions.
+MIN_COUNT_DELTA = 5.0
+
+
+def seed_corpus(count: int) -> list:
+    """Gets the first `count` seeds of the fixed corpus of 32-bit solver seeds."""
+    rng = random.Random(CORPUS_SEED)
+    return [rng.randint(0, 0xffffffff) for _ in range(count)]
+
+
+def variant_programs(variant: str) -> tuple:
+    """Gets the programs to solve for a variant: the key item programs, with the one that has the same file name as
+    the variant replaced by it.
+
+    :param variant: Path of a .lp file.
+    :return: Paths of the programs.
+    """
+    name = os.path.basename(variant)
+    if name not in [os.path.basename(program) for program in PROGRAM_FILES]:
+        raise RuntimeError(f"{variant} doesn't replace any of {', '.join(PROGRAM_FILES)}")
+    return tuple(os.path.abspath(variant) if os.path.basename(program) == name else program
+                 for program in PROGRAM_FILES)
+
+
+def run_benchmark(programs: tuple, seeds: list, ground_runs: int = 5) -> dict:
+    """Grounds the programs a few times, then solves every seed of the corpus.
+
+    :param programs: Paths of the programs to solve.
+    :param seeds: Solver seeds to solve.
+    :param ground_runs: Number of times to ground the programs.
+    :return: Dictionary of timing summaries ("timings", in ms) and search summaries ("search", in counts).
+    """
+    from randomizer.clingo import KeyItemSolver
+
+    ground_samples = []
+    for _ in range(ground_runs):
+        start = time.perf_counter()
+        solver = KeyItemSolver(programs)
+        ground_samples.append((time.perf_counter() - start) * 1000)
+        solver.close()
+
+    solver = KeyItemSolver(programs)
+    samples = {"load_ms": [], "solve_ms": [], "conflicts": [], "choices": []}
+    try:
+        for seed in seeds:
+            statistics = solver.solve_with_statistics(seed).statistics
+            samples["load_ms"].append(statistics["ground_ms"])
+            samples["solve_ms"].append(statistics["solve_ms"])
+            samples["conflicts"].append(statistics["conflicts"])
+            samples["choices"].append(statistics["choices"])
+    finally:
+        solver.close()
+
+    return {
+        "timings": {
+            "ground": results.summarize(ground_samples),
+            "load": results.summarize(samples["load_ms"]),
+            "solve": results.summarize(samples["solve_ms"])
+        },
+        "search": {
+            "conflicts": results.summarize(samples["conflicts"], unit="count"),
+            "choices": results.summarize(samples["choices"], unit="count")
+        }
+    }
+
+
+def report(name: str, current: dict, baseline: dict, tolerance: float) -> list:
+    """Prints a variant's results next to a baseline's, and lists the regressions."""
+    results.print_table(f"{name}: times", current["timings"], baseline["timings"] if baseline else None)
+    results.print_table(f"{name}: search", current["search"], baseline["search"] if baseline else None, unit="count")
+    if baseline is None:
+        return []
+    return (results.compare(current["timings"], baseline["timings"], tolerance) +
+            results.compare(current["search"], baseline["search"], tolerance, min_delta_ms=MIN_COUNT_DELTA,
+                            unit="count"))
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmark the key item solver over a fixed corpus of seeds")
+    parser.add_argument("variants", nargs="*", metavar="VARIANT.lp",
+                        help="Edited copies of the key item programs to compare with the current ones. Each replaces "
+                             "the program with the same file name")
+    parser.add_argument("--seeds", type=int, default=200, help="Number of seeds of the corpus to solve")
+    parser.add_argument("--ground-runs", dest="ground_runs", type=int, default=5,
+                        help="Number of times to ground the programs")
+    parser.add_argument("--baseline", default="solver", help="Name of the baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Save the results of the current programs as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="How much worse a median may be than the baseline before it's a regression")
+    parsed = parser.parse_args()
+
+    if importlib.util.find_spec("clingo") is None:
+        print("clingo is not installed")
+        return 2
+
+    seeds = seed_corpus(parsed.seeds)
+    current = run_benchmark(PROGRAM_FILES, seeds, parsed.ground_runs)
+    current.update({"environment": results.environment(), "seeds": parsed.seeds})
+    baseline = results.load_baseline(parsed.baseline)
+    comparable = baseline is not None and baseline["seeds"] == current["seeds"]
+
+    regressions = report(f"{CURRENT} ({parsed.seeds} seeds)", current, baseline if comparable else None,
+                         parsed.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    # Variants are compared with the current programs, solved just now on the same machine.
+    for variant in parsed.variants:
+        variant_results = run_benchmark(variant_programs(variant), seeds, parsed.ground_runs)
+        for regression in report(variant, variant_results, current, parsed.tolerance):
+            print(f"Worse than {CURRENT}: {regression}")
+
+    if parsed.save_baseline:
+        results.save_baseline(parsed.baseline, current)
+        print(f"Saved baseline to {results.baseline_path(parsed.baseline)}")
+        return 0
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import sys
+import time
+from argparse import ArgumentParser
+
+from benchmarks import results
+from event.easm import GRAMMAR, TokenStream
+from event.epp import PreProcessCode, do_parse
+from event.icodecache import EventHeader
+from event.parseinputstring import ParseInputString
+from event.tokens import ColonToken, CommentToken, LabelToken, NumberToken, SymbolToken
+from randomizer.placement import Placement
+from randomizer.randomize import build_headers, load_event_scripts
+
+
+def corpus() -> list:
+    """Gets every line the assembler tokenizes to assemble the scripts: the header of the vanilla placement, and
+    every script in scripts/, preprocessed after it."""
+    headers = build_headers(Placement(), "#define FREE_START set_flag 0x28")
+    header = EventHeader(headers)
+    lines = do_parse(PreProcessCode(headers), {})
+    for _, script in sorted(load_event_scripts().items()):
+        lines.extend(do_parse(PreProcessCode(script), dict(header.macros)))
+    return "\n".join(lines).splitlines()
+
+
+def scan_line(line: str) -> list:
+    """The tokenizer the assembler used before `easm.TOKEN_PATTERN`, which scans a character at a time. The regular
+    expression must give the same tokens."""
+    tokens = []
+
+    current = ParseInputString(line)
+    char = current.getc()
+    while char is not None:
+        if char.isspace():
+            pass
+        elif char.isalpha():
+            current.ungetc()
+            keyword = current.get_alphanum_str(['_'])
+            if keyword not in GRAMMAR:
+                raise RuntimeError(f"Unknown keyword: {keyword}")
+            tokens.append(GRAMMAR[keyword])
+        elif char.isdigit():
+            current.ungetc()
+            tokens.append(NumberToken(current.get_int()))
+        elif char == '.':
+            if current.peek().isalpha():
+                if len(tokens) == 0:
+                    tokens.append(GRAMMAR["$$def_label"])
+                tokens.append(LabelToken(current.get_alphanum_str(['_'])))
+            else:
+                raise RuntimeError(f"Illegal label definition, starts with: {current.peek()}")
+        elif char == '%':
+            if current.peek().isalpha():
+                if len(tokens) == 0:
+                    tokens.append(GRAMMAR["$$def_symbol"])
+                tokens.append(SymbolToken(current.get_alphanum_str(['_'])))
+            else:
+                raise RuntimeError(f"Illegal label definition, starts with: {current.peek()}")
+        elif char == ':':
+            tokens.append(ColonToken(":"))
+        elif char == ";":
+            comment = ";"
+            while current.peek() is not None:
+                comment += current.getc()
+            tokens.append(CommentToken(comment))
+        elif char == "$":
+            raise RuntimeError(f"'$' characters are reserved for the assembler and may not be used.")
+        else:
+            tokens.append(char)
+
+        char = current.getc()
+
+    return tokens
+
+
+def run_benchmark(lines: list, runs: int) -> dict:
+    """Tokenizes the corpus with both tokenizers a number of times.
+
+    :param lines: Lines to tokenize.
+    :param runs: Number of times to tokenize every line, with each tokenizer.
+    :return: Dictionary of timing summaries, in ms per pass over the corpus.
+    """
+    samples = {"scanner": [], "regex": []}
+    for _ in range(runs):
+        for name, tokenize in [("scanner", scan_line), ("regex", TokenStream._tokenize)]:
+            start = time.perf_counter()
+            for line in lines:
+                tokenize(line)
+            samples[name].append((time.perf_counter() - start) * 1000)
+    return {name: results.summarize(timings) for name, timings in samples.items()}
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmark the event assembler's tokenizer against the character scanner it "
+                                        "replaced, over every line of scripts/")
+    parser.add_argument("--runs", type=int, default=20, help="Number of passes over the corpus")
+    parser.add_argument("--baseline", default="tokenizer", help="Name of the baseline to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="How much slower a median may be than the baseline before it's a regression")
+    parsed = parser.parse_args()
+
+    lines = corpus()
+    mismatches = [line for line in lines if scan_line(line) != TokenStream._tokenize(line)]
+    if len(mismatches) > 0:
+        print(f"{len(mismatches)} lines tokenize differently, such as: {mismatches[0]}")
+        return 1
+
+    current = {"environment": results.environment(), "lines": len(lines),
+               "timings": run_benchmark(lines, parsed.runs)}
+    baseline = results.load_baseline(parsed.baseline)
+    comparable = baseline is not None and baseline["lines"] == current["lines"]
+
+    results.print_table(f"{len(lines)} lines, {parsed.runs} runs (ms per pass)", current["timings"],
+                        baseline["timings"] if comparable else None)
+    speedup = current["timings"]["scanner"]["median_ms"] / current["timings"]["regex"]["median_ms"]
+    print(f"The regular expression is {speedup:.1f}x as fast as the scanner")
+
+    if parsed.save_baseline:
+        results.save_baseline(parsed.baseline, current)
+        print(f"Saved baseline to {results.baseline_path(parsed.baseline)}")
+        return 0
+    regressions = results.compare(current["timings"], baseline["timings"], parsed.tolerance) if comparable else []
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import platform
+import statistics
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def summarize(samples_ms: list, unit: str = "ms") -> dict:
+    """Summarizes a list of timings (or other measurements).
+
+    :param samples_ms: Timings in milliseconds.
+    :param unit: Unit of the samples, which names the keys of the summary.
+    :return: Dictionary with the median, p95 and max of the timings.
+    """
+    ordered = sorted(samples_ms)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        f"median_{unit}": round(statistics.median(ordered), 3),
+        f"p95_{unit}": round(ordered[p95_index], 3),
+        f"max_{unit}": round(ordered[-1], 3)
+    }
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform()
+    }
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_baseline(name: str) -> dict:
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(name: str, results: dict):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(name), "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0, unit: str = "ms",
+            tail_tolerance: float = 0.5) -> list:
+    """Compares the medians and p95s of a set of results against a baseline.
+
+    :param results: Dictionary of name -> summary (from `summarize`).
+    :param baseline: Dictionary of name -> summary for the baseline.
+    :param tolerance: How much slower (as a fraction) a median may get before it counts as a regression.
+    :param min_delta_ms: Differences smaller than this are ignored, since they're mostly noise.
+    :param unit: Unit the summaries were made with.
+    :param tail_tolerance: How much slower a p95 may get before it counts as a regression. The tail is noisier than
+                           the median, so it gets more room. The max is a single sample, so it isn't compared.
+    :return: A list of messages, one for each regression.
+    """
+    regressions = []
+    for name, summary in results.items():
+        if name not in baseline:
+            continue
+        for statistic, allowed in [("median", tolerance), ("p95", tail_tolerance)]:
+            key = f"{statistic}_{unit}"
+            if key not in baseline[name]:
+                continue
+            before = baseline[name][key]
+            after = summary[key]
+            if after > before * (1.0 + allowed) and after - before >= min_delta_ms:
+                regressions.append(f"{name} {statistic}: {before:.3f} {unit} -> {after:.3f} {unit} "
+                                   f"(+{(after / before - 1.0) * 100:.0f}%)"
+                                   if before > 0 else f"{name} {statistic}: {before:.3f} {unit} -> {after:.3f} {unit}")
+    return regressions
+
+
+def print_table(title: str, results: dict, baseline: dict = None, unit: str = "ms"):
+    print(title)
+    print(f"  {'name':<24}{'median':>12}{'p95':>12}{'max':>12}{'baseline':>12}")
+    for name, summary in results.items():
+        before = ""
+        if baseline is not None and name in baseline:
+            before = f"{baseline[name][f'median_{unit}']:.3f}"
+        print(f"  {name:<24}{summary[f'median_{unit}']:>12.3f}{summary[f'p95_{unit}']:>12.3f}"
+              f"{summary[f'max_{unit}']:>12.3f}{before:>12}")
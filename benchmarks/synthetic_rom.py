@@ -0,0 +1,324 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from doslib.dos_utils import load_tsv
+from doslib.item import Item, Weapon, Armor
+from doslib.map import MapHeader, Tile, Npc, Chest, Sprite, Shop
+from doslib.rom import Rom
+from doslib.textblock import TextBlock
+from randomizer.placement import Placement
+from stream.outputstream import OutputStream
+
+# The Dawn of Souls cartridge is 128 Mbit. Several of the standard patches write past the first 8 MB, so the
+# synthetic image has to be the full size.
+ROM_SIZE = 16 * 1024 * 1024
+
+# Tables the randomizer reads from fixed offsets.
+VEHICLE_STARTS = 0x65278
+ITEM_TABLES = (0x19f07c, 0x19f33c, 0x19fa58)
+ITEM_TABLE_ENDS = (0x19f33c, 0x19fa57, 0x1a021b)
+SPELL_TEXT_LUT = 0x1A1650
+XP_TABLE = 0x1BE3B4
+CREDITS_LUT = 0x1D871C
+SHOP_LUT = 0x1DFB04
+MAP_LUT = 0x1E4F40
+EVENT_TEXT_LUT = 0x211770
+MAP_EXTRAS = 0x2160D0
+MAP_EXTRAS_END = 0x216770
+CHESTS = 0x217FB4
+EVENT_LUTS = ((0x7050, 0xD3), (0x73A0, 0xef), (0x7788, 0x44), (0x7900, 0x0a))
+
+# Where the synthetic image puts data that is found through a pointer. The randomizer rewrites these blocks in
+# place (and some of them grow), so each one is followed by some slack. Nothing else, including the standard IPS
+# patches, touches 0x300000-0x500000.
+MAP_DATA = 0x300000
+CARAVAN_MAP_DATA = 0x340000
+EVENT_TEXT = 0x350000
+SPELL_TEXT = 0x380000
+SHOP_DATA = 0x390000
+CREDITS_TEXT = 0x3A0000
+EVENT_DATA = 0x400000
+
+# Size of each vanilla event. Every event script the randomizer assembles, but one, fits in this.
+EVENT_SIZE = 0x400
+
+MAP_COUNT = 124
+NPCS_PER_MAP = 16
+CARAVAN_MAP = 0x73
+
+# (white magic map, black magic map) for spell levels 1-8.
+MAGIC_SHOPS = ((0x3F, 0x40), (0x67, 0x68), (0x0C, 0x0E), (0x0D, 0x0F), (0x6E, 0x6F), (0x34, 0x35), (0x14, 0x15),
+               (0x74, 0x75))
+WEAPON_SHOPS = (0x3C, 0x64, 0x09, 0x6C, 0x31, 0x49)
+ARMOR_SHOPS = (0x3D, 0x65, 0x0A, 0x6D, 0x32, 0x49)
+ITEM_SHOPS = (0x3E, 0x66, 0x0B, 0x33, 0x13, 0x4A)
+SHOP_COUNT = 51
+
+# Events that map_updates() looks for.
+MYSTIC_KEY_DOOR_EVENT = 0x23cd
+CROWN_TILE_EVENT = 0x23d0
+BAT_EVENT = 0x200c
+CHEST_EVENT = 0x1388
+
+
+def build_synthetic_rom() -> bytearray:
+    """Builds a ROM image that the randomizer can run on.
+
+    None of the data is from the game, but every table the randomizer reads is where it expects it to be, and is
+    structurally valid: LUTs point at null terminated strings and at events that end, map feature lists end in
+    0xFFFF, shops, key item locations and chests exist where the data files say they are, and so on.
+
+    :return: The image.
+    """
+    data = bytearray(ROM_SIZE)
+
+    _build_vehicles(data)
+    _build_items(data)
+    _build_text(data, SPELL_TEXT_LUT, SPELL_TEXT, 130, "Spell")
+    _build_xp(data)
+    _build_credits(data)
+    shops_by_map = _build_shops(data)
+    _build_maps(data, shops_by_map)
+    _build_text(data, EVENT_TEXT_LUT, EVENT_TEXT, 1280, "Text")
+    _build_map_extras(data)
+    _build_chests(data)
+    _build_events(data)
+
+    return data
+
+
+def _put(data: bytearray, offset: int, stream: OutputStream):
+    buffer = stream.get_buffer()
+    data[offset:offset + len(buffer)] = buffer
+
+
+def _build_vehicles(data: bytearray):
+    starts = OutputStream()
+    for position in (2328, 2600, 2328, 2456):
+        starts.put_u32(position)
+    _put(data, VEHICLE_STARTS, starts)
+
+
+def _build_items(data: bytearray):
+    for offset, end, item_type in zip(ITEM_TABLES, ITEM_TABLE_ENDS, (Item, Weapon, Armor)):
+        stream = OutputStream()
+        index = 0
+        while stream.size() < end - offset:
+            item = item_type()
+            item.sort_order = index
+            if item_type is not Item:
+                # Let every class equip everything, so the starting gear always has something to pick from.
+                item.equip_classes = 0xfff
+            item.write(stream)
+            index += 1
+        _put(data, offset, stream)
+
+
+def _build_text(data: bytearray, lut_offset: int, text_offset: int, count: int, prefix: str):
+    lut = OutputStream()
+    strings = OutputStream()
+    for index in range(count):
+        lut.put_u32(Rom.offset_to_pointer(text_offset + strings.size()))
+        strings.put_bytes(TextBlock.encode_text(f"{prefix} {index}\x00"))
+    _put(data, lut_offset, lut)
+    _put(data, text_offset, strings)
+
+
+def _build_xp(data: bytearray):
+    xp = OutputStream()
+    for level in range(99):
+        xp.put_u32(level * level * 40)
+    _put(data, XP_TABLE, xp)
+
+
+def _build_credits(data: bytearray):
+    _build_text(data, CREDITS_LUT, CREDITS_TEXT, 128, "Credits")
+
+
+def _build_shops(data: bytearray) -> dict:
+    # Shops that aren't in any map are left empty.
+    inventories = [OutputStream() for _ in range(SHOP_COUNT)]
+    lengths = [0] * SHOP_COUNT
+    shops_by_map = {}
+
+    def add_shop(map_id: int, marker: int, ids: list):
+        shop_id = sum(len(shops) for shops in shops_by_map.values())
+        if marker is not None:
+            inventories[shop_id].put_u8(marker)
+        for item_id in ids:
+            inventories[shop_id].put_u8(item_id)
+        lengths[shop_id] = len(ids)
+        shops_by_map.setdefault(map_id, []).append(shop_id)
+
+    for level, (white_map, black_map) in enumerate(MAGIC_SHOPS):
+        add_shop(white_map, None, [level * 4 + slot + 1 for slot in range(4)])
+        add_shop(black_map, None, [32 + level * 4 + slot + 1 for slot in range(4)])
+    for index, map_id in enumerate(WEAPON_SHOPS):
+        add_shop(map_id, 0xfd, [index * 3 + slot + 1 for slot in range(3)])
+    for index, map_id in enumerate(ARMOR_SHOPS):
+        add_shop(map_id, 0xfc, [index * 3 + slot + 1 for slot in range(3)])
+    for index, map_id in enumerate(ITEM_SHOPS):
+        add_shop(map_id, 0xfe, [0x1, 0x2, 0xb + index % 2])
+
+    lut = OutputStream()
+    shop_data = OutputStream()
+    for inventory, length in zip(inventories, lengths):
+        lut.put_u8(length & 0x0f)
+        for unused in range(3):
+            lut.put_u8(0)
+        lut.put_u32(Rom.offset_to_pointer(SHOP_DATA + shop_data.size()))
+        shop_data.put_bytes(inventory.get_buffer())
+    _put(data, SHOP_LUT, lut)
+    _put(data, SHOP_DATA, shop_data)
+    return shops_by_map
+
+
+def _chests_by_map() -> dict:
+    map_ids = {}
+    for map_index, name, area in load_tsv("data/MapToArea.tsv"):
+        map_ids[name] = map_index
+
+    chests = {}
+    for chest in load_tsv("data/ChestData.tsv"):
+        map_id = map_ids.get(chest[4])
+        if map_id is not None:
+            chests.setdefault(map_id, []).append(chest[0])
+    return chests
+
+
+def _build_maps(data: bytearray, shops_by_map: dict):
+    chests_by_map = _chests_by_map()
+
+    # Key items given out by chests need a sprite on top of the chest.
+    key_item_chests = {}
+    for placement in Placement().all_placements():
+        if placement.type == "chest" and placement.map_id is not None:
+            key_item_chests[placement.map_id] = placement.index
+
+    lut = OutputStream()
+    map_data = OutputStream()
+    caravan_data = OutputStream()
+    for map_id in range(MAP_COUNT):
+        stream = map_data if map_id < CARAVAN_MAP else caravan_data
+        base = MAP_DATA if map_id < CARAVAN_MAP else CARAVAN_MAP_DATA
+        lut.put_u32(Rom.offset_to_pointer(base + stream.size()))
+
+        header = MapHeader()
+        header.high_x = 0x40
+        header.high_y = 0x40
+        header.write(stream)
+
+        for index in range(2):
+            tile = Tile()
+            tile.identifier = 0x1
+            tile.event = CROWN_TILE_EVENT if map_id == 0x4d else 0x0
+            tile.x_pos = 2 + index
+            tile.y_pos = 20
+            tile.write(stream)
+
+        for index in range(NPCS_PER_MAP):
+            npc = Npc()
+            npc.identifier = 0x2
+            npc.event = BAT_EVENT if map_id in [0x2, 0x4] and index % 2 == 1 else 0x1F40 + index
+            npc.x_pos = 2 + index
+            npc.y_pos = 10
+            npc.sprite_id = index
+            npc.move_speed = 1
+            npc.in_room = 0x1
+            npc.write(stream)
+
+        chest_ids = chests_by_map.get(map_id, [])
+        if map_id in key_item_chests:
+            while len(chest_ids) <= key_item_chests[map_id]:
+                chest_ids = chest_ids + [chest_ids[-1] if len(chest_ids) > 0 else 0]
+
+        sprites = []
+        for index, chest_id in enumerate(chest_ids):
+            chest = Chest()
+            chest.identifier = 0x3
+            chest.chest_id = chest_id
+            chest.x_pos = 2 + index
+            chest.y_pos = 2
+            chest.write(stream)
+
+            if key_item_chests.get(map_id) == index:
+                sprites.append(_sprite(CHEST_EVENT, chest.x_pos, chest.y_pos))
+
+        if map_id in [0x06, 0x38]:
+            sprites.append(_sprite(MYSTIC_KEY_DOOR_EVENT, 4, 30))
+        for sprite in sprites:
+            sprite.write(stream)
+
+        for index, shop_id in enumerate(shops_by_map.get(map_id, [])):
+            shop = Shop()
+            shop.identifier = 0x5
+            shop.event = shop_id
+            shop.x_pos = 2 + index
+            shop.y_pos = 5
+            shop.write(stream)
+
+        stream.put_u16(0xffff)
+
+    _put(data, MAP_LUT, lut)
+    _put(data, MAP_DATA, map_data)
+    _put(data, CARAVAN_MAP_DATA, caravan_data)
+
+
+def _sprite(event: int, x_pos: int, y_pos: int) -> Sprite:
+    sprite = Sprite()
+    sprite.identifier = 0x4
+    sprite.event = event
+    sprite.x_pos = x_pos
+    sprite.y_pos = y_pos
+    return sprite
+
+
+def _build_map_extras(data: bytearray):
+    extras = OutputStream()
+    exit_data_ptr = 0x8216800
+    while extras.size() < MAP_EXTRAS_END - MAP_EXTRAS:
+        extras.put_u32(exit_data_ptr)
+        extras.put_u16(0x1)
+        extras.put_u16(0x0)
+        exit_data_ptr += 20
+    _put(data, MAP_EXTRAS, extras)
+
+
+def _build_chests(data: bytearray):
+    type_ids = {"item": 1, "weapon": 2, "armor": 3, "key_item": 0}
+
+    chests = OutputStream()
+    for chest_index, chest_type, contents, description, map_name, grade, notes in load_tsv("data/ChestData.tsv"):
+        if chest_type == "gil":
+            chests.put_u32(contents & 0x7fffffff)
+        else:
+            chests.put_u32(0x80000000 | ((contents & 0xffff) << 8) | type_ids[chest_type])
+    _put(data, CHESTS, chests)
+
+
+def _build_events(data: bytearray):
+    # Each event is a run of 4 byte commands (command, length, 2 bytes of data) and ends with command 0x0.
+    event = OutputStream()
+    while event.size() < EVENT_SIZE - 4:
+        event.put_bytes(bytearray([0x01, 0x04, 0x00, 0x00]))
+    event.put_bytes(bytearray([0x00, 0x04, 0xff, 0xff]))
+
+    next_event = EVENT_DATA
+    for lut_offset, count in EVENT_LUTS:
+        lut = OutputStream()
+        for index in range(count):
+            lut.put_u32(Rom.offset_to_pointer(next_event))
+            _put(data, next_event, event)
+            next_event += EVENT_SIZE
+        _put(data, lut_offset, lut)
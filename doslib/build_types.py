@@ -86,6 +86,8 @@ def main(argv):
                 new_init_text = ""
                 # Finally, text for write block.
                 write_text = ""
+                # Every field, in order, for __slots__.
+                field_names = []
 
                 for field_text in current_class:
                     field_data = field_text.split(",")
@@ -97,6 +99,7 @@ def main(argv):
                         field_name = field_size
                         field_size = field_data[2].lstrip().rstrip()
                         is_synth = True
+                    field_names.append(field_name)
 
                     if field_size.find("[") > 0:
                         real_size = field_size[0:field_size.find("[")]
@@ -142,15 +145,28 @@ def main(argv):
                         #     else:
                         #         write_text += f"        self.{field_name}.write(stream)\n"
 
+                slots_text = ", ".join(f'"{field_name}"' for field_name in field_names)
+                if len(field_names) == 1:
+                    slots_text += ","
+
                 # Build the full class as a string
                 class_lines = [
                     f"class {a_class}(object):\n",
+                    f"    __slots__ = ({slots_text})\n\n",
                     f"    def __init__(self, stream: InputStream = None):\n"
                     f"        if stream is None:\n"
                     f"{new_init_text}\n"
                     f"        else:\n"
                     f"{init_text}\n",
-                    f"    def write(self, stream: OutputStream):\n{write_text}\n\n"
+                    f"    def write(self, stream: OutputStream):\n{write_text}\n",
+                    f"    def replace(self, **changes):\n"
+                    f"        # Fields that aren't changed (including lists) are shared with the original.\n"
+                    f"        copy = {a_class}.__new__({a_class})\n"
+                    f"        for field in {a_class}.__slots__:\n"
+                    f"            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))\n"
+                    f"        if len(changes) > 0:\n"
+                    f"            raise RuntimeError(f\"{a_class} has no field(s) {{list(changes.keys())}}\")\n"
+                    f"        return copy\n\n\n"
                 ]
                 module_file.writelines(class_lines)
 
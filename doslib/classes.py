@@ -14,13 +14,15 @@
 #
 #  DO NOT EDIT THIS FILE DIRECTLY. Update "datatype.def" and rerun "build_types.py"
 #
-#  Generated on 2020-12-26 11:27
+#  Generated on 2026-10-19 05:03
 
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
 
 class JobClass(object):
+    __slots__ = ("base_hp", "base_mp", "starting_spell_level", "base_strength", "base_agility", "base_intellect", "base_stamina", "base_luck", "base_accuracy", "base_evade", "base_mdef", "weapon_id", "armor_id", "unused")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.base_hp = 0
@@ -70,4 +72,13 @@ class JobClass(object):
         stream.put_u8(self.armor_id)
         stream.put_u8(self.unused)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = JobClass.__new__(JobClass)
+        for field in JobClass.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"JobClass has no field(s) {list(changes.keys())}")
+        return copy
+
 
@@ -14,6 +14,9 @@
 import sys
 from pathlib import Path
 
+# The data files (data/, scripts/, patches/, asp/) live alongside the packages.
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+
 
 def decode_permission_string(perms: str) -> int:
     char_bits = "fKtNmMrRwWbB"
@@ -33,14 +36,16 @@ def resolve_path(path):
 
     Mainly used because of how PyInstaller works. This
     fixes the paths so it works inside the bundles it
-    makes.
+    makes. Otherwise, paths are relative to the root of
+    the repository rather than the working directory,
+    which is shared by every thread in the process.
 
     :param path Path to the file to resolve
     :return The fully resolved path
     """
     if hasattr(sys, "_MEIPASS"):
         return str(Path(sys._MEIPASS).joinpath(path))
-    return path
+    return str(REPOSITORY_ROOT.joinpath(path))
 
 
 def load_tsv(data_file_path: str) -> list:
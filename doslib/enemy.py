@@ -14,13 +14,15 @@
 #
 #  DO NOT EDIT THIS FILE DIRECTLY. Update "datatype.def" and rerun "build_types.py"
 #
-#  Generated on 2020-12-26 11:27
+#  Generated on 2026-10-19 05:07
 
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
 
 class EnemyStats(object):
+    __slots__ = ("exp_reward", "gil_reward", "max_hp", "morale", "unused_ai", "evasion", "pdef", "hit_count", "acc", "atk", "agi", "intel", "crit_rate", "status_atk_elem", "status_atk_ailment", "family", "mdef", "unused", "elem_weakness", "elem_resists", "drop_type", "drop_id", "drop_chance", "padding", "name")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.exp_reward = 0
@@ -47,6 +49,7 @@ class EnemyStats(object):
             self.drop_id = 0
             self.drop_chance = 0
             self.padding = []
+            self.name = ""
 
         else:
             self.exp_reward = stream.get_u16()
@@ -75,6 +78,7 @@ class EnemyStats(object):
             self.padding = []
             for index in range(3):
                 self.padding.append(stream.get_u8())
+            self.name = ""
 
     def write(self, stream: OutputStream):
         stream.put_u16(self.exp_reward)
@@ -103,8 +107,19 @@ class EnemyStats(object):
         for data in self.padding:
             stream.put_u8(data)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = EnemyStats.__new__(EnemyStats)
+        for field in EnemyStats.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"EnemyStats has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class EnemyName(object):
+    __slots__ = ("namePtr",)
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.namePtr = 0
@@ -115,8 +130,19 @@ class EnemyName(object):
     def write(self, stream: OutputStream):
         stream.put_u32(self.namePtr)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = EnemyName.__new__(EnemyName)
+        for field in EnemyName.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"EnemyName has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class EnemyGraphics(object):
+    __slots__ = ("tileData", "palette", "tileArrangement")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.tileData = 0
@@ -133,8 +159,19 @@ class EnemyGraphics(object):
         stream.put_u32(self.palette)
         stream.put_u32(self.tileArrangement)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = EnemyGraphics.__new__(EnemyGraphics)
+        for field in EnemyGraphics.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"EnemyGraphics has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class EnemyScript(object):
+    __slots__ = ("spell_chance", "ability_chance", "spells", "spell_null", "abilities", "ability_null")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.spell_chance = 0
@@ -166,8 +203,19 @@ class EnemyScript(object):
             stream.put_u8(data)
         stream.put_u8(self.ability_null)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = EnemyScript.__new__(EnemyScript)
+        for field in EnemyScript.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"EnemyScript has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Encounter(object):
+    __slots__ = ("config", "unrunnable", "surprise_chance", "groups")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.config = 0
@@ -190,8 +238,19 @@ class Encounter(object):
         for data in self.groups:
             data.write(stream)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Encounter.__new__(Encounter)
+        for field in Encounter.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Encounter has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class EncounterGroup(object):
+    __slots__ = ("enemy_id", "min_count", "max_count", "unused")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.enemy_id = 0
@@ -211,4 +270,13 @@ class EncounterGroup(object):
         stream.put_u8(self.max_count)
         stream.put_u8(self.unused)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = EncounterGroup.__new__(EncounterGroup)
+        for field in EncounterGroup.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"EncounterGroup has no field(s) {list(changes.keys())}")
+        return copy
+
 
@@ -14,13 +14,15 @@
 #
 #  DO NOT EDIT THIS FILE DIRECTLY. Update "datatype.def" and rerun "build_types.py"
 #
-#  Generated on 2020-12-26 11:27
+#  Generated on 2026-10-19 05:03
 
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
 
 class Item(object):
+    __slots__ = ("sort_order", "field_effect", "targeting", "usage", "graphic", "power", "cost", "sale_price", "id", "item_type", "name", "is_soc", "grade")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.sort_order = 0
@@ -62,8 +64,19 @@ class Item(object):
         stream.put_u32(self.cost)
         stream.put_u32(self.sale_price)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Item.__new__(Item)
+        for field in Item.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Item has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Weapon(object):
+    __slots__ = ("sort_order", "equip_classes", "atk", "acc", "evade", "spell", "elements", "family_effect", "str_mod", "sta_mod", "agi_mod", "int_mod", "crit_rate", "hp_boost", "mp_boost", "unused", "cost", "sale_price", "id", "item_type", "name", "is_soc", "grade")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.sort_order = 0
@@ -135,8 +148,19 @@ class Weapon(object):
         stream.put_u32(self.cost)
         stream.put_u32(self.sale_price)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Weapon.__new__(Weapon)
+        for field in Weapon.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Weapon has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Armor(object):
+    __slots__ = ("sort_order", "equip_classes", "defence", "weight", "evade", "spell", "elemental_resists", "str_mod", "sta_mod", "agi_mod", "int_mod", "hp_boost", "mp_boost", "unused", "cost", "sale_price", "id", "item_type", "name", "is_soc", "grade")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.sort_order = 0
@@ -202,4 +226,13 @@ class Armor(object):
         stream.put_u32(self.cost)
         stream.put_u32(self.sale_price)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Armor.__new__(Armor)
+        for field in Armor.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Armor has no field(s) {list(changes.keys())}")
+        return copy
+
 
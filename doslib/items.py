@@ -12,7 +12,6 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import copy
 from collections import namedtuple
 from doslib.dos_utils import load_tsv
 from doslib.item import Item, Weapon, Armor
@@ -60,13 +59,17 @@ class Items(object):
             item_list[extra.item_index].cost = extra.cost
             item_list[extra.item_index].sale_price = extra.sale_price
 
+        # Once loaded, the items are shared (not copied) by everything that uses them, so don't allow the lists to
+        # change. Use downgrade_item() (or Item.replace()) to derive a changed item.
+        self.by_type = tuple(tuple(item_list) for item_list in self.by_type)
+
     def all(self):
         all_items = {}
         for type_index in range(1, 4):
             all_items[Items.index_to_name(type_index)] = self.by_type[type_index]
         return all_items
 
-    def get_by_type(self, type_name: str) -> list:
+    def get_by_type(self, type_name: str) -> tuple:
         return self.by_type[Items.name_to_index(type_name)]
 
     def find_by_type(self, type_name: str, item_name: str) -> Item:
@@ -94,9 +97,7 @@ class Items(object):
 
     @staticmethod
     def downgrade_item(item: Item):
-        downgrade = copy.deepcopy(item)
-        downgrade.grade = chr(ord(item.grade[0]) + 1)
-        return downgrade
+        return item.replace(grade=chr(ord(item.grade[0]) + 1))
 
     @staticmethod
     def name_to_index(name: str) -> int:
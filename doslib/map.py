@@ -14,13 +14,15 @@
 #
 #  DO NOT EDIT THIS FILE DIRECTLY. Update "datatype.def" and rerun "build_types.py"
 #
-#  Generated on 2020-12-26 11:27
+#  Generated on 2026-10-19 05:03
 
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
 
 class Npc(object):
+    __slots__ = ("identifier", "event", "x_pos", "y_pos", "sprite_id", "move_speed", "facing", "in_room")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -52,8 +54,19 @@ class Npc(object):
         stream.put_u16(self.facing)
         stream.put_u16(self.in_room)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Npc.__new__(Npc)
+        for field in Npc.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Npc has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Chest(object):
+    __slots__ = ("identifier", "chest_id", "x_pos", "y_pos")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -73,8 +86,19 @@ class Chest(object):
         stream.put_u16(self.x_pos)
         stream.put_u16(self.y_pos)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Chest.__new__(Chest)
+        for field in Chest.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Chest has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Tile(object):
+    __slots__ = ("identifier", "event", "x_pos", "y_pos")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -94,8 +118,19 @@ class Tile(object):
         stream.put_u16(self.x_pos)
         stream.put_u16(self.y_pos)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Tile.__new__(Tile)
+        for field in Tile.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Tile has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Shop(object):
+    __slots__ = ("identifier", "event", "x_pos", "y_pos")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -115,8 +150,19 @@ class Shop(object):
         stream.put_u16(self.x_pos)
         stream.put_u16(self.y_pos)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Shop.__new__(Shop)
+        for field in Shop.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Shop has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class Sprite(object):
+    __slots__ = ("identifier", "event", "x_pos", "y_pos")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -136,8 +182,19 @@ class Sprite(object):
         stream.put_u16(self.x_pos)
         stream.put_u16(self.y_pos)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = Sprite.__new__(Sprite)
+        for field in Sprite.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"Sprite has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class MapHeader(object):
+    __slots__ = ("identifier", "low_x", "low_y", "high_x", "high_y")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.identifier = 0
@@ -160,8 +217,19 @@ class MapHeader(object):
         stream.put_u16(self.high_x)
         stream.put_u16(self.high_y)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = MapHeader.__new__(MapHeader)
+        for field in MapHeader.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"MapHeader has no field(s) {list(changes.keys())}")
+        return copy
+
 
 class MainData(object):
+    __slots__ = ("compressed_map", "tileset_id", "map_type", "map_name_pause", "map_name_title", "map_name", "door_data_ptr", "door_count")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.compressed_map = 0
@@ -193,4 +261,13 @@ class MainData(object):
         stream.put_u32(self.door_data_ptr)
         stream.put_u32(self.door_count)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = MainData.__new__(MainData)
+        for field in MainData.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"MainData has no field(s) {list(changes.keys())}")
+        return copy
+
 
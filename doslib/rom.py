@@ -18,12 +18,20 @@ from collections import namedtuple
 from stream.inputstream import InputStream
 
 
+# Unused space in the ROM that moved or expanded data can be put in.
+FREE_SPACE_ADDRESS = 0x8223F4C
+FREE_SPACE_SIZE = 0x1860
+
+
 class Rom(object):
-    """Class that represents a Dawn of Souls ROM."""
+    """Class that represents a Dawn of Souls ROM.
+
+    A Rom is shared by everything that reads it (possibly on several threads), so it holds no state besides the data.
+    Allocations of free space are tracked by a FreeBlock owned by whoever is doing them.
+    """
 
     def __init__(self, data: bytearray = None):
         self.rom_data = data
-        self._free_block = FreeBlock(0x8223F4C, 0x1860)
 
     def open_bytestream(self, offset: int, size: int = -1, check_alignment: bool = True) -> InputStream:
         """
@@ -142,9 +150,6 @@ class Rom(object):
 
         return end_offset - offset
 
-    def get_free_space(self, owner: str, size: int) -> int:
-        return self._free_block.allocate(owner, size)
-
     @staticmethod
     def pointer_to_offset(pointer: int) -> int:
         """
@@ -176,7 +181,7 @@ FreeBlockOwner = namedtuple("FreeBlockOwner", ["name", "address", "size"])
 
 
 class FreeBlock(object):
-    def __init__(self, base_addr: int, size: int):
+    def __init__(self, base_addr: int = FREE_SPACE_ADDRESS, size: int = FREE_SPACE_SIZE):
         self._base_addr = base_addr
         self._total_size = size
         self._current_ptr = self._base_addr
@@ -189,10 +194,9 @@ class FreeBlock(object):
             self._owners.append(owner)
             return owner.address
         else:
-            print(f"No free space for alloc: {owner} needs {size} bytes; {self._remaining()} free")
-            for allocated in self._owners:
-                print(f"Allocated block: {allocated}")
-            raise RuntimeError("No free space!")
+            allocated = "\n".join(f"Allocated block: {allocated}" for allocated in self._owners)
+            raise RuntimeError(f"No free space for alloc: {owner} needs {size} bytes; {self._remaining()} free\n"
+                               f"{allocated}")
 
     def _remaining(self):
         return self._total_size - (self._current_ptr - self._base_addr)
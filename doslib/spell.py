@@ -14,13 +14,15 @@
 #
 #  DO NOT EDIT THIS FILE DIRECTLY. Update "datatype.def" and rerun "build_types.py"
 #
-#  Generated on 2020-12-26 11:27
+#  Generated on 2026-10-19 05:03
 
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
 
 class SpellData(object):
+    __slots__ = ("usage", "target", "power", "elements", "type", "graphic_index", "accuracy", "level", "mp_cost", "price", "spell_index", "name", "school", "grade")
+
     def __init__(self, stream: InputStream = None):
         if stream is None:
             self.usage = 0
@@ -66,4 +68,13 @@ class SpellData(object):
         stream.put_u16(self.mp_cost)
         stream.put_u32(self.price)
 
+    def replace(self, **changes):
+        # Fields that aren't changed (including lists) are shared with the original.
+        copy = SpellData.__new__(SpellData)
+        for field in SpellData.__slots__:
+            setattr(copy, field, changes.pop(field) if field in changes else getattr(self, field))
+        if len(changes) > 0:
+            raise RuntimeError(f"SpellData has no field(s) {list(changes.keys())}")
+        return copy
+
 
@@ -0,0 +1,53 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from doslib.item import Item
+from doslib.items import Items
+from doslib.spell import SpellData
+
+
+class TestItem(unittest.TestCase):
+
+    def test_replace(self):
+        item = Item()
+        item.id = 0x12
+        item.grade = "C"
+
+        changed = item.replace(cost=500)
+        self.assertIsNot(item, changed)
+        self.assertEqual(changed.cost, 500)
+        self.assertEqual(changed.id, 0x12)
+        self.assertEqual(item.cost, 0)
+
+    def test_replace_unknown_field(self):
+        with self.assertRaises(RuntimeError):
+            SpellData().replace(not_a_field=1)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            Item().not_a_field = 1
+
+    def test_downgrade_item(self):
+        item = Item()
+        item.grade = "C"
+
+        downgrade = Items.downgrade_item(item)
+        self.assertEqual(downgrade.grade, "D")
+        self.assertEqual(item.grade, "C")
+
+
+if __name__ == '__main__':
+    unittest.main()
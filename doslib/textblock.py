@@ -12,10 +12,14 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import logging
+
 from doslib.rom import Rom
 from stream.inputstream import InputStream
 from stream.outputstream import OutputStream
 
+logger = logging.getLogger(__name__)
+
 
 class TextBlock(object):
     def __init__(self, rom: Rom, lut_offset: int, count: int):
@@ -79,7 +83,7 @@ class TextBlock(object):
             elif char_code in TextBlock.TEXT_TABLE:
                 char_code = char_code
             else:
-                print(f"Unknown code encountered in string: {hex(char_code)}")
+                logger.debug("Unknown code encountered in string: %#x", char_code)
 
             to_append = TextBlock.TEXT_TABLE[char_code] if char_code in TextBlock.TEXT_TABLE else None
             if not symbolic_names:
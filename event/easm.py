@@ -12,10 +12,14 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from event.parseinputstring import ParseInputString
+import logging
+import re
+
 from event.tokens import *
 from stream.outputstream import OutputStream
 
+logger = logging.getLogger(__name__)
+
 
 class ICode(object):
     def __init__(self, bytecode: list, symbols: dict, size: int):
@@ -24,6 +28,7 @@ class ICode(object):
         self.size = size
 
 
+# The grammar (and the token instances in it) is shared by every parse, on every thread, so it must never be modified.
 GRAMMAR = {
     # Here we define mappings of strings to terminal tokens.
     # If a string is not defined here, it will likely cause a SyntaxError exception.
@@ -116,6 +121,24 @@ GRAMMAR = {
 }
 
 
+# Splits a line into tokens in one pass. The group that matched is the kind of token, and whitespace before a token
+# (or at the end of the line, which nothing matches) is skipped.
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+    (?P<keyword>[^\W\d_]\w*)
+    # A number swallows the character after it, whatever it is.
+    | (?P<number>\d(?:[xX][0-9a-fA-F]*|\d*)).?
+    | \.(?P<label>[^\W\d_]\w*)
+    | %(?P<symbol>[^\W\d_]\w*)
+    | (?P<illegal_name>[.%])
+    | (?P<colon>:)
+    | (?P<comment>;.*)
+    | (?P<reserved>\$)
+    | (?P<other>\S)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+
 class DuplicateSymbolError(RuntimeError):
     def __init__(self, name, line, line_number):
         super().__init__(f"Duplicate symbol defined: '{name}' on line {line_number}: {line}")
@@ -149,8 +172,15 @@ def def_symbol(parameters: list, symbol_table: dict):
     return None
 
 
-def parse(source: str) -> ICode:
-    symbol_table = {}
+def parse(source: str, symbols: dict = None) -> ICode:
+    """Parses a preprocessed event script into intermediate code.
+
+    :param source: The preprocessed source.
+    :param symbols: Symbols defined before the source (such as the ones of a header that was parsed on its own). The
+                    symbols the source defines are added to it.
+    :return: The intermediate code.
+    """
+    symbol_table = symbols if symbols is not None else {}
     icode = []
     current_addr = 0
 
@@ -318,7 +348,7 @@ class TokenStream(object):
 
         if token is not None:
             if type(token) not in allowed_types:
-                print(f"{type(token)} was not in {allowed_types}")
+                logger.debug("%s was not in %s", type(token), allowed_types)
                 raise ParserSyntaxError(token, self._input_line, self._line_number)
 
         return token
@@ -329,51 +359,34 @@ class TokenStream(object):
     @staticmethod
     def _tokenize(line: str) -> list:
         tokens = []
-
-        current = ParseInputString(line)
-        char = current.getc()
-        while char is not None:
-            if char.isspace():
-                # Ignore whitespace...
-                pass
-            elif char.isalpha():
-                current.ungetc()
-                keyword = current.get_alphanum_str(['_'])
-                if keyword not in GRAMMAR:
-                    raise RuntimeError(f"Unknown keyword: {keyword}")
-                token = GRAMMAR[keyword]
-                tokens.append(token)
-            elif char.isdigit():
-                # Numbers are all ints and just parsed by the stream - makes this easier
-                current.ungetc()
-                tokens.append(NumberToken(current.get_int()))
-            elif char == '.':
-                if current.peek().isalpha():
-                    if len(tokens) == 0:
-                        tokens.append(GRAMMAR["$$def_label"])
-                    tokens.append(LabelToken(current.get_alphanum_str(['_'])))
-                else:
-                    raise RuntimeError(f"Illegal label definition, starts with: {current.peek()}")
-            elif char == '%':
-                if current.peek().isalpha():
-                    if len(tokens) == 0:
-                        tokens.append(GRAMMAR["$$def_symbol"])
-                    tokens.append(SymbolToken(current.get_alphanum_str(['_'])))
-                else:
-                    raise RuntimeError(f"Illegal label definition, starts with: {current.peek()}")
-            elif char == ':':
+        for match in TOKEN_PATTERN.finditer(line):
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "keyword":
+                if text not in GRAMMAR:
+                    raise RuntimeError(f"Unknown keyword: {text}")
+                tokens.append(GRAMMAR[text])
+            elif kind == "number":
+                tokens.append(NumberToken(int(text, 16) if len(text) > 1 and text[1] in "xX" else int(text)))
+            elif kind == "label":
+                if len(tokens) == 0:
+                    tokens.append(GRAMMAR["$$def_label"])
+                tokens.append(LabelToken(text))
+            elif kind == "symbol":
+                if len(tokens) == 0:
+                    tokens.append(GRAMMAR["$$def_symbol"])
+                tokens.append(SymbolToken(text))
+            elif kind == "colon":
                 tokens.append(ColonToken(":"))
-            elif char == ";":
-                comment = ";"
-                while current.peek() is not None:
-                    comment += current.getc()
-                tokens.append(CommentToken(comment))
-            elif char == "$":
+            elif kind == "comment":
+                tokens.append(CommentToken(text))
+            elif kind == "illegal_name":
+                following = line[match.end()] if match.end() < len(line) else None
+                raise RuntimeError(f"Illegal label definition, starts with: {following}")
+            elif kind == "reserved":
                 raise RuntimeError(f"'$' characters are reserved for the assembler and may not be used.")
             else:
                 # Symbols are single characters
-                tokens.append(char)
-
-            char = current.getc()
+                tokens.append(text)
 
         return tokens
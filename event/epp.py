@@ -60,7 +60,6 @@ def do_parse(source: PreProcessCode, symbol_table: dict, start_line: int = None,
                 working.extend(nested)
             elif tokens[0] == "#ifndef":
                 process_output = tokens[1] not in symbol_table
-                print(f"{tokens[1]} -> {process_output}")
                 nested = do_parse(source, symbol_table, source.get_line_no(), process_output)
                 working.extend(nested)
             elif tokens[0] == "#else":
@@ -0,0 +1,352 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+
+from doslib.dos_utils import resolve_path
+from event.easm import ICode, parse
+from event.epp import PreProcessCode, do_parse
+from event.tokens import LabelToken, NumberToken, SlotByteToken, SlotToken
+
+logger = logging.getLogger(__name__)
+
+# Files whose changes can change the compiled scripts, so they're part of every key.
+ASSEMBLER_FILES = ("event/easm.py", "event/epp.py", "event/tokens.py", "event/icodecache.py")
+
+# Stands in for a header macro while a script is compiled, so its uses can be found in the preprocessed script.
+SLOT_MARKER = "@slot:"
+
+# A compiled script. `static` has the values of the header macros that were compiled into it, and `segments` is a
+# list of _Code, with the names of the macros that are filled in between them.
+Template = namedtuple("Template", ["static", "segments"])
+
+# Part of a template. `labels` are the offsets of the labels defined in it, and `slotted` is True if its bytecode
+# has slots in it.
+_Code = namedtuple("_Code", ["bytecode", "size", "labels", "slotted"])
+
+
+class EventHeader(object):
+    """A header, preprocessed and parsed once for every script that's assembled after it."""
+
+    def __init__(self, headers: str):
+        self.macros = {}
+        icode = parse("\n".join(do_parse(PreProcessCode(headers), self.macros)))
+        if len(icode.bytecode) > 0 or any(isinstance(name, LabelToken) for name in icode.symbols):
+            raise RuntimeError("Event headers may only define macros and symbols")
+        self.symbols = icode.symbols
+        self._macro_code = {}
+
+    def macro_code(self, name: str) -> ICode:
+        """Compiles the commands of a macro that fills a slot."""
+        if name not in self._macro_code:
+            icode = parse(self.macros[name], dict(self.symbols))
+            if any(isinstance(symbol, LabelToken) for symbol in icode.symbols):
+                raise RuntimeError(f"Macro {name} defines a label, so it can't be used on a line of its own")
+            self._macro_code[name] = icode
+        return self._macro_code[name]
+
+
+class ICodeCache(object):
+    """Compiles event scripts once, into templates that are filled in for each seed.
+
+    Every script is assembled after the same header, which defines the macros and symbols for the seed's placement.
+    A script is compiled with the header's symbols left as slots in its bytecode. Header macros used on a line of
+    their own (such as the `GIVE_<SOURCE>_REWARD` commands) are left out: the script is split into segments around
+    them. Filling the template in for a seed puts the symbols' values into the slots and the macros' commands between
+    the segments, and moves the labels of each segment by the size of what's before it. Since a template doesn't
+    depend on any of those values, every seed uses the same one.
+
+    Templates are kept in memory and, if a directory is given, on disk, where they're shared by every process. They're
+    only kept on disk if the assembler's sources can be read, since they're keyed by them.
+    """
+
+    def __init__(self, directory: str = None):
+        """
+        :param directory: Optional directory to store templates in.
+        """
+        self._templates = {}
+        self._headers = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._assembler = _assembler_digest()
+        if self._assembler is None and directory is not None:
+            # Templates from another version of the assembler couldn't be told apart, so they can't be stored.
+            logger.warning("The event assembler's sources aren't available; compiled scripts are only cached in "
+                           "memory")
+            directory = None
+        self._directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def compile(self, headers: str, script: str) -> ICode:
+        """Preprocesses and parses a script, as `parse(pparse(f"{headers}\\n\\n{script}"))` would.
+
+        :param headers: The header every script is assembled after.
+        :param script: Source of the script.
+        :return: The intermediate code.
+        """
+        header = self.header(headers)
+        return fill(self.template(header, script), header)
+
+    def header(self, headers: str) -> EventHeader:
+        """Preprocesses and parses a header, unless it's one of the last few."""
+        with self._lock:
+            if headers in self._headers:
+                self._headers.move_to_end(headers)
+                return self._headers[headers]
+
+        header = EventHeader(headers)
+        with self._lock:
+            self._headers[headers] = header
+            # Headers change with every seed; only the ones of seeds being assembled right now are useful.
+            while len(self._headers) > 8:
+                self._headers.popitem(last=False)
+        return header
+
+    def template(self, header: EventHeader, script: str) -> Template:
+        """Gets the template of a script, compiling it if it isn't cached."""
+        names = "\n".join(sorted(header.macros) + sorted(header.symbols))
+        key = hashlib.sha256(f"{self._assembler}\n{names}\n{script}".encode("utf-8")).hexdigest()
+        template = self._load(key)
+        # Macros used inside a line are compiled into the template, so it's only good for the same values.
+        if template is not None and all(header.macros.get(name) == value for name, value in template.static.items()):
+            with self._lock:
+                self.hits += 1
+            return template
+
+        with self._lock:
+            self.misses += 1
+        template = compile_template(header, script)
+        self._store(key, template)
+        return template
+
+    def _load(self, key: str) -> Template:
+        with self._lock:
+            if key in self._templates:
+                return self._templates[key]
+        if self._directory is None:
+            return None
+
+        path = os.path.join(self._directory, f"{key}.json")
+        try:
+            with open(path, "r") as cache_file:
+                template = _decode_template(json.load(cache_file))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unreadable compiled script %s", path)
+            return None
+        with self._lock:
+            return self._templates.setdefault(key, template)
+
+    def _store(self, key: str, template: Template):
+        with self._lock:
+            self._templates[key] = template
+        if self._directory is None:
+            return
+
+        try:
+            encoded = _encode_template(template)
+        except TypeError:
+            # Only numbers, labels and slots can be stored; anything else is only cached in memory.
+            return
+        # Write to a temporary file first so another process never reads a partial file.
+        handle, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w") as cache_file:
+                json.dump(encoded, cache_file)
+            os.replace(temp_path, os.path.join(self._directory, f"{key}.json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def _assembler_digest() -> str:
+    """Hashes the assembler's sources, or returns None if they can't be read (a PyInstaller bundle only has the
+    compiled modules)."""
+    digest = hashlib.sha256()
+    for path in ASSEMBLER_FILES:
+        try:
+            with open(resolve_path(path), "rb") as source_file:
+                digest.update(source_file.read())
+        except FileNotFoundError:
+            return None
+    return digest.hexdigest()
+
+
+def compile_template(header: EventHeader, script: str) -> Template:
+    """Compiles a script into a template.
+
+    :param header: The header the script is assembled after. Only the names of its symbols and macros are compiled
+                   into the template, along with the values of the macros that are used inside a line.
+    :param script: Source of the script.
+    :return: The template.
+    """
+    markers = {name: f"{SLOT_MARKER}{name}" for name in header.macros}
+    names = {marker: name for name, marker in markers.items()}
+    symbols = {name: SlotToken(name) for name in header.symbols}
+
+    static = {}
+    segments = []
+    lines = []
+    for line in "\n".join(do_parse(PreProcessCode(script), dict(markers))).splitlines():
+        tokens = line.split()
+        if len(tokens) == 1 and tokens[0] in names:
+            segments.extend(_compile_code(lines, symbols, len(segments) > 0))
+            segments.append(names[tokens[0]])
+            lines = []
+        elif any(token in names for token in tokens):
+            # Expand the macro the way the preprocessor would have.
+            for token in tokens:
+                if token in names:
+                    static[names[token]] = header.macros[names[token]]
+            lines.append("".join(f"{header.macros[names[token]] if token in names else token} " for token in tokens))
+        else:
+            lines.append(line)
+    segments.extend(_compile_code(lines, symbols, len(segments) > 0))
+    return Template(static, segments)
+
+
+def _compile_code(lines: list, symbols: dict, after_slot: bool) -> list:
+    if len(lines) == 0:
+        return []
+    defined = set(symbols)
+    icode = parse("\n".join(lines), symbols)
+
+    labels = {}
+    for name, value in icode.symbols.items():
+        if name in defined:
+            continue
+        if isinstance(name, LabelToken):
+            labels[name] = value
+        elif after_slot and type(value) is int:
+            # Set to an address with ':', which is an offset into this segment rather than the script.
+            raise RuntimeError(f"Symbol {name} is set to an address after a macro slot")
+    slotted = any(isinstance(value, (SlotToken, SlotByteToken)) for code in icode.bytecode for value in code)
+    return [_Code(icode.bytecode, icode.size, labels, slotted)]
+
+
+def fill(template: Template, header: EventHeader) -> ICode:
+    """Fills a template in with the values of a header.
+
+    :param template: The template.
+    :param header: The header of the seed.
+    :return: The intermediate code, with the addresses of the labels as its symbols.
+    """
+    bytecode = []
+    labels = {}
+    addr = 0
+    for segment in template.segments:
+        if isinstance(segment, _Code):
+            for label, offset in segment.labels.items():
+                labels[label] = addr + offset
+            if segment.slotted:
+                bytecode.extend([_fill_value(value, header.symbols) for value in code] for code in segment.bytecode)
+            else:
+                bytecode.extend(segment.bytecode)
+            addr += segment.size
+        else:
+            icode = header.macro_code(segment)
+            bytecode.extend(icode.bytecode)
+            addr += icode.size
+    return ICode(bytecode, labels, addr)
+
+
+def _fill_value(value, symbols: dict):
+    if isinstance(value, SlotToken):
+        return symbols[value]
+    if isinstance(value, SlotByteToken):
+        return (symbols[value.slot] >> value.shift) & 0xff
+    return value
+
+
+def _encode_value(value):
+    if isinstance(value, LabelToken):
+        return {"label": value}
+    if isinstance(value, SlotToken):
+        return {"slot": value}
+    if isinstance(value, SlotByteToken):
+        return {"slot": value.slot, "shift": value.shift}
+    if isinstance(value, NumberToken):
+        return {"number": int(value)}
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise TypeError(f"Can't store {type(value)}")
+
+
+def _decode_value(value):
+    if isinstance(value, int):
+        return value
+    if "label" in value:
+        return LabelToken(value["label"])
+    if "shift" in value:
+        return SlotByteToken(SlotToken(value["slot"]), value["shift"])
+    if "slot" in value:
+        return SlotToken(value["slot"])
+    return NumberToken(value["number"])
+
+
+def _encode_template(template: Template) -> dict:
+    segments = []
+    for segment in template.segments:
+        if isinstance(segment, _Code):
+            segments.append({
+                "bytecode": [[_encode_value(value) for value in code] for code in segment.bytecode],
+                "size": segment.size,
+                "labels": segment.labels
+            })
+        else:
+            segments.append({"macro": segment})
+    return {"static": template.static, "segments": segments}
+
+
+def _decode_template(encoded: dict) -> Template:
+    segments = []
+    for segment in encoded["segments"]:
+        if "macro" in segment:
+            segments.append(segment["macro"])
+            continue
+        bytecode = [[_decode_value(value) for value in code] for code in segment["bytecode"]]
+        labels = {LabelToken(name): offset for name, offset in segment["labels"].items()}
+        slotted = any(isinstance(value, (SlotToken, SlotByteToken)) for code in bytecode for value in code)
+        segments.append(_Code(bytecode, segment["size"], labels, slotted))
+    return Template(encoded["static"], segments)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_icode_cache() -> ICodeCache:
+    """Gets the process's cache of compiled scripts, creating it the first time."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ICodeCache()
+        return _cache
+
+
+def set_icode_cache_dir(directory: str):
+    """Replaces the process's cache with one that also keeps compiled scripts in a directory."""
+    global _cache
+    with _cache_lock:
+        _cache = ICodeCache(directory)
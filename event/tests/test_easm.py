@@ -83,5 +83,38 @@ class TestEasm(unittest.TestCase):
             self.assertNotEqual(bytecode, bytecode)
 
 
+class TestTokenStream(unittest.TestCase):
+
+    def test_command(self):
+        tokens = TokenStream._tokenize("check_flag %reward_flag jz .Done ; Skip it")
+        self.assertEqual([type(token) for token in tokens],
+                         [CheckFlagToken, SymbolToken, JzToken, LabelToken, CommentToken])
+        self.assertEqual(tokens[1], "reward_flag")
+        self.assertEqual(tokens[3], "Done")
+        self.assertEqual(tokens[4], "; Skip it")
+
+    def test_definitions(self):
+        self.assertEqual(TokenStream._tokenize(".Label_1:"), [GRAMMAR["$$def_label"], "Label_1", ":"])
+        self.assertEqual(TokenStream._tokenize("%flag 0x1F"), [GRAMMAR["$$def_symbol"], "flag", 0x1f])
+
+    def test_numbers(self):
+        tokens = TokenStream._tokenize("db 0x13 0xc 15 0XfF")
+        self.assertEqual(tokens[1:], [0x13, 0xc, 15, 0xff])
+        self.assertTrue(all(isinstance(token, NumberToken) for token in tokens[1:]))
+
+    def test_errors(self):
+        for line in ["not_a_command", "set_flag $1", "jump . Done", "%"]:
+            with self.assertRaises(RuntimeError):
+                TokenStream._tokenize(line)
+
+    def test_same_as_scanner(self):
+        from benchmarks.bench_tokenizer import corpus, scan_line
+        for line in corpus():
+            tokens = TokenStream._tokenize(line)
+            expected = scan_line(line)
+            self.assertEqual(tokens, expected, line)
+            self.assertEqual([type(token) for token in tokens], [type(token) for token in expected], line)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,131 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+"""Tests for the icodecache module. """
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from event import icodecache
+from event.easm import link, parse
+from event.epp import pparse
+from event.icodecache import ICodeCache
+
+HEADERS = """
+#define WINDOW_TOP {window}
+#define GIVE_REWARD \\
+{reward}
+%reward_flag {flag}
+%text_id {text}
+"""
+
+SCRIPT = """
+check_flag %reward_flag jz .Done
+load_text WINDOW_TOP %text_id
+GIVE_REWARD
+.Done:
+jump .Done
+end_event
+"""
+
+OTHER_SCRIPT = """
+set_flag 0x4
+end_event
+"""
+
+
+def headers(flag: int, text: int, reward: str = "give_item 0x12", window: int = 0) -> str:
+    return HEADERS.format(flag=hex(flag), text=hex(text), reward=reward, window=hex(window))
+
+
+def compiled(source_headers: str, script: str) -> bytes:
+    return link(parse(pparse(f"{source_headers}\n\n{script}")), 0x8000000)
+
+
+class TestICodeCache(unittest.TestCase):
+
+    def test_same_code_as_parse(self):
+        cache = ICodeCache()
+        for flag, text in [(0x9, 0x100), (0x9, 0x100), (0xa, 0x100), (0x9, 0x200)]:
+            for script in [SCRIPT, OTHER_SCRIPT]:
+                self.assertEqual(link(cache.compile(headers(flag, text), script), 0x8000000),
+                                 compiled(headers(flag, text), script))
+
+    def test_reuses_template(self):
+        cache = ICodeCache()
+        cache.compile(headers(0x9, 0x100), SCRIPT)
+        cache.compile(headers(0xa, 0x1234), SCRIPT)
+        cache.compile(headers(0x9, 0x100, reward="set_flag 0x3\\\ngive_item 0x12"), SCRIPT)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # WINDOW_TOP is used inside a line, so its value is compiled into the template.
+        cache.compile(headers(0x9, 0x100, window=1), SCRIPT)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_fills_slots(self):
+        cache = ICodeCache()
+        for reward in ["give_item 0x12", "set_flag 0x3\\\ngive_item 0x12\\\ngive_item_ex 0x1 0x2", "nop"]:
+            for flag, text in [(0x9, 0x100), (0xfe, 0x1234)]:
+                self.assertEqual(link(cache.compile(headers(flag, text, reward), SCRIPT), 0x8000000),
+                                 compiled(headers(flag, text, reward), SCRIPT))
+        self.assertEqual(cache.misses, 1)
+
+    def test_undefined_symbol(self):
+        cache = ICodeCache()
+        with self.assertRaises(RuntimeError):
+            cache.compile(headers(0x9, 0x100), "set_flag %not_defined\n")
+
+    def test_persists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ICodeCache(directory).compile(headers(0x9, 0x100), SCRIPT)
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith(".json")]), 1)
+
+            cache = ICodeCache(directory)
+            icode = cache.compile(headers(0x9, 0x100), SCRIPT)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            self.assertEqual(link(icode, 0x8000000), compiled(headers(0x9, 0x100), SCRIPT))
+
+    def test_ignores_unreadable_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ICodeCache(directory).compile(headers(0x9, 0x100), SCRIPT)
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), "w") as cache_file:
+                    cache_file.write("{")
+
+            cache = ICodeCache(directory)
+            icode = cache.compile(headers(0x9, 0x100), SCRIPT)
+            self.assertEqual(cache.misses, 1)
+            self.assertEqual(link(icode, 0x8000000), compiled(headers(0x9, 0x100), SCRIPT))
+
+    def test_without_sources(self):
+        # In a PyInstaller bundle, resolve_path() points into sys._MEIPASS, which doesn't have the assembler's sources.
+        with tempfile.TemporaryDirectory() as bundle, tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(sys, "_MEIPASS", bundle, create=True), \
+                mock.patch.object(icodecache, "_cache", None):
+            icode = icodecache.get_icode_cache().compile(headers(0x9, 0x100), SCRIPT)
+            self.assertEqual(link(icode, 0x8000000), compiled(headers(0x9, 0x100), SCRIPT))
+
+            with self.assertLogs(icodecache.logger, "WARNING"):
+                cache = ICodeCache(directory)
+            cache.compile(headers(0x9, 0x100), SCRIPT)
+            cache.compile(headers(0xa, 0x100), SCRIPT)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(os.listdir(directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -171,6 +171,25 @@ class CallToken(list):
     pass
 
 
+class SlotToken(str):
+    """A value that's only known once the compiled script is filled in, such as the symbols of the header. The string
+    is the name of the symbol."""
+
+    def bytes(self, size: int) -> list:
+        return [SlotByteToken(self, shift) for shift in range(0, size * 8, 8)]
+
+
+class SlotByteToken(object):
+    """One byte of a multi-byte slot: the slot's value, shifted right by `shift` bits."""
+
+    def __init__(self, slot: SlotToken, shift: int):
+        self.slot = slot
+        self.shift = shift
+
+    def __repr__(self):
+        return f"SlotByteToken({self.slot}, {self.shift})"
+
+
 class Uint16(object):
     def __init__(self, value: int):
         self._value = value
@@ -179,6 +198,8 @@ class Uint16(object):
         return f"Unit16({hex(self._value)})"
 
     def bytes(self):
+        if isinstance(self._value, SlotToken):
+            return self._value.bytes(2)
         return [self._value & 0xff, (self._value >> 8) & 0xff]
 
 
@@ -190,4 +211,6 @@ class Uint32(object):
         return f"Uint32({hex(self._value)})"
 
     def bytes(self):
+        if isinstance(self._value, SlotToken):
+            return self._value.bytes(4)
         return [self._value & 0xff, (self._value >> 8) & 0xff, (self._value >> 16) & 0xff, (self._value >> 24) & 0xff]
@@ -12,28 +12,85 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-from flask import Flask, make_response, request
+import io
+import os
+import uuid
+
+from flask import Flask, jsonify, make_response, request
 from ips_util import Patch
 
+from event.icodecache import get_icode_cache, set_icode_cache_dir
 from randomizer.flags import Flags
+from randomizer.jobs import Job, JobQueue
+from randomizer.logs import configure_logging, log_context
+from randomizer.pipeline import CancellationToken, StageCache, fingerprint
+from randomizer.placement import PlandoConflict, PlandoError, parse_pairs
+from randomizer.placementpool import LIVE_SOLVE, placement_source
+from randomizer.prefetch import PlacementPrefetcher, random_seed
 from randomizer.randomize import randomize
+from randomizer.resultcache import ResultCache, result_key
+from randomizer.timing import StageTimer
 
 app = Flask(__name__, static_folder="static", static_url_path='')
 
+# Set RANDOMIZER_LOG_FORMAT=json to log JSON lines, tagged with the seed and request id, for the log pipeline.
+configure_logging(json_lines=os.environ.get("RANDOMIZER_LOG_FORMAT") == "json")
+
+# Shared by every request so re-rolling a seed with different flags only re-runs the stages those flags affect.
+stage_cache = StageCache()
+
+# Finished patches, so a seed that's asked for again (race seeds, refreshes, retries) isn't randomized again. Set
+# RANDOMIZER_CACHE_DIR to also keep them on disk, where they're shared by every worker and survive restarts.
+result_cache = ResultCache(os.environ.get("RANDOMIZER_CACHE_DIR"))
+if "RANDOMIZER_CACHE_DIR" in os.environ:
+    # Compiled event scripts are shared the same way, so a new worker doesn't parse every script again.
+    set_icode_cache_dir(os.path.join(os.environ["RANDOMIZER_CACHE_DIR"], "icode"))
+
+# Randomizations started through the job API, which run in the background and report their progress. Set
+# RANDOMIZER_JOB_WORKERS to change how many run at once.
+job_queue = JobQueue(max_workers=int(os.environ.get("RANDOMIZER_JOB_WORKERS", "2")))
+
+# Solves the key item placements of random seeds in the background, so a request for a random seed doesn't wait for
+# the solver. Not needed when placements come from a prebuilt pool. Set RANDOMIZER_PREFETCH_DEPTH=0 to turn it off.
+prefetch_depth = int(os.environ.get("RANDOMIZER_PREFETCH_DEPTH", "16"))
+prefetcher = None
+if prefetch_depth > 0 and placement_source() == LIVE_SOLVE:
+    prefetcher = PlacementPrefetcher(stage_cache, depth=prefetch_depth)
+    prefetcher.start()
+
+# Keep a bad change to the key item programs from tying up a worker: after RANDOMIZER_SOLVE_TIME_LIMIT seconds, the
+# request fails. Nothing is cached, so the seed is solved again the next time it's asked for.
+if placement_source() == LIVE_SOLVE:
+    from randomizer.clingo import SolverLimitReached, SolverLimits, set_solver_limits, solver_totals
+    set_solver_limits(SolverLimits(time_limit=float(os.environ.get("RANDOMIZER_SOLVE_TIME_LIMIT", "10"))))
+
+    @app.errorhandler(SolverLimitReached)
+    def solver_limit_reached(error: SolverLimitReached):
+        return make_response(jsonify({"error": str(error)}), 503)
+else:
+    def solver_totals():
+        return None
+
+ROM_PATH = "ff-dos.gba"
+rom_fingerprints = {}
+
+
+def rom_fingerprint() -> str:
+    """Fingerprints the ROM, only reading it again if it has changed."""
+    status = os.stat(ROM_PATH)
+    version = (status.st_mtime_ns, status.st_size)
+    if version not in rom_fingerprints:
+        with open(ROM_PATH, "rb") as rom_file:
+            rom_fingerprints[version] = fingerprint(rom_file.read())
+    return rom_fingerprints[version]
+
 
 @app.route('/')
 def root():
     return app.send_static_file('index.html')
 
 
-@app.route('/patch', methods=['POST'])
-def create_patch():
-    patch = bytearray()
-    filename = "patch.ips"
-
-    flags_string = request.form['flags']
-    rom_seed = request.form['seed']
-
+def parse_flags(flags_string: str) -> Flags:
     flags = Flags()
     flags.no_shuffle = flags_string.find("Op") != -1
     flags.standard_shops = flags_string.find("Sv") != -1
@@ -42,6 +99,7 @@ def create_patch():
     flags.boss_shuffle = flags_string.find("B") != -1
     flags.new_items = flags_string.find("Ni") != -1
     flags.fiend_ribbons = flags_string.find("R") != -1
+    flags.key_item_solver = "python" if flags_string.find("Py") != -1 else "clingo"
 
     xp_start = flags_string.find("Xp")
     if xp_start >= 0:
@@ -51,16 +109,172 @@ def create_patch():
             xp_str += flags_string[xp_start]
             xp_start += 1
         flags.scale_levels = 1.0 / (int(xp_str) / 10.0)
+    return flags
+
+
+def request_flags() -> Flags:
+    """Gets the flags of a request, including any plando pairs: each "pin" and "forbid" field is an item:location
+    pair."""
+    flags = parse_flags(request.form['flags'])
+    flags.plando_pins = parse_pairs(request.form.getlist('pin'))
+    flags.plando_forbidden = parse_pairs(request.form.getlist('forbid'))
+    return flags
+
+
+@app.errorhandler(PlandoError)
+def plando_error(error: PlandoError):
+    """Answers 409 when the plando pairs can't all hold, and 400 when they're malformed or name something that doesn't
+    exist."""
+    return make_response(jsonify({
+        "error": str(error),
+        "pinned": [f"{pairing.reward}:{pairing.source}" for pairing in error.pinned],
+        "forbidden": [f"{pairing.reward}:{pairing.source}" for pairing in error.forbidden]
+    }), 409 if isinstance(error, PlandoConflict) else 400)
+
+
+def request_seed() -> str:
+    """Gets the seed of a request. If the request doesn't give one, draws a seed whose placement is ready."""
+    seed = request.form.get('seed', "")
+    if seed != "":
+        return seed
+    return prefetcher.next_seed() if prefetcher is not None else random_seed()
+
+
+def randomize_seed(rom_seed: str, flags: Flags, kind: str, timer: StageTimer, progress=None,
+                   cancel: CancellationToken = None) -> bytes:
+    """Randomizes a seed (unless it's already cached), and returns one kind of result.
+
+    The patch and the spoiler come out of the same run, and both are cached, so asking for the spoiler of a seed
+    after its patch (or the other way around) doesn't randomize it again.
+
+    :param rom_seed: Seed to randomize.
+    :param flags: Flags to randomize with.
+    :param kind: Kind of result wanted: "ips" or "spoiler".
+    :param timer: Timer to record the stages with, if the seed is randomized.
+    :param progress: Optional progress callback, passed on to `randomize()`.
+    :param cancel: Optional CancellationToken, passed on to `randomize()`.
+    :return: The result.
+    """
+    key = result_key(rom_fingerprint(), flags, rom_seed)
+    result = result_cache.get(key, kind)
+    if result is not None:
+        return result
 
-    with open("ff-dos.gba", "rb") as rom_file:
+    with open(ROM_PATH, "rb") as rom_file:
         rom_data = bytearray(rom_file.read())
-        randomized_rom = randomize(rom_data, rom_seed, flags)
+    spoiler = io.StringIO()
+    randomized_rom = randomize(rom_data, rom_seed, flags, timer, cache=stage_cache, spoiler=spoiler,
+                               progress=progress, cancel=cancel)
+
+    with timer.stage("ips_diff") as record:
+        patch = Patch.create(rom_data, randomized_rom).encode()
+        record.bytes_patched = len(patch)
+    app.logger.info("Stage timings for %s: %s", rom_seed, timer.to_json())
+
+    results = {"ips": patch, "spoiler": spoiler.getvalue().encode("utf-8")}
+    for result_kind, data in results.items():
+        result_cache.put(key, result_kind, data)
+    return results[kind]
+
+
+@app.route('/patch', methods=['POST'])
+def create_patch():
+    filename = "patch.ips"
+    timer = StageTimer()
+    request_id = request.headers.get("X-Request-Id", uuid.uuid4().hex)
+    rom_seed = request_seed()
+    with log_context(request_id=request_id):
+        patch = randomize_seed(rom_seed, request_flags(), "ips", timer)
+
+    response = make_response(patch)
+    response.headers['X-Request-Id'] = request_id
+    response.headers['X-Seed'] = rom_seed
+    response.headers['Content-Type'] = "application/octet-stream"
+    response.headers['Content-Disposition'] = f"inline; filename={filename}"
+    response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@app.route('/spoiler', methods=['POST'])
+def create_spoiler():
+    timer = StageTimer()
+    request_id = request.headers.get("X-Request-Id", uuid.uuid4().hex)
+    with log_context(request_id=request_id):
+        spoiler = randomize_seed(request.form['seed'], request_flags(), "spoiler", timer)
+
+    response = make_response(spoiler)
+    response.headers['X-Request-Id'] = request_id
+    response.headers['Content-Type'] = "application/json"
+    response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@app.route('/seed', methods=['GET'])
+def new_seed():
+    """Draws a random seed, preferring one whose key item placement is already solved."""
+    return jsonify({"seed": prefetcher.next_seed() if prefetcher is not None else random_seed()})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "prefetch": prefetcher.metrics() if prefetcher is not None else None,
+        "solver": solver_totals(),
+        "result_cache": {"hits": result_cache.hits, "misses": result_cache.misses},
+        "icode_cache": {"hits": get_icode_cache().hits, "misses": get_icode_cache().misses},
+        "stage_cache": {"hits": stage_cache.hits, "misses": stage_cache.misses}
+    })
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Starts randomizing a seed in the background. Poll `/jobs/<id>` for its progress, then fetch the patch (or
+    spoiler, with kind=spoiler) from `/jobs/<id>/result`."""
+    kind = request.form.get('kind', "ips")
+    if kind not in ("ips", "spoiler"):
+        return make_response(jsonify({"error": f"Unknown kind '{kind}'"}), 400)
+
+    request_id = request.headers.get("X-Request-Id", uuid.uuid4().hex)
+    with log_context(request_id=request_id):
+        job = job_queue.submit(randomize_seed, request_seed(), request_flags(), kind, StageTimer(), kind=kind)
+
+    response = make_response(jsonify(job.as_dict()), 202)
+    response.headers['X-Request-Id'] = request_id
+    response.headers['Location'] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return make_response(jsonify({"error": "No such job"}), 404)
+    return jsonify(job.as_dict())
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return make_response(jsonify({"error": "No such job"}), 404)
+    return make_response(jsonify(job.as_dict()), 202)
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return make_response(jsonify({"error": "No such job"}), 404)
+    if job.status != Job.DONE:
+        return make_response(jsonify(job.as_dict()), 409)
 
-        patch = Patch.create(rom_data, randomized_rom)
-        response = make_response(patch.encode())
+    response = make_response(job.result)
+    if job.kind == "ips":
         response.headers['Content-Type'] = "application/octet-stream"
-        response.headers['Content-Disposition'] = f"inline; filename={filename}"
-        return response
+        response.headers['Content-Disposition'] = "inline; filename=patch.ips"
+    else:
+        response.headers['Content-Type'] = "application/json"
+    return response
 
 
 # Press the green button in the gutter to run the script.
@@ -1,16 +1,22 @@
 import hashlib
 import pprint
+import queue
 import random
+import threading
 import tkinter as tk
 import tomllib
 from pathlib import Path
-from tkinter import filedialog, font
+from tkinter import filedialog, font, messagebox, ttk
 from PIL import Image, ImageTk
 
 from doslib.dos_utils import resolve_path
 from randomizer.flags import Flags
+from randomizer.pipeline import CancellationToken, Cancelled
 from randomizer.randomize import randomize
 
+# How often the main thread checks on a running randomization, in milliseconds.
+POLL_INTERVAL = 50
+
 
 def browse_file():
     global rom_full_path
@@ -45,11 +51,20 @@ def check_seed(seed: str):
 
 
 def randomize_rom():
+    global cancel_token
+
     if rom_full_path is None:
         # This shouldn't happen since the button should be disabled,
         # but if it does, just ignore it
         return
 
+    if cancel_token is not None:
+        # The button doubles as "Cancel" while a randomization is running.
+        cancel_token.cancel()
+        randomize_button["state"] = tk.DISABLED
+        status_var.set("Cancelling...")
+        return
+
     flags = Flags()
     flags.no_shuffle = not progression.get()
     flags.standard_shops = not shops.get()
@@ -61,16 +76,73 @@ def randomize_rom():
 
     flags.scale_levels = exp_scale_var.get() / 100.0
 
-    with open(rom_full_path, "rb") as rom_file:
-        rom_data = bytearray(rom_file.read())
-
-    base_name = rom_file.name.replace(".gba", "")
     rom_seed = hex_seed_var.get()[len("Encoded: "):]
-    randomized_rom = randomize(rom_data, rom_seed, flags)
-
-    output_name = f"{base_name}_{flags.encode()}_{rom_seed}.gba"
-    with open(output_name, "wb") as output:
-        output.write(randomized_rom)
+    cancel_token = CancellationToken()
+    updates = queue.Queue()
+
+    # Randomizing takes a while, so it runs on a worker thread to keep the window responsive. Tk may only be used
+    # from the main thread, so the worker posts its progress to a queue that the main thread polls.
+    worker = threading.Thread(target=randomize_worker, args=(rom_full_path, rom_seed, flags, cancel_token, updates),
+                              daemon=True)
+    worker.start()
+
+    randomize_button["text"] = "Cancel"
+    file_button["state"] = tk.DISABLED
+    progress_var.set(0)
+    status_var.set("Randomizing...")
+    root.after(POLL_INTERVAL, poll_worker, updates)
+
+
+def randomize_worker(rom_path: str, rom_seed: str, flags: Flags, cancel: CancellationToken, updates: queue.Queue):
+    try:
+        with open(rom_path, "rb") as rom_file:
+            rom_data = bytearray(rom_file.read())
+
+        base_name = rom_path.replace(".gba", "")
+        randomized_rom = randomize(rom_data, rom_seed, flags, cancel=cancel,
+                                   progress=lambda progress: updates.put(("progress", progress)))
+
+        output_name = f"{base_name}_{flags.encode()}_{rom_seed}.gba"
+        with open(output_name, "wb") as output:
+            output.write(randomized_rom)
+        updates.put(("done", output_name))
+    except Cancelled:
+        updates.put(("cancelled", None))
+    except Exception as e:
+        updates.put(("failed", e))
+
+
+def poll_worker(updates: queue.Queue):
+    global cancel_token
+
+    while True:
+        try:
+            kind, value = updates.get_nowait()
+        except queue.Empty:
+            root.after(POLL_INTERVAL, poll_worker, updates)
+            return
+
+        if kind == "progress":
+            progress_var.set(value.fraction * 100)
+            if not cancel_token.cancelled:
+                status_var.set(f"{'Finished' if value.finished else 'Running'} {value.stage}")
+            continue
+
+        cancel_token = None
+        randomize_button["text"] = "Randomize"
+        randomize_button["state"] = tk.NORMAL
+        file_button["state"] = tk.NORMAL
+        if kind == "done":
+            progress_var.set(100)
+            status_var.set(f"Saved {Path(value).name}")
+        elif kind == "cancelled":
+            progress_var.set(0)
+            status_var.set("Cancelled")
+        else:
+            progress_var.set(0)
+            status_var.set("Failed")
+            messagebox.showerror("Randomization failed", str(value))
+        return
 
 
 # Initialize the main window
@@ -112,6 +184,7 @@ randomize_button = tk.Button(rom_frame, text="Randomize", command=randomize_rom,
 rom_label.grid(row=0, column=0, sticky="ew", padx=(10, 10), pady=(3, 3))
 file_button.grid(row=0, column=1, sticky="e", padx=(10, 10), pady=(3, 3))
 randomize_button.grid(row=1, column=1, sticky="e", padx=(10, 10), pady=(3, 3))
+cancel_token: CancellationToken | None = None
 
 seed_label = tk.Label(rom_frame, text="Seed")
 
@@ -131,6 +204,13 @@ seed_label.grid(row=1, column=0, sticky="w", padx=(10, 10), pady=(3, 3))
 seed_frame.grid(row=2, column=0, columnspan=2, sticky="ew", padx=(10, 10), pady=(3, 3))
 hex_seed_label.grid(row=3, column=0, sticky="we", padx=(10, 10), pady=(3, 3))
 
+progress_var = tk.DoubleVar(value=0)
+status_var = tk.StringVar(value="")
+progress_bar = ttk.Progressbar(rom_frame, variable=progress_var, maximum=100)
+status_label = tk.Label(rom_frame, textvariable=status_var, anchor="w")
+progress_bar.grid(row=4, column=0, columnspan=2, sticky="ew", padx=(10, 10), pady=(3, 3))
+status_label.grid(row=5, column=0, columnspan=2, sticky="we", padx=(10, 10), pady=(3, 3))
+
 rom_frame.pack(anchor='w', fill="x")
 
 exp_scale_var = tk.IntVar()
@@ -13,11 +13,21 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import io
+import logging
+import os
 import random
 from argparse import ArgumentParser, FileType
 
+from event.icodecache import set_icode_cache_dir
+from randomizer.counters import HotPathCounters
 from randomizer.flags import Flags
+from randomizer.logs import configure_logging
+from randomizer.pipeline import fingerprint
 from randomizer.randomize import randomize
+from randomizer.resultcache import ResultCache, result_key
+from randomizer.search import load_scorer, search_seeds
+from randomizer.timing import StageTimer
 from ips_util import Patch
 
 
@@ -43,11 +53,55 @@ def main() -> int:
                         help="Experimental Item Distribution")
     parser.add_argument("--fiend_ribbons", dest="fiend_ribbons", action="store_true",
                         help="Fiend 1's drop ribbons")
+    parser.add_argument("--key-item-solver", dest="key_item_solver", choices=["clingo", "python"], default="clingo",
+                        help="Solver for the key item placement. \"python\" doesn't need clingo, but gives different "
+                             "placements for the same seed")
+    parser.add_argument("--pin", dest="pin", action="append", metavar="ITEM:LOCATION",
+                        help="Put a key item at a location, such as excalibur:king (can be repeated)")
+    parser.add_argument("--forbid", dest="forbid", action="append", metavar="ITEM:LOCATION",
+                        help="Keep a key item away from a location (can be repeated)")
+    parser.add_argument("--solve-time-limit", dest="solve_time_limit", type=float,
+                        help="Seconds clingo may spend on the key item placement before giving up")
+    parser.add_argument("--solve-conflict-limit", dest="solve_conflict_limit", type=int,
+                        help="Conflicts clingo may run into before giving up on the key item placement")
+    parser.add_argument("--solve-threads", dest="solve_threads", type=int, default=1,
+                        help="Threads clingo solves with. More than one races solvers against each other, so the "
+                             "placement for a seed can differ from run to run, and results aren't cached")
     parser.add_argument("--debug", dest="debug", action="store_true", help="Enable debugging")
     parser.add_argument("--patch", dest="patch", action="store_true", help="Generate a patch file (ips) instead of a "
                                                                            "new rom")
+    parser.add_argument("--timings", dest="timings", choices=["json"],
+                        help="Print how long each stage of the randomization took")
+    parser.add_argument("--profile-memory", dest="profile_memory", action="store_true",
+                        help="Print the peak memory used by each stage of the randomization, and where it was "
+                             "allocated (slow)")
+    parser.add_argument("--log-format", dest="log_format", choices=["text", "json"], default="text",
+                        help="Format of the log: plain text, or JSON lines tagged with the seed")
+    parser.add_argument("--verbose", dest="verbose", action="store_true", help="Log everything, including parsing")
+    parser.add_argument("--counters", dest="counters", action="store_true",
+                        help="Print how many stream reads, writes and copies each part of the randomizer did (slow)")
+    parser.add_argument("--spoiler", dest="spoiler", action="store_true",
+                        help="Also write a spoiler (key items, shops, chests, bosses and starting gear) as JSON")
+    parser.add_argument("--cache-dir", dest="cache_dir",
+                        help="Directory to cache results in. A seed and set of flags that's already in the cache "
+                             "isn't randomized again, and event scripts that didn't change aren't parsed again")
+    parser.add_argument("--search", dest="search", type=int,
+                        help="Search for this many seeds accepted by --search-scorer, and randomize those")
+    parser.add_argument("--search-scorer", dest="search_scorer", default="randomizer.search:no_early_s_gear",
+                        help="Function (module:function) that scores or accepts candidate seeds")
+    parser.add_argument("--search-budget", dest="search_budget", type=int, default=100,
+                        help="Maximum number of candidate seeds to try")
+    parser.add_argument("--search-time", dest="search_time", type=float,
+                        help="Maximum number of seconds to search for")
+    parser.add_argument("--search-workers", dest="search_workers", type=int,
+                        help="Number of processes to evaluate candidate seeds in (default: one per CPU)")
 
     parsed = parser.parse_args()
+    configure_logging(logging.DEBUG if parsed.verbose else logging.INFO, json_lines=parsed.log_format == "json")
+
+    if parsed.solve_time_limit is not None or parsed.solve_conflict_limit is not None or parsed.solve_threads > 1:
+        from randomizer.clingo import SolverLimits, set_solver_limits
+        set_solver_limits(SolverLimits(parsed.solve_time_limit, parsed.solve_conflict_limit, parsed.solve_threads))
 
     # Ensure there's at most 1 seed.
     if parsed.seed is not None:
@@ -66,20 +120,66 @@ def main() -> int:
     rom_file.close()
 
     base_name = rom_file.name.replace(".gba", "")
-    randomized_rom = randomize(rom_data, seed_value, flags)
+    # A portfolio solve doesn't always give a seed the same placement, so its results can't be reused.
+    cache = ResultCache(parsed.cache_dir) if parsed.cache_dir is not None and parsed.solve_threads == 1 else None
+    if parsed.cache_dir is not None:
+        set_icode_cache_dir(os.path.join(parsed.cache_dir, "icode"))
 
-    if not parsed.patch:
-        output_name = f"{base_name}_{flags.encode()}_{seed_value}.gba"
-        with open(output_name, "wb") as output:
-            output.write(randomized_rom)
-    else:
-        output_name = f"{base_name}_{flags.encode()}_{seed_value}.ips"
-        patch = Patch.create(rom_data, randomized_rom)
-        with open(output_name, "wb") as output:
-            output.write(patch.encode())
+    seeds = [seed_value]
+    if parsed.search is not None:
+        results = search_seeds(rom_data, flags, load_scorer(parsed.search_scorer), matches=parsed.search,
+                               budget=parsed.search_budget, time_budget=parsed.search_time,
+                               max_workers=parsed.search_workers, search_seed=seed_value)
+        print(f"Found {len(results)} seeds: " + ", ".join(f"{result.seed} ({result.score:g})" for result in results))
+        seeds = [result.seed for result in results]
+
+    for seed_value in seeds:
+        timer = StageTimer(profile_memory=parsed.profile_memory)
+        counters = HotPathCounters() if parsed.counters else None
+        if counters is not None:
+            with counters.counting():
+                write_seed(parsed, rom_data, base_name, seed_value, flags, cache, timer)
+            print(counters.report())
+        else:
+            write_seed(parsed, rom_data, base_name, seed_value, flags, cache, timer)
+
+        if parsed.timings == "json":
+            print(timer.to_json())
+        elif parsed.profile_memory:
+            print(timer.memory_report())
 
     return 0
 
 
+def write_seed(parsed, rom_data: bytearray, base_name: str, seed_value: str, flags: Flags, cache: ResultCache,
+               timer: StageTimer):
+    kind = "ips" if parsed.patch else "rom"
+    output_name = f"{base_name}_{flags.encode()}_{seed_value}.{'ips' if parsed.patch else 'gba'}"
+
+    key = result_key(fingerprint(rom_data), flags, seed_value) if cache is not None else None
+    output_data = cache.get(key, kind) if cache is not None else None
+    spoiler_data = cache.get(key, "spoiler") if cache is not None and parsed.spoiler else None
+
+    if output_data is None or (parsed.spoiler and spoiler_data is None):
+        spoiler = io.StringIO() if parsed.spoiler else None
+        output_data = randomize(rom_data, seed_value, flags, timer, spoiler=spoiler)
+        if parsed.patch:
+            with timer.stage("ips_diff") as record:
+                output_data = Patch.create(rom_data, output_data).encode()
+                record.bytes_patched = len(output_data)
+        if spoiler is not None:
+            spoiler_data = spoiler.getvalue().encode("utf-8")
+        if cache is not None:
+            cache.put(key, kind, output_data)
+            if spoiler_data is not None:
+                cache.put(key, "spoiler", spoiler_data)
+
+    with open(output_name, "wb") as output:
+        output.write(output_data)
+    if spoiler_data is not None:
+        with open(f"{base_name}_{flags.encode()}_{seed_value}_spoiler.json", "wb") as output:
+            output.write(spoiler_data)
+
+
 if __name__ == "__main__":
     main()
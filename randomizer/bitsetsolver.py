@@ -0,0 +1,346 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import random
+import re
+import threading
+
+from doslib.dos_utils import resolve_path
+from randomizer.placement import ClingoPlacement, PlandoConflict, PlandoError, PROGRAM_FILES, format_pairs
+
+# The rules of the solving program, which the solver implements itself: every item goes to exactly one location and
+# the other way around, an item is had once its location is open, and every item must be had.
+SOLVING_RULES = frozenset([
+    "{pair(I,L):location(L)}=1:-item(I).",
+    "{pair(I,L):item(I)}=1:-location(L).",
+    "has(I):-pair(I,L),open(L).",
+    "notHas(I):-item(I),nothas(I).",
+    ":-item(I),notHas(I).",
+    "#shownotHas/1.",
+    "#showpair/2.",
+])
+
+FACT = re.compile(r"^(item|location|open)\((\w+)\)\.$")
+PAIR = re.compile(r"^pair\((\w+),(\w+)\)\.$")
+OPEN_RULE = re.compile(r"^open\((\w+)\):-(has\(\w+\)(?:,has\(\w+\))*)\.$")
+HAS = re.compile(r"has\((\w+)\)")
+
+# Number of placements a search may try before starting over with new random choices. Most dead ends are found in a
+# handful of steps, but a few early choices lead to long fruitless searches; restarting avoids them.
+NODE_BUDGET = 100
+MAX_RESTARTS = 1000
+
+
+class BitsetSolver(object):
+    """Solves key item placements in Python, without clingo.
+
+    The data program is compiled into bitmasks: each location gets a list of requirements, each one the set of items
+    (as a bitmask) that together open it. A placement is sampled by filling locations that are open with the items
+    had so far, picking items at random and backtracking out of dead ends (restarting searches that take too long),
+    so every placement it returns satisfies the same rules as clingo's. The placements are not the ones clingo would
+    pick for the same seed.
+    """
+
+    def __init__(self, programs: tuple = PROGRAM_FILES):
+        """
+        :param programs: Paths of the ASP programs to compile, relative to the repository.
+        """
+        self.items = []
+        self.locations = []
+        fixed = []
+        open_rules = []
+        for program in programs:
+            for statement in _statements(program):
+                if statement in SOLVING_RULES:
+                    continue
+                fact, pair, open_rule = FACT.match(statement), PAIR.match(statement), OPEN_RULE.match(statement)
+                if fact is not None and fact.group(1) == "item":
+                    self.items.append(fact.group(2))
+                elif fact is not None and fact.group(1) == "location":
+                    self.locations.append(fact.group(2))
+                elif fact is not None:
+                    open_rules.append((fact.group(2), []))
+                elif pair is not None:
+                    fixed.append((pair.group(1), pair.group(2)))
+                elif open_rule is not None:
+                    open_rules.append((open_rule.group(1), HAS.findall(open_rule.group(2))))
+                else:
+                    raise RuntimeError(f"{program}: can't compile '{statement}'")
+
+        if len(self.items) != len(self.locations):
+            raise RuntimeError(f"{len(self.items)} items can't be placed at {len(self.locations)} locations")
+        self._item_bits = {item: 1 << index for index, item in enumerate(self.items)}
+        self._item_index = {item: index for index, item in enumerate(self.items)}
+        self._all_items = (1 << len(self.items)) - 1
+        self._location_index = {location: index for index, location in enumerate(self.locations)}
+
+        self.requirements = [[] for _ in self.locations]
+        for location, needs in open_rules:
+            mask = 0
+            for item in needs:
+                mask |= self._item_bits[item]
+            self.requirements[self._location_index[location]].append(mask)
+
+        # Items that the program places itself, by location index.
+        self.fixed = {self._location_index[location]: self.items.index(item) for item, location in fixed}
+
+    def open_locations(self, has: int) -> int:
+        """Gets the locations that are open with a set of items.
+
+        :param has: Bitmask of the items had.
+        :return: Bitmask of the open locations.
+        """
+        opened = 0
+        for index, requirements in enumerate(self.requirements):
+            for mask in requirements:
+                if mask & has == mask:
+                    opened |= 1 << index
+                    break
+        return opened
+
+    def solve(self, seed: int, pinned: tuple = (), forbidden: tuple = ()) -> tuple:
+        """Create a random distribution for key items (KI).
+
+        :param seed: The random number seed to use.
+        :param pinned: Pairs (ClingoPlacement) the placement must contain.
+        :param forbidden: Pairs the placement must not contain.
+        :return: A list of tuples that contain item+location for each KI, in the order the items are declared.
+        """
+        fixed = dict(self.fixed)
+        for pairing in pinned:
+            item, location = self._pair_index(pairing, "pinned")
+            if fixed.get(location, item) != item or (item in fixed.values() and fixed.get(location) != item):
+                raise PlandoConflict(f"{format_pairs((pairing,))} conflicts with another pinned pair",
+                                     pinned=(pairing,))
+            fixed[location] = item
+        excluded = set()
+        for pairing in forbidden:
+            item, location = self._pair_index(pairing, "forbidden")
+            if self.fixed.get(location) == item:
+                raise PlandoConflict(f"{format_pairs((pairing,))} is part of every placement", forbidden=(pairing,))
+            if fixed.get(location) == item:
+                raise PlandoConflict(f"{format_pairs((pairing,))} is both pinned and forbidden",
+                                     forbidden=(pairing,))
+            excluded.add((item, location))
+
+        unreachable = self._unreachable_pins(fixed)
+        if len(unreachable) > 0:
+            at_fault = tuple(pairing for pairing in pinned if self._pair_index(pairing, "pinned")[0] in unreachable)
+            raise PlandoConflict(f"{format_pairs(at_fault)} can't be reached", pinned=at_fault)
+
+        rng = random.Random(seed)
+        free_items = [index for index in range(len(self.items)) if index not in fixed.values()]
+        for _ in range(MAX_RESTARTS):
+            item_at = [None] * len(self.locations)
+            budget = [NODE_BUDGET]
+            if self._fill(rng, 0, 0, item_at, free_items, fixed, excluded, budget):
+                break
+            if budget[0] > 0:
+                # The whole search finished without running out of budget, so there is no placement at all.
+                if len(pinned) > 0 or len(forbidden) > 0:
+                    raise PlandoConflict("No beatable placement has every pinned pair without the forbidden ones",
+                                         pinned, forbidden)
+                raise RuntimeError("No key item placement exists")
+        else:
+            if len(pinned) > 0 or len(forbidden) > 0:
+                # Every search running out of budget almost always means the pairs leave no placement.
+                raise PlandoConflict(f"No beatable placement with every pinned pair without the forbidden ones "
+                                     f"found after {MAX_RESTARTS} restarts", pinned, forbidden)
+            raise RuntimeError(f"No key item placement found for seed {seed} after {MAX_RESTARTS} restarts")
+
+        location_of = {item: location for location, item in enumerate(item_at)}
+        return tuple(ClingoPlacement(self.items[item], self.locations[location_of[item]])
+                     for item in range(len(self.items)))
+
+    def _unreachable_pins(self, fixed: dict) -> set:
+        """Finds the placed items that can't be reached even if every other item is had from the start, such as an
+        item pinned to a location that only opens with that item.
+
+        :param fixed: Item index at each location that's fixed or pinned.
+        :return: Set of the item indexes that can't be reached.
+        """
+        placed = 0
+        for item in fixed.values():
+            placed |= 1 << item
+        has = self._all_items & ~placed
+        while True:
+            opened = self.open_locations(has)
+            reached = has
+            for location, item in fixed.items():
+                if opened & (1 << location):
+                    reached |= 1 << item
+            if reached == has:
+                return {item for item in fixed.values() if not has & (1 << item)}
+            has = reached
+
+    def is_valid(self, placement: tuple) -> bool:
+        """Checks whether a placement (from either solver) satisfies the rules.
+
+        :param placement: The placement.
+        :return: True if every item is at exactly one location, the fixed items are where the program puts them,
+                 and every item can be reached.
+        """
+        item_at = self.item_locations(placement)
+        return item_at is not None and self.is_reachable(item_at)
+
+    def item_locations(self, placement: tuple) -> list:
+        """Converts a placement to the index of the item at each location.
+
+        :param placement: The placement.
+        :return: The item index at each location, or None if the placement doesn't put every item at exactly one
+                 location, or moves a fixed item.
+        """
+        item_at = [None] * len(self.locations)
+        for pairing in placement:
+            item = self._item_index.get(pairing.reward)
+            location = self._location_index.get(pairing.source)
+            if item is None or location is None or item_at[location] is not None:
+                return None
+            item_at[location] = item
+        if None in item_at or len(set(item_at)) != len(item_at):
+            return None
+        if any(item_at[location] != item for location, item in self.fixed.items()):
+            return None
+        return item_at
+
+    def is_reachable(self, item_at: list) -> bool:
+        """Checks whether every item can be reached, starting with none and collecting the item at each location
+        as soon as it opens.
+
+        :param item_at: The item index at each location, as returned by `item_locations`.
+        :return: True if every item can be reached.
+        """
+        pending = [(mask, 1 << item_at[location])
+                   for location, requirements in enumerate(self.requirements) for mask in requirements]
+        has = 0
+        while True:
+            waiting = [(mask, bit) for mask, bit in pending if mask & has != mask]
+            if len(waiting) == len(pending):
+                return has == self._all_items
+            for mask, bit in pending:
+                if mask & has == mask:
+                    has |= bit
+            pending = waiting
+
+    def validate_batch(self, item_at):
+        """Checks many placements at once, with NumPy.
+
+        :param item_at: Array (or nested list) with a row for each placement, holding the item index at each
+                        location. See `placement_matrix`.
+        :return: A boolean NumPy array, True for each row that satisfies the rules.
+        """
+        import numpy
+
+        item_at = numpy.asarray(item_at, dtype=numpy.int64)
+        location_count = len(self.locations)
+        if item_at.ndim != 2 or item_at.shape[1] != location_count:
+            raise RuntimeError(f"Expected an array of shape (n, {location_count}), not {item_at.shape}")
+        if len(self.items) > 64:
+            raise RuntimeError("Can't check placements of more than 64 items in a batch")
+
+        valid = ((item_at >= 0) & (item_at < len(self.items))).all(axis=1)
+        item_at = numpy.where(valid[:, None], item_at, 0)
+        valid &= (numpy.sort(item_at, axis=1) == numpy.arange(location_count)).all(axis=1)
+        for location, item in self.fixed.items():
+            valid &= item_at[:, location] == item
+
+        bits = numpy.left_shift(numpy.uint64(1), item_at.astype(numpy.uint64))
+        masks = [[numpy.uint64(mask) for mask in requirements] for requirements in self.requirements]
+        has = numpy.zeros(len(item_at), dtype=numpy.uint64)
+        # Each round opens at least one more location in any placement that isn't stuck yet.
+        for _ in range(location_count + 1):
+            opened = numpy.zeros(item_at.shape, dtype=bool)
+            for location, requirements in enumerate(masks):
+                for mask in requirements:
+                    opened[:, location] |= (has & mask) == mask
+            reached = numpy.bitwise_or.reduce(numpy.where(opened, bits, numpy.uint64(0)), axis=1)
+            if (reached == has).all():
+                break
+            has = reached
+        return valid & (has == numpy.uint64(self._all_items))
+
+    def placement_matrix(self, placements):
+        """Converts placements to the array `validate_batch` takes. Placements that don't put every item at exactly
+        one location get a row of -1.
+
+        :param placements: Iterable of placements.
+        :return: A NumPy array with a row for each placement.
+        """
+        import numpy
+
+        rows = []
+        for placement in placements:
+            item_at = self.item_locations(placement)
+            rows.append(item_at if item_at is not None else [-1] * len(self.locations))
+        return numpy.array(rows, dtype=numpy.int64).reshape(len(rows), len(self.locations))
+
+    def _pair_index(self, pairing: ClingoPlacement, kind: str) -> tuple:
+        if pairing.reward not in self._item_index or pairing.source not in self._location_index:
+            raise PlandoError(f"No key item or location named in {format_pairs((pairing,))}", **{kind: (pairing,)})
+        return self._item_index[pairing.reward], self._location_index[pairing.source]
+
+    def _fill(self, rng: random.Random, has: int, filled: int, item_at: list, free_items: list, fixed: dict,
+              excluded: set, budget: list) -> bool:
+        budget[0] -= 1
+        if budget[0] <= 0:
+            return False
+
+        reachable = self.open_locations(has) & ~filled
+        if reachable == 0:
+            return filled == (1 << len(self.locations)) - 1
+
+        # Any reachable location has to be filled eventually, and filling it first can't close anything off, so
+        # only the choice of item needs backtracking.
+        candidates = [location for location in range(len(self.locations)) if reachable & (1 << location)]
+        location = rng.choice(candidates)
+        if location in fixed:
+            choices = [fixed[location]]
+        else:
+            choices = [item for item in free_items if (item, location) not in excluded]
+            rng.shuffle(choices)
+
+        for item in choices:
+            item_at[location] = item
+            if item in free_items:
+                remaining = [other for other in free_items if other != item]
+            else:
+                remaining = free_items
+            if self._fill(rng, has | (1 << item), filled | (1 << location), item_at, remaining, fixed, excluded,
+                          budget):
+                return True
+            if budget[0] <= 0:
+                return False
+        item_at[location] = None
+        return False
+
+
+def _statements(program: str) -> list:
+    with open(resolve_path(program), "r") as program_file:
+        text = "\n".join(line.split("%", 1)[0] for line in program_file.read().splitlines())
+    # Statements end with a period; whitespace is never significant in these programs.
+    text = "".join(text.split())
+    return [statement + "." for statement in text.split(".") if statement != ""]
+
+
+_solver = None
+_solver_lock = threading.Lock()
+
+
+def get_solver() -> BitsetSolver:
+    """Gets the process's solver, compiling the key item programs the first time it's called."""
+    global _solver
+    with _solver_lock:
+        if _solver is None:
+            _solver = BitsetSolver()
+        return _solver
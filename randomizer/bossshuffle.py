@@ -66,11 +66,15 @@ class BossData:
             self.boss_data[entry.name][entry.iteration] = entry
         self.boss_list = list(self.boss_data.keys())
 
+        # The bosses that replace each fiend, once they've been randomized.
+        self.boss_choices = None
+
         # Finally, load in the script data from the ROM - we can read in the tsv if/when randomize gets called
 
     def randomize_bosses(self, encounters: list, enemy_data: list, rng: random.Random):
         boss_choices = rng.sample(self.boss_list, 4)
         rng.shuffle(boss_choices)
+        self.boss_choices = boss_choices
         new_fiend1s = [self.boss_data[boss_choices[0]][0], self.boss_data[boss_choices[1]][0],
                        self.boss_data[boss_choices[2]][1], self.boss_data[boss_choices[3]][1]]
 
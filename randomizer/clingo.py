@@ -12,47 +12,291 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
 from collections import namedtuple
 
 import clingo
 
 from doslib.dos_utils import resolve_path
+from randomizer.placement import ClingoPlacement, PlandoConflict, PlandoError, PROGRAM_FILES, format_pairs
 
-ClingoPlacement = namedtuple("ClingoPlacement", ["reward", "source"])
+logger = logging.getLogger(__name__)
 
+# Limits on a single solve. time_limit is in seconds, conflict_limit is the number of conflicts clasp may run into,
+# and threads is the number of threads to solve with (as a portfolio, where the first to find a placement wins).
+SolverLimits = namedtuple("SolverLimits", ["time_limit", "conflict_limit", "threads"], defaults=[None, None, 1])
 
-def solve_placement_for_seed(seed: int) -> tuple:
-    """Create a random distribution for key items (KI).
+SolveResult = namedtuple("SolveResult", ["placement", "statistics"])
 
-    :param seed: The random number seed to use for the solver.
-    :return: A list of tuples that contain item+location for each KI.
+
+class SolverLimitReached(RuntimeError):
+    """Raised when a solve runs into one of its SolverLimits before finding a placement."""
+    pass
+
+
+class _AspifWriter(object):
+    """Ground program observer that records the program in clingo's intermediate format (aspif)."""
+
+    def __init__(self):
+        self.statements = []
+        # Program atom of each pair(reward, source), or 0 if the pair is a fact.
+        self.pair_atoms = {}
+
+    def rule(self, choice: bool, head, body):
+        self.statements.append([1, int(choice), len(head), *head, 0, len(body), *body])
+
+    def weight_rule(self, choice: bool, head, lower_bound: int, body):
+        weighted = [value for literal_weight in body for value in literal_weight]
+        self.statements.append([1, int(choice), len(head), *head, 1, lower_bound, len(body), *weighted])
+
+    def output_atom(self, symbol, atom: int):
+        name = str(symbol)
+        if symbol.name == "pair":
+            reward, source = symbol.arguments
+            self.pair_atoms[(reward.name, source.name)] = atom
+        # Atom 0 means the symbol is a fact, so it's always shown.
+        self.statements.append([4, len(name), name] + ([1, atom] if atom != 0 else [0]))
+
+    def _unsupported(self, *args):
+        raise RuntimeError("The key item programs use a statement that can't be saved as aspif")
+
+    minimize = project = external = assume = heuristic = acyc_edge = output_term = _unsupported
+
+    def aspif(self) -> str:
+        lines = ["asp 1 0 0"] + [" ".join(str(value) for value in statement) for statement in self.statements]
+        return "\n".join(lines + ["0", ""])
+
+
+class KeyItemSolver(object):
+    """Solves key item placements, grounding the key item programs only once.
+
+    The ground program is saved (as aspif) when the solver is created, and each call to `solve` loads it into a new
+    clingo Control, so no seed pays for parsing and grounding the programs again. Reusing one Control for every
+    seed would be cheaper still, but clasp keeps state from one solve to the next, so the placement for a seed would
+    depend on the seeds solved before it. With a new Control for each seed, placements are the same as they have
+    always been, and the solver can be used by any number of threads at once.
+
+    Pinned and forbidden pairs (plando) are passed to clasp as assumptions on the atoms of the ground program, so
+    they cost nothing more than the solve. If they can't all hold, the unsatisfiable core names the ones at fault.
+
+    Solving with more than one thread races differently configured solvers against each other, so which placement
+    comes back depends on timing. Only use it where reproducing a seed doesn't matter.
     """
 
-    prg = clingo.Control()
+    def __init__(self, programs: tuple = PROGRAM_FILES, limits: SolverLimits = SolverLimits()):
+        """
+        :param programs: Paths of the ASP programs to solve, relative to the repository.
+        :param limits: Limits on each solve.
+        """
+        self.limits = limits
+        self._totals_lock = threading.Lock()
+        self._totals = {"solves": 0, "limits_reached": 0, "choices": 0, "conflicts": 0, "solve_ms": 0.0,
+                        "max_solve_ms": 0.0}
+
+        control = clingo.Control()
+        for program in programs:
+            control.load(resolve_path(program))
+        writer = _AspifWriter()
+        control.register_observer(writer)
+        control.ground([("base", [])])
+
+        self._pair_atoms = writer.pair_atoms
+        self._rewards = {reward for reward, _ in self._pair_atoms}
+        self._sources = {source for _, source in self._pair_atoms}
+
+        handle, self._path = tempfile.mkstemp(prefix="key-items-", suffix=".aspif")
+        with os.fdopen(handle, "w") as aspif_file:
+            aspif_file.write(writer.aspif())
+        self._owner_pid = os.getpid()
+        atexit.register(self.close)
+
+    def close(self):
+        """Deletes the saved ground program. Only the process that created the solver deletes it."""
+        if os.getpid() == self._owner_pid and os.path.exists(self._path):
+            os.unlink(self._path)
+        atexit.unregister(self.close)
+
+    def solve(self, seed: int, pinned: tuple = (), forbidden: tuple = ()) -> tuple:
+        """Create a random distribution for key items (KI).
+
+        :param seed: The random number seed to use for the solver.
+        :param pinned: Pairs (ClingoPlacement) the placement must contain.
+        :param forbidden: Pairs the placement must not contain.
+        :return: A list of tuples that contain item+location for each KI.
+        """
+        return self.solve_with_statistics(seed, pinned, forbidden).placement
 
-    # Add your ASP programs
-    prg.load(resolve_path("asp/KeyItemSolvingShip.lp"))
-    prg.load(resolve_path("asp/KeyItemDataShip.lp"))
+    def solve_with_statistics(self, seed: int, pinned: tuple = (), forbidden: tuple = ()) -> SolveResult:
+        """Solves a placement, and reports how hard clingo had to work for it.
 
-    # Set the seed and other configuration options
-    prg.configuration.solve.models = 1  # Limit to one model
-    prg.configuration.solver.sign_def = "rnd"
-    prg.configuration.solver.seed = seed
+        :param seed: The random number seed to use for the solver.
+        :param pinned: Pairs (ClingoPlacement) the placement must contain.
+        :param forbidden: Pairs the placement must not contain.
+        :return: A SolveResult, whose statistics are a dictionary of the number of choices and conflicts, the
+                 time spent loading the ground program ("ground_ms") and searching ("solve_ms").
+        """
+        assumptions = self._assumptions(pinned, forbidden)
+        start = time.perf_counter()
+        control = clingo.Control(logger=_log_message)
+        control.load(self._path)
 
-    # Ground the program
-    prg.ground([("base", [])])
+        # Set the seed and other configuration options
+        control.configuration.solve.models = 1  # Limit to one model
+        control.configuration.solver.sign_def = "rnd"
+        control.configuration.solver.seed = seed
+        if self.limits.conflict_limit is not None:
+            control.configuration.solve.solve_limit = str(self.limits.conflict_limit)
+        if self.limits.threads > 1:
+            control.configuration.solve.parallel_mode = f"{self.limits.threads},compete"
 
-    # Solve the problem
-    result = []
-    with prg.solve(yield_=True) as handle:
-        for model in handle:
-            result.append(model.symbols(shown=True))
-            break  # Stop after finding the first model
+        # The program is already ground; this just hands it to the solver.
+        control.ground([("base", [])])
+        grounded = time.perf_counter()
 
-    ki_placement = []
-    for pairing in result[0]:
-        pairing_str = str(pairing)
-        pairing = ClingoPlacement(*pairing_str[5:len(pairing_str) - 1].split(","))
-        ki_placement.append(pairing)
+        models = []
+        core = []
+        with control.solve(on_model=lambda model: models.append(model.symbols(shown=True)),
+                           assumptions=list(assumptions), async_=True) as handle:
+            finished = handle.wait(self.limits.time_limit)
+            if not finished:
+                handle.cancel()
+            result = handle.get()
+            if result.unsatisfiable and len(assumptions) > 0:
+                core = handle.core()
 
-    return tuple(ki_placement)
+        solvers = control.statistics["solving"]["solvers"]
+        statistics = {
+            "choices": int(solvers["choices"]),
+            "conflicts": int(solvers["conflicts"]),
+            "ground_ms": (grounded - start) * 1000,
+            "solve_ms": (time.perf_counter() - grounded) * 1000
+        }
+        limit_reached = not finished or (len(models) == 0 and not result.unsatisfiable)
+        self._record(statistics, limit_reached)
+
+        if not finished:
+            raise SolverLimitReached(f"Solving seed {seed} took more than {self.limits.time_limit} seconds")
+        if limit_reached:
+            raise SolverLimitReached(f"Solving seed {seed} ran into {self.limits.conflict_limit} conflicts")
+        if len(core) > 0:
+            conflict = [assumptions[literal] for literal in core]
+            pinned_conflict = tuple(pairing for kind, pairing in conflict if kind == "pinned")
+            forbidden_conflict = tuple(pairing for kind, pairing in conflict if kind == "forbidden")
+            at_fault = [f"{kind} {format_pairs(pairs)}"
+                        for kind, pairs in (("pinned", pinned_conflict), ("forbidden", forbidden_conflict))
+                        if len(pairs) > 0]
+            raise PlandoConflict(f"No beatable placement satisfies {' and '.join(at_fault)}", pinned_conflict,
+                                 forbidden_conflict)
+        if len(models) == 0:
+            raise RuntimeError(f"No key item placement exists for seed {seed}")
+
+        ki_placement = []
+        for symbol in models[0]:
+            if symbol.name == "pair":
+                reward, source = symbol.arguments
+                ki_placement.append(ClingoPlacement(reward.name, source.name))
+        logger.debug("Solved key items for seed %#x: %s", seed, statistics)
+        return SolveResult(tuple(ki_placement), statistics)
+
+    def count_placements(self, time_limit: float = None, pinned: tuple = (), forbidden: tuple = ()) -> tuple:
+        """Counts the placements the programs allow, by enumerating every one of them.
+
+        :param time_limit: Seconds to enumerate for, or None to enumerate them all.
+        :param pinned: Pairs (ClingoPlacement) every counted placement must contain.
+        :param forbidden: Pairs no counted placement may contain.
+        :return: Tuple of the count, and whether it's complete. If the time limit ran out, the count is only a lower
+                 bound.
+        """
+        assumptions = self._assumptions(pinned, forbidden)
+        control = clingo.Control(logger=_log_message)
+        control.load(self._path)
+        control.configuration.solve.models = 0
+        control.ground([("base", [])])
+        with control.solve(assumptions=list(assumptions), async_=True) as handle:
+            finished = handle.wait(time_limit)
+            if not finished:
+                handle.cancel()
+            handle.get()
+        return int(control.statistics["summary"]["models"]["enumerated"]), finished
+
+    def _assumptions(self, pinned: tuple, forbidden: tuple) -> dict:
+        # Maps each assumed literal to the pair it came from.
+        assumptions = {}
+        for kind, pairs, sign in (("pinned", pinned, 1), ("forbidden", forbidden, -1)):
+            for pairing in pairs:
+                if pairing.reward not in self._rewards or pairing.source not in self._sources:
+                    raise PlandoError(f"No key item or location named in {format_pairs((pairing,))}",
+                                      **{kind: (pairing,)})
+                atom = self._pair_atoms.get((pairing.reward, pairing.source))
+                if atom == 0 and sign < 0:
+                    raise PlandoConflict(f"{format_pairs((pairing,))} is part of every placement",
+                                         forbidden=(pairing,))
+                if atom is None and sign > 0:
+                    raise PlandoConflict(f"{format_pairs((pairing,))} is never part of a placement", pinned=(pairing,))
+                if atom is not None and atom != 0:
+                    assumptions[sign * atom] = (kind, pairing)
+        return assumptions
+
+    def totals(self) -> dict:
+        """Gets totals over every solve so far: the number of solves, how many reached a limit, choices, conflicts,
+        and the total and longest search times."""
+        with self._totals_lock:
+            return dict(self._totals)
+
+    def _record(self, statistics: dict, limit_reached: bool):
+        with self._totals_lock:
+            self._totals["solves"] += 1
+            self._totals["limits_reached"] += 1 if limit_reached else 0
+            self._totals["choices"] += statistics["choices"]
+            self._totals["conflicts"] += statistics["conflicts"]
+            self._totals["solve_ms"] += statistics["solve_ms"]
+            self._totals["max_solve_ms"] = max(self._totals["max_solve_ms"], statistics["solve_ms"])
+
+
+def _log_message(code: clingo.MessageCode, message: str):
+    logger.warning("clingo: %s", message)
+
+
+_solver = None
+_solver_limits = SolverLimits()
+_solver_lock = threading.Lock()
+
+
+def get_solver() -> KeyItemSolver:
+    """Gets the process's solver, grounding the key item programs the first time it's called."""
+    global _solver
+    with _solver_lock:
+        if _solver is None:
+            _solver = KeyItemSolver(limits=_solver_limits)
+        return _solver
+
+
+def set_solver_limits(limits: SolverLimits):
+    """Sets the limits of the process's solver."""
+    global _solver_limits
+    with _solver_lock:
+        _solver_limits = limits
+        if _solver is not None:
+            _solver.limits = limits
+
+
+def solver_totals() -> dict:
+    """Gets the totals of the process's solver (see `KeyItemSolver.totals`), or None if nothing was solved yet."""
+    with _solver_lock:
+        return _solver.totals() if _solver is not None else None
+
+
+def solve_placement_for_seed(seed: int, pinned: tuple = (), forbidden: tuple = ()) -> tuple:
+    """Create a random distribution for key items (KI).
+
+    :param seed: The random number seed to use for the solver.
+    :param pinned: Pairs (ClingoPlacement) the placement must contain.
+    :param forbidden: Pairs the placement must not contain.
+    :return: A list of tuples that contain item+location for each KI.
+    """
+    return get_solver().solve(seed, pinned, forbidden)
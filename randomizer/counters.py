@@ -0,0 +1,206 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import functools
+import json
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from doslib.rom import Rom
+from randomizer import ipsfile
+from stream.inputstream import InputStream
+from stream.outputstream import OutputStream
+
+# Files whose frames are skipped when working out who made a call: the instrumented code, and this module.
+INSTRUMENTED_FILES = (sys.modules[InputStream.__module__].__file__, sys.modules[OutputStream.__module__].__file__,
+                      sys.modules[Rom.__module__].__file__, ipsfile.__file__, __file__)
+
+COLUMNS = ("read_u8", "read_u16", "read_u32", "bytes_sliced", "input_streams", "write_u8", "write_u16",
+           "write_u32", "write_bytes", "buffer_growths", "bytes_copied", "patch_bytes")
+
+_install_lock = threading.Lock()
+_installed = None
+
+# The counters that calls in the current context are counted by. Set in the context that installed them, and copied
+# into the pipeline's worker threads along with it.
+_counting = ContextVar("hot_path_counters", default=None)
+
+
+class HotPathCounters(object):
+    """Counts the low-level operations (stream reads and writes, slices and copies of ROM data, buffer growth and
+    patch loading) done by each subsystem.
+
+    Counting works by wrapping methods of InputStream, OutputStream, Rom and the IPS loader while the counters are
+    installed, and removing the wrappers afterwards, so it costs nothing when it's off. While it's on, every call
+    inspects the stack to find the subsystem that made it: the class of the first caller outside of the instrumented
+    code, or its module and function if it isn't a method. That's slow, so only use it to find out where the time is
+    going, not to time anything.
+
+    The wrappers are installed for the whole process, but only count calls made in the context that installed them,
+    including stages that the pipeline runs on its worker threads. Randomizations running at the same time on other
+    threads (such as the prefetcher, or other jobs) aren't counted.
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._originals = []
+        self._token = None
+
+    @contextmanager
+    def counting(self):
+        """Installs the counters for the duration of a block of code."""
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+    def install(self):
+        global _installed
+        with _install_lock:
+            if _installed is not None:
+                raise RuntimeError("Hot path counters are already installed")
+            _installed = self
+            self._token = _counting.set(self)
+
+            self._wrap(InputStream, "__init__", lambda stream, args, result: (("input_streams", 1),))
+            for name in ("get_u8", "get_char", "peek_u8"):
+                self._wrap(InputStream, name, lambda stream, args, result: (("read_u8", 1),))
+            for name in ("get_u16", "peek_u16"):
+                self._wrap(InputStream, name, lambda stream, args, result: (("read_u16", 1), ("bytes_sliced", 2)))
+            for name in ("get_u32", "peek_u32"):
+                self._wrap(InputStream, name, lambda stream, args, result: (("read_u32", 1), ("bytes_sliced", 4)))
+
+            self._wrap_output("put_u8", lambda args: (("write_u8", 1),))
+            self._wrap_output("put_u16", lambda args: (("write_u16", 1),))
+            self._wrap_output("put_u32", lambda args: (("write_u32", 1),))
+            self._wrap_output("put_bytes", lambda args: (("write_bytes", len(args[0])),))
+
+            self._wrap(Rom, "open_bytestream", lambda rom, args, result: (("bytes_sliced", result.size()),))
+            self._wrap(Rom, "get_stream", lambda rom, args, result: (("bytes_sliced", result.size()),))
+            self._wrap(Rom, "get_lut", lambda rom, args, result: (("bytes_sliced", 4 * len(result)),))
+            self._wrap(Rom, "get_string", lambda rom, args, result: (("bytes_sliced", len(result)),))
+            self._wrap(Rom, "apply_patches", lambda rom, args, result: (("bytes_copied", len(result.rom_data)),))
+
+            self._wrap(ipsfile, "load_ips_file", lambda *args: (("patch_bytes", sum(len(data) for data in
+                                                                                     args[-1].values())),),
+                       method=False)
+            self._wrap(ipsfile, "apply_patches", lambda *args: (("bytes_copied", len(args[-1])),), method=False)
+
+    def uninstall(self):
+        global _installed
+        with _install_lock:
+            for owner, name, original in reversed(self._originals):
+                setattr(owner, name, original)
+            self._originals = []
+            if _installed is self:
+                _installed = None
+            if self._token is not None:
+                _counting.reset(self._token)
+                self._token = None
+
+    def clear(self):
+        with self._lock:
+            self._counts = {}
+
+    def counts(self) -> dict:
+        """Gets the counts.
+
+        :return: Dictionary of subsystem name -> dictionary of counter name -> count.
+        """
+        with self._lock:
+            return {subsystem: dict(counter) for subsystem, counter in self._counts.items()}
+
+    def totals(self) -> dict:
+        totals = Counter()
+        for counter in self.counts().values():
+            totals.update(counter)
+        return dict(totals)
+
+    def to_json(self) -> str:
+        return json.dumps({"subsystems": self.counts(), "totals": self.totals()})
+
+    def report(self) -> str:
+        """Formats the counts as a table, with the busiest subsystem first."""
+        counts = self.counts()
+        ordered = sorted(counts.items(), key=lambda entry: -sum(entry[1].values()))
+        width = max([len("subsystem")] + [len(subsystem) for subsystem in counts.keys()]) + 2
+        lines = [f"{'subsystem':<{width}}" + "".join(f"{column:>15}" for column in COLUMNS)]
+        for subsystem, counter in ordered + [("total", self.totals())]:
+            lines.append(f"{subsystem:<{width}}" + "".join(f"{counter.get(column, 0):>15}" for column in COLUMNS))
+        return "\n".join(lines)
+
+    def _count(self, amounts):
+        subsystem = _calling_subsystem()
+        with self._lock:
+            counter = self._counts.get(subsystem)
+            if counter is None:
+                counter = self._counts[subsystem] = Counter()
+            for name, amount in amounts:
+                counter[name] += amount
+
+    def _wrap(self, owner, name: str, measure, method: bool = True):
+        original = getattr(owner, name)
+        self._originals.append((owner, name, original))
+
+        if method:
+            @functools.wraps(original)
+            def wrapper(instance, *args, **kwargs):
+                result = original(instance, *args, **kwargs)
+                if _counting.get() is self:
+                    self._count(measure(instance, args, result))
+                return result
+        else:
+            @functools.wraps(original)
+            def wrapper(*args, **kwargs):
+                result = original(*args, **kwargs)
+                if _counting.get() is self:
+                    self._count(measure(*args, result))
+                return result
+        setattr(owner, name, wrapper)
+
+    def _wrap_output(self, name: str, measure):
+        original = getattr(OutputStream, name)
+        self._originals.append((OutputStream, name, original))
+
+        @functools.wraps(original)
+        def wrapper(stream, *args, **kwargs):
+            if _counting.get() is not self:
+                return original(stream, *args, **kwargs)
+            # A change in the size of the allocation means the bytearray had to grow (and maybe move).
+            allocated = stream._stream.__alloc__()
+            result = original(stream, *args, **kwargs)
+            amounts = measure(args)
+            if stream._stream.__alloc__() != allocated:
+                amounts += (("buffer_growths", 1),)
+            self._count(amounts)
+            return result
+        setattr(OutputStream, name, wrapper)
+
+
+def _calling_subsystem() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename in INSTRUMENTED_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+
+    instance = frame.f_locals.get("self")
+    if instance is not None:
+        return type(instance).__name__
+    return f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
@@ -12,6 +12,8 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+from randomizer.placement import parse_pairs
+
 
 class Flags(object):
     def __init__(self, parsed=None):
@@ -24,6 +26,9 @@ class Flags(object):
             self.new_items = parsed.new_items
             self.fiend_ribbons = parsed.fiend_ribbons
             self.boss_shuffle = parsed.boss_shuffle
+            self.key_item_solver = parsed.key_item_solver
+            self.plando_pins = parse_pairs(parsed.pin or [])
+            self.plando_forbidden = parse_pairs(parsed.forbid or [])
 
             if parsed.exp_mult is not None:
                 self.scale_levels = 1.0 / parsed.exp_mult
@@ -38,6 +43,9 @@ class Flags(object):
             self.debug = False
             self.fiend_ribbons = False
             self.boss_shuffle = False
+            self.key_item_solver = "clingo"
+            self.plando_pins = ()
+            self.plando_forbidden = ()
             self.scale_levels = 1.0
 
     def encode(self) -> str:
@@ -56,6 +64,10 @@ class Flags(object):
             encoded += "Ni"
         if self.fiend_ribbons:
             encoded += "R"
+        if self.key_item_solver == "python":
+            encoded += "Py"
+        if len(self.plando_pins) > 0 or len(self.plando_forbidden) > 0:
+            encoded += "Pl"
         if self.debug:
             encoded += "\\u819a"
         encoded += str(int((self.scale_levels * 10)))
@@ -0,0 +1,162 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import contextvars
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from randomizer.pipeline import CancellationToken, Cancelled, Progress
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+    """A randomization running in the background, and its progress."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self, job_id: str, kind: str = None):
+        self.id = job_id
+        self.kind = kind
+        self.status = Job.QUEUED
+        self.progress = 0.0
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.cancel_token = CancellationToken()
+        self._future = None
+        self._finished = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self._finished.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Waits for the job to finish.
+
+        :param timeout: Optional number of seconds to wait for.
+        :return: Whether the job has finished.
+        """
+        return self._finished.wait(timeout)
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "error": self.error
+        }
+
+    def update(self, progress: Progress):
+        self.progress = progress.fraction
+        self.stage = progress.stage
+
+
+class JobQueue(object):
+    """Runs randomizations in the background, so a web request can start one and poll for its progress.
+
+    Finished jobs are kept (with their results) until `max_finished` newer jobs have finished.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 256):
+        """
+        :param max_workers: Number of jobs that may run at once. Later jobs wait in the queue.
+        :param max_finished: Number of finished jobs to remember.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="randomizer-job")
+        self._max_finished = max_finished
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, kind: str = None, **kwargs) -> Job:
+        """Queues a job.
+
+        :param func: Function that does the work. It's called with the given arguments, plus `progress` and `cancel`
+                     keyword arguments to pass on to `randomize()`, and returns the result of the job.
+        :param kind: Optional kind of result the job produces, kept on the Job (and not passed to `func`).
+        :return: The Job.
+        """
+        job = Job(uuid.uuid4().hex, kind)
+        with self._lock:
+            self._jobs[job.id] = job
+        # Run the job in a copy of the caller's context so its log records carry the caller's request id.
+        job._future = self._executor.submit(contextvars.copy_context().run, self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Looks up a job.
+
+        :param job_id: Id of the job.
+        :return: The Job, or None if there is no such job (or it was forgotten).
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job:
+        """Asks a job to stop. A job that is running stops after its current stage.
+
+        :param job_id: Id of the job.
+        :return: The Job, or None if there is no such job.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel_token.cancel()
+        return job
+
+    def shutdown(self):
+        """Cancels the jobs that haven't started, and waits for the running ones to finish."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        # A job whose call is taken off the executor's queue never runs, so it has to be finished here.
+        for job in jobs:
+            if job._future is not None and job._future.cancel():
+                job.cancel_token.cancel()
+                job.status = Job.CANCELLED
+                self._forget_old_jobs(job)
+                job._finished.set()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, job: Job, func, args: tuple, kwargs: dict):
+        try:
+            job.cancel_token.raise_if_cancelled()
+            job.status = Job.RUNNING
+            job.result = func(*args, progress=job.update, cancel=job.cancel_token, **kwargs)
+            job.progress = 1.0
+            job.status = Job.DONE
+        except Cancelled:
+            job.status = Job.CANCELLED
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            self._forget_old_jobs(job)
+            job._finished.set()
+
+    def _forget_old_jobs(self, job: Job):
+        with self._lock:
+            self._finished[job.id] = job
+            while len(self._finished) > self._max_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
@@ -0,0 +1,88 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# The seed being randomized, and the web request being served, by the current thread.
+current_seed = ContextVar("current_seed", default=None)
+current_request_id = ContextVar("current_request_id", default=None)
+
+
+@contextmanager
+def log_context(seed: str = None, request_id: str = None):
+    """Tags the log records made by a block of code with a seed and/or request id.
+
+    :param seed: Optional seed to tag records with.
+    :param request_id: Optional request id to tag records with.
+    """
+    tokens = []
+    if seed is not None:
+        tokens.append((current_seed, current_seed.set(seed)))
+    if request_id is not None:
+        tokens.append((current_request_id, current_request_id.set(request_id)))
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the seed and request id of the current context to every record, as `seed` and `request_id`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.seed = current_seed.get()
+        record.request_id = current_request_id.get()
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one line of JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "seed": getattr(record, "seed", None),
+            "request_id": getattr(record, "request_id", None)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def configure_logging(level: int = logging.INFO, json_lines: bool = False, stream=None) -> logging.Handler:
+    """Sends the randomizer's log records to a stream.
+
+    Nothing is logged until this is called, except warnings and errors (which Python prints to stderr by default).
+
+    :param level: Lowest level to log. The parsing code logs at DEBUG, which is a lot.
+    :param json_lines: Whether to format records as JSON lines (with the seed and request id) instead of text.
+    :param stream: Stream to log to. Defaults to stderr.
+    :return: The handler that was added to the root logger.
+    """
+    handler = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
@@ -0,0 +1,374 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import contextvars
+import hashlib
+import random
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from randomizer.flags import Flags
+from randomizer.timing import StageTimer, patch_size
+
+# Passed to a pipeline's progress callback when a stage starts (finished=False) and ends (finished=True). `fraction`
+# is the fraction of the run's stages that have finished.
+Progress = namedtuple("Progress", ["stage", "finished", "fraction"])
+
+
+class Cancelled(RuntimeError):
+    """Raised by a pipeline run whose CancellationToken was cancelled."""
+    pass
+
+
+class CancellationToken(object):
+    """Lets one thread ask a pipeline run on another thread to stop.
+
+    The token is checked between stages, so the stage that is running when it is cancelled still finishes.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled("Randomization was cancelled")
+
+
+class _ProgressReporter(object):
+    def __init__(self, callback, total: int):
+        self._callback = callback
+        self._total = total
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def start(self, stage_name: str):
+        if self._callback is not None:
+            with self._lock:
+                self._callback(Progress(stage_name, False, self._finished / self._total))
+
+    def finish(self, stage_name: str):
+        if self._callback is not None:
+            with self._lock:
+                self._finished += 1
+                self._callback(Progress(stage_name, True, self._finished / self._total))
+
+
+def derive_seed(seed: str, name: str) -> int:
+    """Derives an independent 64-bit seed for a named consumer of randomness.
+
+    :param seed: The seed for the whole randomization.
+    :param name: Name of the consumer (usually a stage name).
+    :return: The derived seed.
+    """
+    digest = hashlib.sha256(f"{seed}\x00{name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], byteorder="little", signed=False)
+
+
+class StageContext(object):
+    """Everything a stage is given besides its inputs."""
+
+    def __init__(self, stage_name: str, seed: str, flags: Flags):
+        self.stage_name = stage_name
+        self.seed = seed
+        self.flags = flags
+        self.rng = random.Random(derive_seed(seed, stage_name))
+
+    def derive_seed(self, name: str) -> int:
+        """Derives a seed for a helper (such as an InventoryGenerator) used by this stage."""
+        return derive_seed(self.seed, f"{self.stage_name}.{name}")
+
+
+class Stage(object):
+    """A single step of the randomizer pipeline.
+
+    A stage is a function that is called with a StageContext and one keyword argument for each of its inputs, and
+    returns a dictionary with exactly its outputs. Outputs whose names end in "_patches" are patch dictionaries.
+
+    Artifacts passed between stages must be treated as read-only. A stage that needs to modify data produced by
+    another stage (or read from the ROM) loads or builds its own copy.
+    """
+
+    def __init__(self, name: str, func, inputs: tuple = (), outputs: tuple = (), flags: tuple = (),
+                 uses_seed: bool = True, cacheable: bool = True):
+        """
+        :param name: Name of the stage. Also used to derive the stage's random number generator.
+        :param func: The function implementing the stage.
+        :param inputs: Names of the artifacts the stage reads.
+        :param outputs: Names of the artifacts the stage produces.
+        :param flags: Names of the Flags properties the stage reads.
+        :param uses_seed: False if the stage's outputs depend only on its inputs and flags, not on the seed.
+        :param cacheable: False if the stage's outputs should never be reused by a StageCache.
+        """
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.flags = tuple(flags)
+        self.uses_seed = uses_seed
+        self.cacheable = cacheable
+
+    def run(self, seed: str, flags: Flags, artifacts: dict) -> dict:
+        context = StageContext(self.name, seed, flags)
+        outputs = self.func(context, **{name: artifacts[name] for name in self.inputs})
+        if set(outputs.keys()) != set(self.outputs):
+            raise RuntimeError(f"Stage {self.name} produced {sorted(outputs.keys())}, expected {list(self.outputs)}")
+        return outputs
+
+    def cache_key(self, seed: str, flags: Flags, fingerprints: dict) -> str:
+        """Builds the key that identifies this stage's outputs for a given seed, flags, and set of inputs.
+
+        :param seed: Seed for the randomization.
+        :param flags: Flags for the randomization.
+        :param fingerprints: Fingerprints of (at least) every input of the stage.
+        :return: The key as a hex string.
+        """
+        parts = [f"stage={self.name}"]
+        if self.uses_seed:
+            parts.append(f"seed={seed}")
+        for flag in self.flags:
+            parts.append(f"flag:{flag}={getattr(flags, flag)!r}")
+        for name in self.inputs:
+            parts.append(f"input:{name}={fingerprints[name]}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+
+class StageCache(object):
+    """Memoizes the outputs of stages so they can be reused by later runs.
+
+    When the same seed is randomized again with a different set of flags, only the stages that read one of the
+    changed flags (or the output of such a stage) are run again. Everything else comes from the cache.
+
+    Cached outputs are shared between runs, which is safe as long as stages don't modify their inputs.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            outputs = self._entries.get(key)
+            if outputs is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return outputs
+
+    def put(self, key: str, outputs: dict):
+        with self._lock:
+            self._entries[key] = outputs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def fingerprint(value) -> str:
+    """Fingerprints an artifact that is passed into a pipeline (rather than produced by a stage).
+
+    :param value: The artifact. Must be bytes-like, a string or int, or have a `rom_data` attribute.
+    :return: The fingerprint as a hex string.
+    """
+    if hasattr(value, "rom_data"):
+        value = value.rom_data
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(value).hexdigest()
+    if isinstance(value, (str, int)):
+        return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()
+    raise RuntimeError(f"Can't fingerprint an artifact of type {type(value)}")
+
+
+class Pipeline(object):
+    """A set of stages, run in dependency order."""
+
+    def __init__(self, stages: list):
+        self._producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise RuntimeError(f"Artifact '{output}' is produced by both {self._producers[output].name} "
+                                       f"and {stage.name}")
+                self._producers[output] = stage
+        self._stages = Pipeline._sort(stages, self._producers)
+
+    def stages(self) -> list:
+        """Gets the stages in the order they run when run sequentially."""
+        return self._stages
+
+    def producer(self, artifact: str) -> Stage:
+        return self._producers.get(artifact)
+
+    def required_stages(self, targets: list = None) -> list:
+        """Gets the stages needed to produce a set of artifacts, in dependency order.
+
+        :param targets: Names of the artifacts wanted, or None for every stage.
+        :return: List of stages.
+        """
+        if targets is None:
+            return list(self._stages)
+
+        needed = set()
+        to_visit = list(targets)
+        while len(to_visit) > 0:
+            artifact = to_visit.pop()
+            stage = self._producers.get(artifact)
+            if stage is None or stage.name in needed:
+                continue
+            needed.add(stage.name)
+            to_visit.extend(stage.inputs)
+        return [stage for stage in self._stages if stage.name in needed]
+
+    def run(self, seed: str, flags: Flags, artifacts: dict, targets: list = None, timer: StageTimer = None,
+            max_workers: int = 1, cache: StageCache = None, fingerprints: dict = None, progress=None,
+            cancel: CancellationToken = None) -> dict:
+        """Runs the pipeline.
+
+        Since each stage has its own random number generator and outputs are only combined by later stages, the
+        result does not depend on the order independent stages finish in.
+
+        :param seed: Seed for the randomization.
+        :param flags: Flags for the randomization.
+        :param artifacts: Artifacts that are not produced by a stage, such as the "rom".
+        :param targets: Names of the artifacts wanted. Stages that don't contribute to them are skipped.
+        :param timer: Optional timer to record each stage with.
+        :param max_workers: Number of stages that may run at once. Ignored if the timer profiles memory, since
+                            tracemalloc can't tell concurrent stages apart.
+        :param cache: Optional cache to reuse stage outputs from, and save them to.
+        :param fingerprints: Optional precomputed fingerprints for the artifacts passed in. Only used with a cache.
+        :param progress: Optional function called with a Progress when each stage starts and ends. With more than
+                         one worker, it's called from the worker threads (one call at a time).
+        :param cancel: Optional token to stop the run with. It's checked before each stage starts; once it's
+                       cancelled, no more stages are started and Cancelled is raised when the running ones finish.
+        :return: A dictionary of every artifact, including the ones passed in.
+        """
+        artifacts = dict(artifacts)
+        timer = timer if timer is not None else StageTimer()
+        stages = self.required_stages(targets)
+        reporter = _ProgressReporter(progress, max(1, len(stages)))
+
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in artifacts and name not in self._producers:
+                    raise RuntimeError(f"Stage {stage.name} needs '{name}', which nothing provides")
+
+        if cache is not None:
+            fingerprints = dict(fingerprints) if fingerprints is not None else {}
+            for name, value in artifacts.items():
+                if name not in fingerprints:
+                    fingerprints[name] = fingerprint(value)
+
+        def stage_key(stage_to_run: Stage) -> str:
+            if cache is None:
+                return None
+            return stage_to_run.cache_key(seed, flags, fingerprints)
+
+        def finish(stage_key_used: str, outputs: dict):
+            artifacts.update(outputs)
+            if cache is not None:
+                for output in outputs.keys():
+                    fingerprints[output] = hashlib.sha256(f"{stage_key_used}:{output}".encode("utf-8")).hexdigest()
+
+        if max_workers <= 1 or timer.profile_memory:
+            for stage in stages:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                key = stage_key(stage)
+                finish(key, Pipeline._run_stage(stage, seed, flags, artifacts, timer, cache, key, reporter))
+            return artifacts
+
+        pending = list(stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                if cancel is not None and cancel.cancelled:
+                    # Let the stages that already started finish, so none is left running after the call returns.
+                    pending = []
+                for stage in list(pending):
+                    if all(name in artifacts for name in stage.inputs):
+                        pending.remove(stage)
+                        key = stage_key(stage)
+                        # Hand each stage its own view of the artifacts so later updates can't race with it, and
+                        # a copy of this thread's context so its log records are tagged like the caller's.
+                        future = executor.submit(contextvars.copy_context().run, Pipeline._run_stage, stage, seed,
+                                                 flags, dict(artifacts), timer, cache, key, reporter)
+                        running[future] = key
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result())
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        return artifacts
+
+    @staticmethod
+    def _run_stage(stage: Stage, seed: str, flags: Flags, artifacts: dict, timer: StageTimer,
+                   cache: StageCache = None, key: str = None, reporter: _ProgressReporter = None) -> dict:
+        if reporter is not None:
+            reporter.start(stage.name)
+        with timer.stage(stage.name) as record:
+            outputs = None
+            if cache is not None and stage.cacheable:
+                outputs = cache.get(key)
+                record.cached = outputs is not None
+
+            if outputs is None:
+                outputs = stage.run(seed, flags, artifacts)
+                if cache is not None and stage.cacheable:
+                    cache.put(key, outputs)
+
+            for name, value in outputs.items():
+                if name.endswith("_patches") and value is not None:
+                    record.bytes_patched += patch_size(value)
+        if reporter is not None:
+            reporter.finish(stage.name)
+        return outputs
+
+    @staticmethod
+    def _sort(stages: list, producers: dict) -> list:
+        # Kahn's algorithm, using the declaration order to break ties so the sequential order is stable.
+        remaining = list(stages)
+        done = set()
+        ordered = []
+        while len(remaining) > 0:
+            for stage in remaining:
+                dependencies = [producers[name] for name in stage.inputs if name in producers]
+                if all(dependency.name in done for dependency in dependencies):
+                    break
+            else:
+                raise RuntimeError(f"Stages have a dependency cycle: {remaining}")
+            remaining.remove(stage)
+            done.add(stage.name)
+            ordered.append(stage)
+        return ordered
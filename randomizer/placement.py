@@ -18,6 +18,50 @@ from doslib.dos_utils import resolve_path
 from doslib.item import Item
 from doslib.items import Items
 
+ClingoPlacement = namedtuple("ClingoPlacement", ["reward", "source"])
+
+# The ASP programs that key item placements are solved from.
+PROGRAM_FILES = ("asp/KeyItemSolvingShip.lp", "asp/KeyItemDataShip.lp")
+
+
+class PlandoError(RuntimeError):
+    """Raised when pinned or forbidden key item pairs name something that doesn't exist, or can't all hold in a
+    beatable placement."""
+
+    def __init__(self, message: str, pinned: tuple = (), forbidden: tuple = ()):
+        """
+        :param message: What went wrong.
+        :param pinned: The pinned pairs at fault.
+        :param forbidden: The forbidden pairs at fault.
+        """
+        super().__init__(message)
+        self.pinned = pinned
+        self.forbidden = forbidden
+
+
+class PlandoConflict(PlandoError):
+    """Raised when pinned and forbidden key item pairs are well-formed and name key items and locations that exist,
+    but can't all hold in a beatable placement."""
+
+
+def parse_pairs(values: list) -> tuple:
+    """Parses key item pairs written as "item:location", such as "excalibur:king".
+
+    :param values: The pairs.
+    :return: Sorted tuple of ClingoPlacement.
+    """
+    pairs = set()
+    for value in values:
+        reward, separator, source = value.partition(":")
+        if separator == "" or reward == "" or source == "":
+            raise PlandoError(f"Expected item:location, not '{value}'")
+        pairs.add(ClingoPlacement(reward.strip(), source.strip()))
+    return tuple(sorted(pairs))
+
+
+def format_pairs(pairs: tuple) -> str:
+    return ", ".join(f"{pairing.reward}:{pairing.source}" for pairing in pairs)
+
 PlacementDetails = namedtuple("Placement",
                               ['source', 'type', 'sprite', 'movable', 'zone', 'map_id', 'index', 'sprite_index',
                                'ship_x', 'ship_y', 'airship_x', 'airship_y', 'reward', 'reward_text_id',
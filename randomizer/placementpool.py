@@ -0,0 +1,343 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from doslib.dos_utils import resolve_path
+from randomizer.bitsetsolver import get_solver as get_bitset_solver
+from randomizer.placement import ClingoPlacement, PROGRAM_FILES
+from stream.inputstream import InputStream
+from stream.outputstream import OutputStream
+
+logger = logging.getLogger(__name__)
+
+# Where `randomize()` looks for a pool, relative to the repository. Built with `python -m randomizer.placementpool`.
+POOL_PATH = "data/KeyItemPlacementPool.bin"
+
+POOL_MAGIC = b"KIPP"
+POOL_FORMAT_VERSION = 1
+
+# Identifies placements that were solved live, rather than taken from a pool.
+LIVE_SOLVE = "clingo"
+
+
+def program_hashes(programs: tuple = PROGRAM_FILES) -> tuple:
+    """Hashes the key item programs.
+
+    :param programs: Paths of the programs, relative to the repository.
+    :return: Tuple of (path, SHA-256 digest) for each program.
+    """
+    hashes = []
+    for program in programs:
+        with open(resolve_path(program), "rb") as program_file:
+            hashes.append((program, hashlib.sha256(program_file.read()).digest()))
+    return tuple(hashes)
+
+
+class PlacementPool(object):
+    """Key item placements that were solved ahead of time, so randomizing doesn't need clingo.
+
+    The file starts with "KIPP", the format version and the size of the header. The header names each .lp program
+    the placements were solved from, with its hash, and lists the names of the rewards and sources. Each placement
+    follows as a fixed-size record of (reward, source) index pairs, so looking one up is a slice of the file,
+    whatever the size of the pool.
+    """
+
+    def __init__(self, data: bytes):
+        """
+        :param data: Contents of a pool file.
+        """
+        if data[:4] != POOL_MAGIC:
+            raise RuntimeError("Not a key item placement pool")
+        stream = InputStream(bytearray(data[4:12]))
+        version = stream.get_u32()
+        if version != POOL_FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported placement pool version {version}")
+        header_size = stream.get_u32()
+
+        stream = InputStream(bytearray(data[12:header_size]), check_alignment=False)
+        self.program_hashes = tuple((_get_name(stream), _get_bytes(stream, 32)) for _ in range(stream.get_u32()))
+        self._rewards = [_get_name(stream) for _ in range(stream.get_u32())]
+        self._sources = [_get_name(stream) for _ in range(stream.get_u32())]
+        self._pairs = stream.get_u32()
+        self._count = stream.get_u32()
+        self._entries = memoryview(data)[header_size:]
+        if len(self._entries) != self._count * self._pairs * 2:
+            raise RuntimeError("Placement pool is truncated")
+        self.digest = hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def load(path: str):
+        with open(path, "rb") as pool_file:
+            return PlacementPool(pool_file.read())
+
+    def is_current(self, programs: tuple = PROGRAM_FILES) -> bool:
+        """Checks whether the pool was solved from the programs as they are now."""
+        return self.program_hashes == program_hashes(programs)
+
+    def __len__(self):
+        return self._count
+
+    def placement(self, index: int) -> tuple:
+        """Gets a placement.
+
+        :param index: Index of the placement.
+        :return: The placement, as `KeyItemSolver.solve` would return it.
+        """
+        start = index * self._pairs * 2
+        entry = self._entries[start:start + self._pairs * 2]
+        return tuple(ClingoPlacement(self._rewards[entry[pair]], self._sources[entry[pair + 1]])
+                     for pair in range(0, len(entry), 2))
+
+    def item_matrix(self, items: list, locations: list):
+        """Gets every placement in the pool at once, as the array `BitsetSolver.validate_batch` takes. Needs NumPy.
+
+        :param items: Names of the items, in the order of the item indexes.
+        :param locations: Names of the locations, in the order of the columns.
+        :return: A NumPy array with a row for each placement, holding the item index at each location (-1 where a
+                 placement leaves a location empty).
+        """
+        import numpy
+
+        if sorted(self._rewards) != sorted(items) or sorted(self._sources) != sorted(locations):
+            raise RuntimeError("The pool places different items or locations")
+        item_index = numpy.array([items.index(reward) for reward in self._rewards], dtype=numpy.int64)
+        location_index = numpy.array([locations.index(source) for source in self._sources], dtype=numpy.int64)
+
+        entries = numpy.frombuffer(self._entries, dtype=numpy.uint8).reshape(self._count, self._pairs, 2)
+        matrix = numpy.full((self._count, len(locations)), -1, dtype=numpy.int64)
+        matrix[numpy.arange(self._count)[:, None], location_index[entries[:, :, 1]]] = item_index[entries[:, :, 0]]
+        return matrix
+
+
+def _get_bytes(stream: InputStream, length: int) -> bytes:
+    return bytes(stream.get_u8() for _ in range(length))
+
+
+def _get_name(stream: InputStream) -> str:
+    return _get_bytes(stream, stream.get_u8()).decode("utf-8")
+
+
+def _put_name(stream: OutputStream, name: str):
+    encoded = name.encode("utf-8")
+    stream.put_u8(len(encoded))
+    stream.put_bytes(encoded)
+
+
+_pool = None
+_pool_loaded = False
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PlacementPool:
+    """Gets the pool at POOL_PATH, loading it the first time it's called.
+
+    :return: The pool, or None if there isn't one or it was solved from older versions of the programs.
+    """
+    global _pool, _pool_loaded
+    with _pool_lock:
+        if not _pool_loaded:
+            _pool_loaded = True
+            path = resolve_path(POOL_PATH)
+            if os.path.exists(path):
+                pool = PlacementPool.load(path)
+                if pool.is_current():
+                    _pool = pool
+                else:
+                    logger.warning("%s is out of date; key items will be solved with clingo", POOL_PATH)
+        return _pool
+
+
+def reload_pool():
+    """Forgets the loaded pool, so the next call to `get_pool` loads it again."""
+    global _pool, _pool_loaded
+    with _pool_lock:
+        _pool = None
+        _pool_loaded = False
+
+
+def placement_source() -> str:
+    """Identifies where key item placements come from: the pool's digest, or LIVE_SOLVE.
+
+    The same seed gives a different placement from a pool than from a live solve, so anything that stores results
+    (such as a ResultCache) must tell them apart.
+    """
+    pool = get_pool()
+    return pool.digest if pool is not None else LIVE_SOLVE
+
+
+def solve_placement(solver_seed: int, pinned: tuple = (), forbidden: tuple = ()) -> tuple:
+    """Gets the key item placement for a solver seed, from the pool if there is a current one, otherwise from clingo.
+
+    Placements with pinned or forbidden pairs are always solved live. If clingo reaches one of its SolverLimits,
+    `randomizer.clingo.SolverLimitReached` is raised: any other placement would be different from the one the seed
+    gets without limits, and would be cached as if it were the seed's.
+
+    :param solver_seed: 32-bit solver seed.
+    :param pinned: Pairs (ClingoPlacement) the placement must contain.
+    :param forbidden: Pairs the placement must not contain.
+    :return: The placement.
+    """
+    pool = get_pool()
+    if pool is not None and len(pinned) == 0 and len(forbidden) == 0:
+        return pool.placement(solver_seed % len(pool))
+
+    # clingo is only needed without a pool, so don't require it otherwise.
+    from randomizer.clingo import solve_placement_for_seed
+    return solve_placement_for_seed(solver_seed, pinned, forbidden)
+
+
+def validate_placement(placement: tuple, rewards: list, sources: list):
+    """Checks that a placement pairs every reward with exactly one source, and the other way around."""
+    placed_rewards = sorted(pairing.reward for pairing in placement)
+    placed_sources = sorted(pairing.source for pairing in placement)
+    if placed_rewards != sorted(rewards) or placed_sources != sorted(sources):
+        raise RuntimeError(f"Invalid placement: {placement}")
+
+
+def validate_pool(pool: PlacementPool) -> list:
+    """Checks that every placement in a pool is beatable under the programs as they are now, with
+    `BitsetSolver.validate_batch`. Needs NumPy.
+
+    :param pool: The pool.
+    :return: Indexes of the placements that aren't.
+    """
+    solver = get_bitset_solver()
+    valid = solver.validate_batch(pool.item_matrix(solver.items, solver.locations))
+    return [int(index) for index in (~valid).nonzero()[0]]
+
+
+def _solve(seed: int) -> tuple:
+    from randomizer.clingo import solve_placement_for_seed
+    return solve_placement_for_seed(seed)
+
+
+def build_pool(path: str, count: int, max_workers: int = None) -> int:
+    """Solves distinct placements for solver seeds 0, 1, 2... and writes them to a pool file.
+
+    :param path: Path to write the pool to.
+    :param count: Number of placements in the pool.
+    :param max_workers: Number of processes to solve in. 1 solves in this process.
+    :return: The number of seeds solved, including the ones whose placement was a duplicate.
+    """
+    placements = []
+    seen = set()
+    seed = 0
+
+    def add(placement: tuple):
+        key = frozenset(placement)
+        if key not in seen and len(placements) < count:
+            seen.add(key)
+            placements.append(placement)
+
+    if max_workers == 1:
+        while len(placements) < count:
+            add(_solve(seed))
+            seed += 1
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while len(placements) < count:
+                batch = range(seed, seed + count - len(placements))
+                for placement in executor.map(_solve, batch, chunksize=64):
+                    add(placement)
+                seed = batch.stop
+
+    write_pool(path, placements)
+    return seed
+
+
+def write_pool(path: str, placements: list):
+    """Writes placements to a pool file, along with the hashes of the programs as they are now.
+
+    :param path: Path to write the pool to.
+    :param placements: The placements. Each must place the same rewards at the same sources.
+    """
+    rewards = sorted({pairing.reward for pairing in placements[0]})
+    sources = sorted({pairing.source for pairing in placements[0]})
+    if len(rewards) > 0x100 or len(sources) > 0x100:
+        raise RuntimeError("Too many rewards or sources for a placement pool")
+    reward_index = {reward: index for index, reward in enumerate(rewards)}
+    source_index = {source: index for index, source in enumerate(sources)}
+
+    body = OutputStream()
+    hashes = program_hashes()
+    body.put_u32(len(hashes))
+    for program, digest in hashes:
+        _put_name(body, program)
+        body.put_bytes(digest)
+    for names in (rewards, sources):
+        body.put_u32(len(names))
+        for name in names:
+            _put_name(body, name)
+    body.put_u32(len(rewards))
+    body.put_u32(len(placements))
+    header_size = 12 + body.size()
+
+    for placement in placements:
+        validate_placement(placement, rewards, sources)
+        for pairing in placement:
+            body.put_u8(reward_index[pairing.reward])
+            body.put_u8(source_index[pairing.source])
+
+    pool = OutputStream()
+    pool.put_bytes(POOL_MAGIC)
+    pool.put_u32(POOL_FORMAT_VERSION)
+    pool.put_u32(header_size)
+    pool.put_bytes(body.get_buffer())
+
+    # Write to a temporary file first so a running randomizer never sees a partial pool.
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as pool_file:
+            pool_file.write(pool.get_buffer())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solves a pool of key item placements ahead of time.")
+    parser.add_argument("--count", type=int, default=65536, help="Number of placements in the pool")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes to solve in")
+    parser.add_argument("--output", default=None, help=f"Path of the pool (defaults to {POOL_PATH})")
+    parser.add_argument("--validate", action="store_true",
+                        help="Check that every placement in an existing pool is still beatable, instead of solving "
+                             "a new one (needs NumPy)")
+    parsed = parser.parse_args()
+
+    path = parsed.output if parsed.output is not None else resolve_path(POOL_PATH)
+    if parsed.validate:
+        pool = PlacementPool.load(path)
+        invalid = validate_pool(pool)
+        print(f"{len(pool) - len(invalid)} of {len(pool)} placements in {path} are beatable")
+        for index in invalid[:20]:
+            print(f"  {index}: {pool.placement(index)}")
+        return 1 if len(invalid) > 0 else 0
+
+    solved = build_pool(path, parsed.count, parsed.workers)
+    print(f"Wrote {parsed.count} placements ({solved} seeds solved) to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+
+from randomizer.bitsetsolver import BitsetSolver
+from randomizer.placement import PROGRAM_FILES
+from randomizer.placementpool import program_hashes
+
+logger = logging.getLogger(__name__)
+
+# Where reports are cached by default. Reports are keyed by the hashes of the .lp files, so editing the logic never
+# hands out an old report.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ffr-dos", "placement-stats")
+
+# Fewer beatable samples than this make the estimated count (and the uniform frequencies) too rough to rely on.
+MIN_BEATABLE = 100
+
+
+def estimate_count(solver: BitsetSolver, samples: int, seed: int = 0) -> dict:
+    """Estimates how many placements the programs allow, by checking uniformly random placements.
+
+    Each sample puts the items that aren't fixed at the other locations in a uniformly random order, and checks
+    whether every item can be reached. The share of samples that can, times the number of such orders, estimates the
+    count without bias. The beatable samples are a uniform sample of every allowed placement, so how often each item
+    lands at each location among them is what an unbiased sampler would give.
+
+    :param solver: Solver compiled from the programs.
+    :param samples: Number of random placements to check.
+    :param seed: Seed for the random placements.
+    :return: Dictionary of the estimated count, its standard error, the share of placements that are beatable, and
+             the item x location frequency matrix of the beatable ones.
+    """
+    rng = random.Random(seed)
+    fixed = solver.fixed
+    open_locations = [location for location in range(len(solver.locations)) if location not in fixed]
+    free_items = [item for item in range(len(solver.items)) if item not in fixed.values()]
+
+    beatable = 0
+    frequencies = [[0] * len(solver.locations) for _ in solver.items]
+    item_at = [None] * len(solver.locations)
+    for location, item in fixed.items():
+        item_at[location] = item
+    for _ in range(samples):
+        rng.shuffle(free_items)
+        for location, item in zip(open_locations, free_items):
+            item_at[location] = item
+        if solver.is_reachable(item_at):
+            beatable += 1
+            for location, item in enumerate(item_at):
+                frequencies[item][location] += 1
+
+    orders = math.factorial(len(free_items))
+    share = beatable / samples
+    return {
+        "count": share * orders,
+        "standard_error": math.sqrt(share * (1.0 - share) / samples) * orders,
+        "beatable_share": share,
+        "samples": samples,
+        "frequencies": frequencies
+    }
+
+
+def frequency_matrix(solve, items: list, locations: list, samples: int) -> list:
+    """Counts how often each item lands at each location.
+
+    :param solve: Function that solves the placement for a solver seed.
+    :param items: Names of the items, in the order of the rows.
+    :param locations: Names of the locations, in the order of the columns.
+    :param samples: Number of solver seeds (0, 1, 2...) to solve.
+    :return: Matrix (a list of rows) of the number of placements with each item at each location.
+    """
+    item_index = {item: index for index, item in enumerate(items)}
+    location_index = {location: index for index, location in enumerate(locations)}
+    matrix = [[0] * len(locations) for _ in items]
+    for seed in range(samples):
+        for pairing in solve(seed):
+            matrix[item_index[pairing.reward]][location_index[pairing.source]] += 1
+    return matrix
+
+
+def build_report(programs: tuple = PROGRAM_FILES, samples: int = 1000, count_samples: int = 100000,
+                 exact_time_limit: float = None, seed: int = 0) -> dict:
+    """Analyzes the placements the programs allow.
+
+    :param programs: Paths of the ASP programs, relative to the repository.
+    :param samples: Number of solver seeds to solve with clingo for the frequency matrix. 0 skips it.
+    :param count_samples: Number of random placements for `estimate_count`.
+    :param exact_time_limit: Seconds to enumerate placements for an exact count, or None to skip it.
+    :param seed: Seed for `estimate_count`.
+    :return: The report, as a JSON-compatible dictionary.
+    """
+    solver = BitsetSolver(programs)
+    report = {
+        "programs": {program: digest.hex() for program, digest in program_hashes(programs)},
+        "items": solver.items,
+        "locations": solver.locations,
+        "estimate": estimate_count(solver, count_samples, seed)
+    }
+    if exact_time_limit is None and samples == 0:
+        return report
+
+    # Only the exact count and the solver's frequencies need clingo.
+    from randomizer.clingo import KeyItemSolver
+    clingo_solver = KeyItemSolver(programs)
+    try:
+        if exact_time_limit is not None:
+            count, complete = clingo_solver.count_placements(exact_time_limit)
+            report["exact"] = {"count": count, "complete": complete}
+        if samples > 0:
+            report["solver"] = {
+                "samples": samples,
+                "frequencies": frequency_matrix(clingo_solver.solve, solver.items, solver.locations, samples)
+            }
+    finally:
+        clingo_solver.close()
+    return report
+
+
+def skew(report: dict) -> list:
+    """Compares how often clingo puts each item at each location with how often a uniform sampler would.
+
+    :param report: Report from `build_report`, with solver frequencies.
+    :return: List of (item, location, solver share, uniform share), most over- or under-represented first.
+    """
+    solved = report["solver"]["samples"]
+    uniform = max(1, round(report["estimate"]["beatable_share"] * report["estimate"]["samples"]))
+    differences = []
+    for row, item in enumerate(report["items"]):
+        for column, location in enumerate(report["locations"]):
+            differences.append((item, location, report["solver"]["frequencies"][row][column] / solved,
+                                report["estimate"]["frequencies"][row][column] / uniform))
+    return sorted(differences, key=lambda difference: -abs(difference[2] - difference[3]))
+
+
+def get_report(programs: tuple = PROGRAM_FILES, samples: int = 1000, count_samples: int = 100000,
+               exact_time_limit: float = None, seed: int = 0, cache_dir: str = DEFAULT_CACHE_DIR,
+               refresh: bool = False) -> dict:
+    """Gets a report (see `build_report` for the parameters), from the cache if one was built from the same programs
+    with the same parameters.
+
+    :param cache_dir: Directory of cached reports, or None to not cache the report.
+    :param refresh: Build the report again even if it's cached.
+    :return: The report.
+    """
+    key = report_key(programs, samples=samples, count_samples=count_samples, exact_time_limit=exact_time_limit,
+                     seed=seed)
+    if cache_dir is not None and not refresh:
+        report = load_report(cache_dir, key)
+        if report is not None:
+            logger.debug("Using the cached report %s", key)
+            return report
+
+    report = build_report(programs, samples, count_samples, exact_time_limit, seed)
+    if cache_dir is not None:
+        store_report(cache_dir, key, report)
+    return report
+
+
+def report_key(programs: tuple, **parameters) -> str:
+    """Builds the key a report is cached under: the hashes of the programs, and the parameters of the report."""
+    parts = [f"program:{program}={digest.hex()}" for program, digest in program_hashes(programs)]
+    parts += [f"{name}={value!r}" for name, value in sorted(parameters.items())]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_report(cache_dir: str, key: str) -> dict:
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as report_file:
+        return json.load(report_file)
+
+
+def store_report(cache_dir: str, key: str, report: dict):
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so a concurrent report never reads a partial one.
+    handle, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "w") as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+        os.replace(temp_path, os.path.join(cache_dir, f"{key}.json"))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports how many key item placements the logic allows, and how "
+                                                 "clingo samples them.")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="Number of solver seeds to solve for the item x location frequencies (0 to skip)")
+    parser.add_argument("--count-samples", dest="count_samples", type=int, default=100000,
+                        help="Number of random placements to estimate the number of placements from")
+    parser.add_argument("--exact", type=float, default=None, metavar="SECONDS",
+                        help="Also count placements exactly, by enumerating them for at most this long")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random placements")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Directory to cache reports in (defaults to {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--refresh", action="store_true", help="Build the report again, even if it's cached")
+    parser.add_argument("--json", default=None, help="Also write the whole report to this file")
+    parser.add_argument("--top", type=int, default=10, help="Number of skewed pairs to list")
+    parsed = parser.parse_args()
+
+    report = get_report(samples=parsed.samples, count_samples=parsed.count_samples, exact_time_limit=parsed.exact,
+                        seed=parsed.seed, cache_dir=parsed.cache_dir, refresh=parsed.refresh)
+
+    estimate = report["estimate"]
+    beatable = round(estimate["beatable_share"] * estimate["samples"])
+    if beatable == 0:
+        print(f"Placements: unknown; none of {estimate['samples']} random placements are beatable")
+    else:
+        print(f"Placements: about {estimate['count']:.4g} (standard error {estimate['standard_error']:.2g}, "
+              f"{estimate['standard_error'] / estimate['count'] * 100:.1f}%); {beatable} "
+              f"({estimate['beatable_share'] * 100:.2g}%) of {estimate['samples']} random placements are beatable")
+    if beatable < MIN_BEATABLE:
+        logger.warning("Only %d random placements were beatable, so the estimate is rough; use more --count-samples",
+                       beatable)
+    if "exact" in report:
+        exact = report["exact"]
+        print(f"Enumerated: {exact['count']}" + ("" if exact["complete"] else " (ran out of time; a lower bound)"))
+    if "solver" in report:
+        print(f"Most skewed pairs over {report['solver']['samples']} solver seeds (clingo vs. uniform):")
+        for item, location, solver_share, uniform_share in skew(report)[:parsed.top]:
+            print(f"  {item:>14} at {location:<18} {solver_share * 100:5.1f}% vs. {uniform_share * 100:5.1f}%")
+
+    if parsed.json is not None:
+        with open(parsed.json, "w") as json_file:
+            json.dump(report, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
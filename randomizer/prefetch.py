@@ -0,0 +1,135 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from randomizer.flags import Flags
+from randomizer.pipeline import Stage, StageCache
+from randomizer.randomize import RANDOMIZE_PIPELINE
+
+logger = logging.getLogger(__name__)
+
+_system_random = random.SystemRandom()
+
+
+def random_seed() -> str:
+    """Draws a seed the way the web page does: a random 32-bit number, in hex."""
+    return f"{_system_random.getrandbits(32):x}"
+
+
+class PlacementPrefetcher(object):
+    """Solves the key item placements of random seeds before anyone asks for them.
+
+    A background thread keeps a bounded queue of seeds whose placements are already solved. `next_seed` pops one
+    and puts its placement into the StageCache that requests randomize with, so randomizing that seed (with key
+    items shuffled) skips the solve. If the queue is empty, `next_seed` draws a seed that hasn't been solved yet.
+    """
+
+    def __init__(self, cache: StageCache, depth: int = 16, seed_factory=random_seed, stage: Stage = None,
+                 latency_window: int = 100):
+        """
+        :param cache: The StageCache requests randomize with.
+        :param depth: Number of solved seeds to keep ready.
+        :param seed_factory: Function that draws a new seed.
+        :param stage: The stage to run ahead of time. Defaults to the key item placement stage.
+        :param latency_window: Number of recent refills that the latency metrics cover.
+        """
+        self._cache = cache
+        self._seed_factory = seed_factory
+        self._stage = stage if stage is not None else RANDOMIZE_PIPELINE.producer("key_item_solution")
+        self._flags = Flags()
+        self._flags.no_shuffle = False
+        self._ready = queue.Queue(maxsize=depth)
+        self._depth = depth
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._refill_ns = deque(maxlen=latency_window)
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        """Starts the background thread."""
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._refill, name="placement-prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the background thread, once it finishes the seed it's solving."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def next_seed(self) -> str:
+        """Gets a random seed, whose placement is ready in the cache if the queue wasn't empty.
+
+        :return: The seed.
+        """
+        try:
+            seed, outputs = self._ready.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+            return self._seed_factory()
+
+        self._cache.put(self._stage.cache_key(seed, self._flags, {}), outputs)
+        with self._lock:
+            self.hits += 1
+        return seed
+
+    def metrics(self) -> dict:
+        """Gets the depth of the queue, how often it was empty, and how long recent refills took."""
+        with self._lock:
+            refill_ms = [elapsed / 1e6 for elapsed in self._refill_ns]
+            hits, misses = self.hits, self.misses
+        return {
+            "queue_depth": self._ready.qsize(),
+            "queue_capacity": self._depth,
+            "hits": hits,
+            "misses": misses,
+            "refill_ms": {
+                "count": len(refill_ms),
+                "last": refill_ms[-1] if len(refill_ms) > 0 else None,
+                "mean": sum(refill_ms) / len(refill_ms) if len(refill_ms) > 0 else None,
+                "max": max(refill_ms) if len(refill_ms) > 0 else None
+            }
+        }
+
+    def _refill(self):
+        while not self._stopped.is_set():
+            seed = self._seed_factory()
+            start = time.monotonic_ns()
+            try:
+                outputs = self._stage.run(seed, self._flags, {})
+            except Exception:
+                logger.exception("Prefetching seed %s failed", seed)
+                self._stopped.wait(1.0)
+                continue
+            with self._lock:
+                self._refill_ns.append(time.monotonic_ns() - start)
+
+            # Wait for room in the queue, but give up as soon as the prefetcher is stopped.
+            while not self._stopped.is_set():
+                try:
+                    self._ready.put((seed, outputs), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
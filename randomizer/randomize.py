@@ -12,10 +12,10 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import logging
 import os
 import random
 from collections import namedtuple
-from copy import deepcopy
 
 from doslib.classes import JobClass
 from doslib.dos_utils import load_tsv, resolve_path
@@ -26,23 +26,30 @@ from doslib.item import Item, Weapon
 from doslib.items import Items
 from doslib.map import Npc
 from doslib.maps import Maps, MapFeatures, TreasureChest, ItemChest, MoneyChest
-from doslib.rom import Rom
+from doslib.rom import FreeBlock, Rom
 from doslib.shopdata import ShopData
 from doslib.spells import Spells
 from doslib.textblock import TextBlock
-from event.easm import parse, link
-from event.epp import pparse
-from randomizer.clingo import solve_placement_for_seed
+from event.easm import link
+from event.icodecache import get_icode_cache
 from randomizer.credits import add_credits
 from randomizer.flags import Flags
 from randomizer.hacks import trivial_enemies, enable_early_magic_buy
 from randomizer.ipsfile import load_ips_files
+from randomizer.logs import log_context
 from randomizer.placement import Placement, PlacementDetails
+from randomizer.placementpool import solve_placement
 from randomizer.spellgenerator import SpellGenerator
+from randomizer.spoiler import write_spoiler
+from randomizer.pipeline import CancellationToken, Pipeline, Stage, StageCache, StageContext
+from randomizer.timing import StageTimer
 from randomizer.treasure import InventoryGenerator
+from randomizer.bitsetsolver import get_solver as get_bitset_solver
 from randomizer.bossshuffle import BossData
 from stream.outputstream import OutputStream
 
+logger = logging.getLogger(__name__)
+
 VehiclePosition = namedtuple("VehiclePosition", ["x", "y"])
 
 
@@ -282,7 +289,8 @@ def randomize_treasure(rng: random.Random, maps: Maps, chests: list, inventory_g
 
 
 def spell_shuffle(maps: Maps, shops: ShopData, spells: Spells, spell_generator: SpellGenerator):
-    original_spells = deepcopy(spells)
+    # Only the price and MP cost of the original spells are needed, so copy just the spell data.
+    original_spells = [spell.replace() for spell in spells.spell_data]
     for map_index in range(1, 0x76):
         map_features = maps.get_map(map_index)
         if len(map_features.shops) < 1:
@@ -304,7 +312,7 @@ def spell_shuffle(maps: Maps, shops: ShopData, spells: Spells, spell_generator:
             for slot_index in range(0, len(shop_inventories.magic)):
                 spell_index = shop_inventories.magic[slot_index]
                 spell = spell_generator.get_inventory(map_index, school)
-                orig_spell = original_spells.spell_data[spell_index]
+                orig_spell = original_spells[spell_index]
 
                 # Put the spell for sale in this shop
                 new_inventory.append(spell.spell_index)
@@ -397,22 +405,32 @@ def load_event_scripts() -> dict:
     return scripts
 
 
+# Scripts that were already read, by path, along with the modification time they were read at.
+_script_files = {}
+
+
 def parse_script(script: str) -> dict:
+    path = resolve_path(script)
+    mtime = os.stat(path).st_mtime_ns
+    if path in _script_files and _script_files[path][0] == mtime:
+        return dict(_script_files[path][1])
+
     events = {}
     script_id = None
-    script_code = ""
-    with open(resolve_path(script), "r") as script_text:
+    script_lines = []
+    with open(path, "r") as script_text:
         for line in script_text.readlines():
             if line.startswith("begin script="):
                 if script_id is not None:
-                    events[script_id] = script_code
-                    script_code = ""
+                    events[script_id] = "".join(script_lines)
+                    script_lines = []
                 script_id = int(line[line.find("=") + 1:], 0)
             elif script_id is not None:
-                script_code += line
+                script_lines.append(line)
     if script_id is not None:
-        events[script_id] = script_code
-    return events
+        events[script_id] = "".join(script_lines)
+    _script_files[path] = (mtime, events)
+    return dict(events)
 
 
 def build_headers(placements: Placement, start_cmds: str) -> str:
@@ -477,155 +495,35 @@ def pick_gear_reward(rng: random.Random, gear_placement: PlacementDetails,
     return choice
 
 
-def randomize(rom_data: bytearray, seed: str, flags: Flags) -> bytearray:
-    print(f"Randomizing with seed {seed}, {flags.encode()}")
-    # Start with the list of standard patches to improve gameplay.
-    all_patches = load_ips_files("patches/DataPointerConsolidation.ips",
-                                 "patches/Earth__CitadelMap.ips",
-                                 "patches/EventUpdates.ips",
-                                 "patches/FF1EncounterToggle.ips",
-                                 "patches/ImprovedEquipmentStatViewing.ips",
-                                 "patches/NoEscape.ips",
-                                 "patches/RunningChange.ips",
-                                 "patches/SpellLevelFix.ips",
-                                 "patches/SpriteFrameLoaderFix.ips",
-                                 "patches/StatusScreenExpansion.ips")
-    all_patches.update(enable_early_magic_buy())
-
-    rom = Rom(rom_data)
-
-    rng = random.Random()
-    rng.seed(seed)
-
-    event_text_block = EventTextBlock(rom)
-    shop_data = ShopData(rom)
-    spells = Spells(rom)
-    chest_data = load_chests(rom)
-    map_features = Maps(rom)
-    boss_data = BossData(rom)
-    vehicle_starts = load_vehicle_starts(rom)
-    encounters = load_encounter_data(rom)
-
-    items = Items(rom, flags.new_items)
-    enemy_data = load_enemy_data(rom, items, flags.fiend_ribbons)
-
-    # Don't load formation data (since we don't do anything with it)
-    # load_formation_data(rom, enemy_data)
-
-    encounter_regions = EncounterRegions(rom)
-    for region in encounter_regions.overworld_regions:
-        rng.shuffle(region)
-    for region in encounter_regions.map_encounters:
-        rng.shuffle(region)
-
-    if not flags.boss_shuffle:
-        boss_data.randomize_bosses(encounters, enemy_data, rng)
-
-    classes_data = load_class_data(rom)
-
-    inventory_generator = InventoryGenerator(seed, items, flags.new_items)
-    if not flags.standard_shops:
-        randomize_shops(rng, map_features, shop_data, inventory_generator)
-
-        spell_generator = SpellGenerator(seed, spells)
-        spell_shuffle(map_features, shop_data, spells, spell_generator)
-
-    inventory_generator.update_with_new_shops(shop_data)
-    if not flags.standard_treasure:
-        randomize_treasure(rng, map_features, chest_data, inventory_generator)
-
-    if not flags.default_start_gear:
-        base_weapons = []
-        base_armors = []
-
-        # Find weapons & armor that can be used by the base classes
-        # Also cap the power level of the gear
-        for weapon in items.get_by_type("weapon"):
-            if weapon.id > 0 and weapon.equip_classes & 0x003f != 0:
-                base_weapons.append(weapon)
-        for armor in items.get_by_type("armor"):
-            if 0x1b >= armor.id > 0 != armor.equip_classes & 0x003f:
-                base_armors.append(armor)
-
-        class_bit = 0x1
-        for class_data in classes_data:
-            class_weapons = []
-            class_armors = []
-            for weapon in base_weapons:
-                if weapon.equip_classes & class_bit != 0:
-                    class_weapons.append(weapon)
-            for armor in base_armors:
-                if armor.equip_classes & class_bit != 0:
-                    class_armors.append(armor)
-            class_data.weapon_id = rng.choice(class_weapons).id
-            class_data.armor_id = rng.choice(class_armors).id
-            class_bit = class_bit << 1
-
-        all_patches.update(pack_class_data(classes_data))
-
-    if flags.scale_levels != 1.0:
-        level_reqs = load_xp_requirements(rom)
-        scaled_level_reqs = []
-        for level_req in level_reqs:
-            scaled_level_reqs.append(int(level_req * flags.scale_levels))
-        all_patches.update(pack_xp_requirements(scaled_level_reqs))
-
-    # Do some basic updates to the maps
-    map_updates(map_features)
-
-    # String to insert for free items at the start (usually the ship + bridge)
-    free_header = ""
-
-    # Update game strings -- do this _before_ updating placements or the strings for gear won't replace them.
-    update_strings(event_text_block)
-
-    # Are Key Items being shuffled? If so, figure out their placement.
-    placement = Placement()
-    if not flags.no_shuffle:
-        free_items = ["bridge", "ship"]
-
-        rng = random.Random()
-        rng.seed(seed)
-        clingo_placements = solve_placement_for_seed(rng.randint(0, 0xffffffff))
-        placement.update_placements(clingo_placements)
-
-        # The key feature of HMS Janye is starting with the Ship (the HMS Janye), so move the ship to Cornelia harbor.
-        vehicle_starts["ship"] = VehiclePosition(x=2328, y=2600)
-
-        # At the moment it doesn't really matter, but we only want to give the free items once when the game
-        # starts, which would allow us to give a starter pack at some point. To do this check, we need to
-        # check for a particular plot flag.
-        # This check _could_ be made to work even without any free key items, but since this is HMS Jayne anyway,
-        # I'll keep the logic simple by assuming we have access to at least one.
-        start_flag = None
-
-        # If a given placement is "free", put a piece of gear in its place
-        free_cmds = []
-        for ki_placement in placement.all_placements():
-            if ki_placement.reward in free_items:
-                # Before replacing the item, grab the commands needed to give the item
-                if ki_placement.plot_flag is not None:
-                    free_cmds.append(f"set_flag {hex(ki_placement.plot_flag)}")
-                    start_flag = ki_placement.plot_flag if start_flag is None else start_flag
-                if ki_placement.plot_item is not None:
-                    free_cmds.append(f"give_item {hex(ki_placement.plot_item)}")
-                if ki_placement.extra is not None:
-                    free_cmds.append(f"{ki_placement.extra}")
-
-                gear = pick_gear_reward(rng, ki_placement, inventory_generator)
-                placement.update_gear(ki_placement.reward, gear)
-                event_text_block.strings[ki_placement.reward_text_id] = TextBlock.encode_text(
-                    f"You obtain: {gear.name}\x00")
+def randomize_start_gear(rng: random.Random, items: Items, classes_data: list):
+    base_weapons = []
+    base_armors = []
 
-        free_header = "#define FREE_START " + "\\\n".join(free_cmds)
-    else:
-        # We have to define FREE_START even though progress is vanilla. The safe thing to do
-        # is just set flag 0x28, which is the flag that usually means we've talked to the
-        # guards in Cornelia/listened to the King.
-        # In HMS Jayne this _usually_ gets mapped to the first piece of free gear the party gets, but
-        # since there aren't any gear replacements, it's safe to use here.
-        free_header = "#define FREE_START set_flag 0x28"
+    # Find weapons & armor that can be used by the base classes
+    # Also cap the power level of the gear
+    for weapon in items.get_by_type("weapon"):
+        if weapon.id > 0 and weapon.equip_classes & 0x003f != 0:
+            base_weapons.append(weapon)
+    for armor in items.get_by_type("armor"):
+        if 0x1b >= armor.id > 0 != armor.equip_classes & 0x003f:
+            base_armors.append(armor)
 
+    class_bit = 0x1
+    for class_data in classes_data:
+        class_weapons = []
+        class_armors = []
+        for weapon in base_weapons:
+            if weapon.equip_classes & class_bit != 0:
+                class_weapons.append(weapon)
+        for armor in base_armors:
+            if armor.equip_classes & class_bit != 0:
+                class_armors.append(armor)
+        class_data.weapon_id = rng.choice(class_weapons).id
+        class_data.armor_id = rng.choice(class_armors).id
+        class_bit = class_bit << 1
+
+
+def update_key_item_sprites(placement: Placement, map_features: Maps, vehicle_starts: dict):
     # This doesn't have to be done unless shuffling key items, but doing it this way allows a player
     # to see how certain items are represented better, so we do it anyway.
     for ki_placement in placement.all_placements():
@@ -678,46 +576,331 @@ def randomize(rom_data: bytearray, seed: str, flags: Flags) -> bytearray:
         else:
             raise RuntimeError(f"Unknown placement type: {ki_placement.type} at {ki_placement.source}")
 
-    headers = build_headers(placement, free_header)
+
+def assemble_events(rom: Rom, event_tables: EventTables, headers: str, free_block: FreeBlock) -> dict:
     event_scripts = load_event_scripts()
 
-    all_patches.update(event_text_block.pack())
+    # Scripts are compiled once, into templates that are filled in with the values of this seed's header.
+    icode_cache = get_icode_cache()
 
-    event_tables = EventTables(rom)
     event_script_patches = {}
     for event_id in sorted(event_scripts.keys()):
-        script = event_scripts[event_id]
-        preprocess = pparse(f"{headers}\n\n{script}")
-        event_icode = parse(preprocess)
+        event_icode = icode_cache.compile(headers, event_scripts[event_id])
 
         event_addr = event_tables.get_addr(event_id)
         vanilla_size = rom.get_event_size(event_addr)
 
         # If the event doesn't fit in the vanilla location, move it to part of our free space.
         if event_icode.size > vanilla_size:
-            event_addr = rom.get_free_space(f"event_{hex(event_id)}", event_icode.size)
+            event_addr = free_block.allocate(f"event_{hex(event_id)}", event_icode.size)
 
         event_script_patches[Rom.pointer_to_offset(event_addr)] = link(event_icode, event_addr)
         event_tables.set_addr(event_id, event_addr)
+    return event_script_patches
+
+
+def base_patches_stage(context: StageContext) -> dict:
+    # Start with the list of standard patches to improve gameplay.
+    patches = load_ips_files("patches/DataPointerConsolidation.ips",
+                             "patches/Earth__CitadelMap.ips",
+                             "patches/EventUpdates.ips",
+                             "patches/FF1EncounterToggle.ips",
+                             "patches/ImprovedEquipmentStatViewing.ips",
+                             "patches/NoEscape.ips",
+                             "patches/RunningChange.ips",
+                             "patches/SpellLevelFix.ips",
+                             "patches/SpriteFrameLoaderFix.ips",
+                             "patches/StatusScreenExpansion.ips")
+    patches.update(enable_early_magic_buy())
+    return {"base_patches": patches}
+
+
+def items_stage(context: StageContext, rom: Rom) -> dict:
+    items = Items(rom, context.flags.new_items)
+    return {
+        "items": items,
+        "item_patches": items.get_patches()
+    }
+
+
+def maps_stage(context: StageContext, rom: Rom) -> dict:
+    # These are the vanilla maps, which are shared by the stages that only need to read them.
+    return {"maps": Maps(rom)}
+
+
+def encounters_stage(context: StageContext, rom: Rom) -> dict:
+    encounter_regions = EncounterRegions(rom)
+    for region in encounter_regions.overworld_regions:
+        context.rng.shuffle(region)
+    for region in encounter_regions.map_encounters:
+        context.rng.shuffle(region)
+    return {"encounter_patches": encounter_regions.get_patches()}
+
+
+def bosses_stage(context: StageContext, rom: Rom, items: Items) -> dict:
+    boss_data = BossData(rom)
+    encounters = load_encounter_data(rom)
+    enemy_data = load_enemy_data(rom, items, context.flags.fiend_ribbons)
+
+    # Don't load formation data (since we don't do anything with it)
+    # load_formation_data(rom, enemy_data)
 
-    if flags.debug:
+    if not context.flags.boss_shuffle:
+        boss_data.randomize_bosses(encounters, enemy_data, context.rng)
+
+    if context.flags.debug:
         trivial_enemies(enemy_data)
 
-    all_patches.update(add_credits(rom, seed, flags))
-
-    all_patches.update(event_script_patches)
-    all_patches.update(event_tables.get_patches())
-    all_patches.update(map_features.get_patches())
-    all_patches.update(items.get_patches())
-    all_patches.update(shop_data.get_patches())
-    all_patches.update(spells.get_patches())
-    all_patches.update(encounter_regions.get_patches())
-    all_patches.update(boss_data.get_patches())
-    all_patches.update(pack_encounter_data(encounters))
-    all_patches.update(pack_enemy_data(enemy_data))
-    all_patches.update(pack_chests(chest_data))
-    all_patches.update(pack_vehicle_starts(vehicle_starts))
-
-    randomized_rom = rom.apply_patches(all_patches)
-    print("Randomization Finished")
-    return randomized_rom.rom_data
+    patches = boss_data.get_patches()
+    patches.update(pack_encounter_data(encounters))
+    patches.update(pack_enemy_data(enemy_data))
+    return {
+        "boss_choices": boss_data.boss_choices,
+        "boss_patches": patches
+    }
+
+
+def spells_stage(context: StageContext, rom: Rom, maps: Maps) -> dict:
+    spells = Spells(rom)
+    magic_inventories = None
+    if not context.flags.standard_shops:
+        # The shuffle only changes the magic in the shops, which the shops stage takes from here.
+        shop_data = ShopData(rom)
+        spell_generator = SpellGenerator(context.derive_seed("spell_generator"), spells)
+        spell_shuffle(maps, shop_data, spells, spell_generator)
+        magic_inventories = [inventory.magic for inventory in shop_data.shop_inventories]
+
+    return {
+        "magic_inventories": magic_inventories,
+        "spell_patches": spells.get_patches()
+    }
+
+
+def shops_stage(context: StageContext, rom: Rom, maps: Maps, items: Items, magic_inventories: list) -> dict:
+    shop_data = ShopData(rom)
+    if not context.flags.standard_shops:
+        inventory_generator = InventoryGenerator(context.derive_seed("inventory_generator"), items,
+                                                 context.flags.new_items)
+        randomize_shops(context.rng, maps, shop_data, inventory_generator)
+
+    if magic_inventories is not None:
+        for inventory, magic in zip(shop_data.shop_inventories, magic_inventories):
+            inventory.magic = magic
+
+    return {
+        "shop_data": shop_data,
+        "shop_patches": shop_data.get_patches()
+    }
+
+
+def treasure_stage(context: StageContext, rom: Rom, maps: Maps, items: Items, shop_data: ShopData) -> dict:
+    chest_data = load_chests(rom)
+    if not context.flags.standard_treasure:
+        inventory_generator = InventoryGenerator(context.derive_seed("inventory_generator"), items,
+                                                 context.flags.new_items)
+        inventory_generator.update_with_new_shops(shop_data)
+        randomize_treasure(context.rng, maps, chest_data, inventory_generator)
+
+    return {
+        "chests": chest_data,
+        "chest_patches": pack_chests(chest_data)
+    }
+
+
+def start_gear_stage(context: StageContext, rom: Rom, items: Items) -> dict:
+    patches = {}
+    classes_data = None
+    if not context.flags.default_start_gear:
+        classes_data = load_class_data(rom)
+        randomize_start_gear(context.rng, items, classes_data)
+        patches.update(pack_class_data(classes_data))
+    return {
+        "start_gear": classes_data,
+        "start_gear_patches": patches
+    }
+
+
+def xp_stage(context: StageContext, rom: Rom) -> dict:
+    patches = {}
+    if context.flags.scale_levels != 1.0:
+        level_reqs = load_xp_requirements(rom)
+        scaled_level_reqs = []
+        for level_req in level_reqs:
+            scaled_level_reqs.append(int(level_req * context.flags.scale_levels))
+        patches.update(pack_xp_requirements(scaled_level_reqs))
+    return {"xp_patches": patches}
+
+
+def key_item_placement_stage(context: StageContext) -> dict:
+    # Are Key Items being shuffled? If so, figure out their placement.
+    solution = None
+    if not context.flags.no_shuffle:
+        solver_seed = context.rng.randint(0, 0xffffffff)
+        pinned, forbidden = context.flags.plando_pins, context.flags.plando_forbidden
+        if context.flags.key_item_solver == "python":
+            solution = get_bitset_solver().solve(solver_seed, pinned, forbidden)
+        else:
+            # Comes from the prebuilt placement pool if there's a current one; otherwise clingo solves it.
+            solution = solve_placement(solver_seed, pinned, forbidden)
+    return {"key_item_solution": solution}
+
+
+def key_items_stage(context: StageContext, rom: Rom, items: Items, shop_data: ShopData,
+                    key_item_solution: tuple) -> dict:
+    # The maps and strings are changed here, so this stage gets its own copies of them.
+    map_features = Maps(rom)
+    event_text_block = EventTextBlock(rom)
+    vehicle_starts = load_vehicle_starts(rom)
+
+    # Do some basic updates to the maps
+    map_updates(map_features)
+
+    # Update game strings -- do this _before_ updating placements or the strings for gear won't replace them.
+    update_strings(event_text_block)
+
+    placement = Placement()
+    if key_item_solution is not None:
+        free_items = ["bridge", "ship"]
+        placement.update_placements(key_item_solution)
+
+        inventory_generator = InventoryGenerator(context.derive_seed("inventory_generator"), items,
+                                                 context.flags.new_items)
+        inventory_generator.update_with_new_shops(shop_data)
+
+        # The key feature of HMS Janye is starting with the Ship (the HMS Janye), so move the ship to Cornelia harbor.
+        vehicle_starts["ship"] = VehiclePosition(x=2328, y=2600)
+
+        # At the moment it doesn't really matter, but we only want to give the free items once when the game
+        # starts, which would allow us to give a starter pack at some point. To do this check, we need to
+        # check for a particular plot flag.
+        # This check _could_ be made to work even without any free key items, but since this is HMS Jayne anyway,
+        # I'll keep the logic simple by assuming we have access to at least one.
+        start_flag = None
+
+        # If a given placement is "free", put a piece of gear in its place
+        free_cmds = []
+        for ki_placement in placement.all_placements():
+            if ki_placement.reward in free_items:
+                # Before replacing the item, grab the commands needed to give the item
+                if ki_placement.plot_flag is not None:
+                    free_cmds.append(f"set_flag {hex(ki_placement.plot_flag)}")
+                    start_flag = ki_placement.plot_flag if start_flag is None else start_flag
+                if ki_placement.plot_item is not None:
+                    free_cmds.append(f"give_item {hex(ki_placement.plot_item)}")
+                if ki_placement.extra is not None:
+                    free_cmds.append(f"{ki_placement.extra}")
+
+                gear = pick_gear_reward(context.rng, ki_placement, inventory_generator)
+                placement.update_gear(ki_placement.reward, gear)
+                event_text_block.strings[ki_placement.reward_text_id] = TextBlock.encode_text(
+                    f"You obtain: {gear.name}\x00")
+
+        free_header = "#define FREE_START " + "\\\n".join(free_cmds)
+    else:
+        # We have to define FREE_START even though progress is vanilla. The safe thing to do
+        # is just set flag 0x28, which is the flag that usually means we've talked to the
+        # guards in Cornelia/listened to the King.
+        # In HMS Jayne this _usually_ gets mapped to the first piece of free gear the party gets, but
+        # since there aren't any gear replacements, it's safe to use here.
+        free_header = "#define FREE_START set_flag 0x28"
+
+    update_key_item_sprites(placement, map_features, vehicle_starts)
+
+    return {
+        "placement": placement,
+        "free_header": free_header,
+        "map_patches": map_features.get_patches(),
+        "text_patches": event_text_block.pack(),
+        "vehicle_patches": pack_vehicle_starts(vehicle_starts)
+    }
+
+
+def events_stage(context: StageContext, rom: Rom, placement: Placement, free_header: str) -> dict:
+    event_tables = EventTables(rom)
+    patches = assemble_events(rom, event_tables, build_headers(placement, free_header), FreeBlock())
+    patches.update(event_tables.get_patches())
+    return {"event_patches": patches}
+
+
+def credits_stage(context: StageContext, rom: Rom) -> dict:
+    return {"credits_patches": add_credits(rom, context.seed, context.flags)}
+
+
+def pack_stage(context: StageContext, rom: Rom, **patch_sets) -> dict:
+    # Patches are combined in the order they're listed as inputs, regardless of the order the stages ran in.
+    all_patches = {}
+    for name in PACK_INPUTS:
+        all_patches.update(patch_sets[name])
+    return {"randomized_rom": rom.apply_patches(all_patches)}
+
+
+# Properties of Flags that go into the flag string (used by the credits). Every property `Flags.encode()` reads
+# must be here, or the credits of other flags come back from a StageCache.
+ALL_FLAGS = ("no_shuffle", "standard_shops", "standard_treasure", "default_start_gear", "boss_shuffle",
+             "new_items", "fiend_ribbons", "key_item_solver", "plando_pins", "plando_forbidden", "debug",
+             "scale_levels")
+
+PACK_INPUTS = ("base_patches", "start_gear_patches", "xp_patches", "text_patches", "credits_patches",
+               "event_patches", "map_patches", "item_patches", "shop_patches", "spell_patches", "encounter_patches",
+               "boss_patches", "chest_patches", "vehicle_patches")
+
+RANDOMIZE_PIPELINE = Pipeline([
+    Stage("base_patches", base_patches_stage, outputs=["base_patches"], uses_seed=False),
+    Stage("items", items_stage, inputs=["rom"], outputs=["items", "item_patches"], flags=["new_items"],
+          uses_seed=False),
+    Stage("maps", maps_stage, inputs=["rom"], outputs=["maps"], uses_seed=False),
+    Stage("encounters", encounters_stage, inputs=["rom"], outputs=["encounter_patches"]),
+    Stage("bosses", bosses_stage, inputs=["rom", "items"], outputs=["boss_choices", "boss_patches"],
+          flags=["boss_shuffle", "fiend_ribbons", "debug"]),
+    Stage("spells", spells_stage, inputs=["rom", "maps"], outputs=["magic_inventories", "spell_patches"],
+          flags=["standard_shops"]),
+    Stage("shops", shops_stage, inputs=["rom", "maps", "items", "magic_inventories"],
+          outputs=["shop_data", "shop_patches"], flags=["standard_shops", "new_items"]),
+    Stage("treasure", treasure_stage, inputs=["rom", "maps", "items", "shop_data"],
+          outputs=["chests", "chest_patches"], flags=["standard_treasure", "new_items"]),
+    Stage("start_gear", start_gear_stage, inputs=["rom", "items"], outputs=["start_gear", "start_gear_patches"],
+          flags=["default_start_gear"]),
+    Stage("xp", xp_stage, inputs=["rom"], outputs=["xp_patches"], flags=["scale_levels"], uses_seed=False),
+    Stage("key_item_placement", key_item_placement_stage, outputs=["key_item_solution"],
+          flags=["no_shuffle", "key_item_solver", "plando_pins", "plando_forbidden"]),
+    Stage("key_items", key_items_stage, inputs=["rom", "items", "shop_data", "key_item_solution"],
+          outputs=["placement", "free_header", "map_patches", "text_patches", "vehicle_patches"],
+          flags=["new_items"]),
+    Stage("events", events_stage, inputs=["rom", "placement", "free_header"], outputs=["event_patches"],
+          uses_seed=False),
+    Stage("credits", credits_stage, inputs=["rom"], outputs=["credits_patches"], flags=ALL_FLAGS),
+    # The packed ROM is handed back to the caller, who may modify it, so it is never cached.
+    Stage("pack", pack_stage, inputs=["rom"] + list(PACK_INPUTS), outputs=["randomized_rom"], uses_seed=False,
+          cacheable=False),
+])
+
+
+def randomize(rom_data: bytearray, seed: str, flags: Flags, timings: StageTimer = None,
+              max_workers: int = 1, cache: StageCache = None, spoiler=None, progress=None,
+              cancel: CancellationToken = None) -> bytearray:
+    """Randomizes a ROM.
+
+    :param rom_data: The vanilla ROM.
+    :param seed: Seed for the randomization.
+    :param flags: Flags for the randomization.
+    :param timings: Optional timer to record each stage with.
+    :param max_workers: Number of independent stages that may run at the same time.
+    :param cache: Optional cache of stage outputs. Randomizing the same seed again with only some flags changed
+                  only re-runs the stages affected by those flags.
+    :param spoiler: Optional text stream to write the spoiler (key items, shops, chests, bosses and starting gear)
+                    to, as JSON.
+    :param progress: Optional function called with a `randomizer.pipeline.Progress` when each stage starts and ends.
+                     It may be called from a worker thread, so a GUI should hand it over to its own thread.
+    :param cancel: Optional CancellationToken. If it's cancelled, the randomization stops before the next stage
+                   and `randomizer.pipeline.Cancelled` is raised.
+    :return: The randomized ROM.
+    """
+    with log_context(seed=seed):
+        logger.info("Randomizing with seed %s, %s", seed, flags.encode())
+        artifacts = RANDOMIZE_PIPELINE.run(seed, flags, {"rom": Rom(rom_data)}, targets=["randomized_rom"],
+                                           timer=timings, max_workers=max_workers, cache=cache,
+                                           progress=progress, cancel=cancel)
+        if spoiler is not None:
+            write_spoiler(spoiler, seed, flags, artifacts)
+        logger.info("Randomization Finished")
+    return artifacts["randomized_rom"].rom_data
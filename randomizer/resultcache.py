@@ -0,0 +1,199 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from randomizer.flags import Flags
+from randomizer.placementpool import placement_source
+
+# Part of every result key. Bump this whenever a change to the randomizer changes the output for an existing
+# seed and set of flags, so results from older versions are never handed out.
+RANDOMIZER_VERSION = "1"
+
+
+def result_key(rom_fingerprint: str, flags: Flags, seed: str, version: str = RANDOMIZER_VERSION,
+               placements: str = None) -> str:
+    """Builds the key that identifies the result of randomizing a ROM.
+
+    :param rom_fingerprint: Fingerprint of the (unmodified) ROM, from `randomizer.pipeline.fingerprint`.
+    :param flags: Flags for the randomization.
+    :param seed: Seed for the randomization.
+    :param version: Version of the randomizer.
+    :param placements: Where key item placements come from. Defaults to `placementpool.placement_source()`.
+    :return: The key as a hex string.
+    """
+    placements = placements if placements is not None else placement_source()
+    # Flags.encode() rounds the XP scale, so it can't tell every set of flags apart.
+    canonical_flags = ",".join(f"{name}={value!r}" for name, value in sorted(vars(flags).items()))
+    parts = [f"version={version}", f"rom={rom_fingerprint}", f"flags={canonical_flags}", f"seed={seed}",
+             f"placements={placements}"]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """Stores the results of whole randomizations, so a seed that's asked for again isn't randomized again.
+
+    Each result is stored under its key (see `result_key`) and a kind, such as "ips", "rom" or "spoiler". Results
+    are kept in an in-memory LRU and, if a directory is given, on disk. The directory may be shared by several
+    processes (the CLI and any number of web workers). When it grows past its size limit, the least recently used
+    files are deleted.
+    """
+
+    def __init__(self, directory: str = None, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        """
+        :param directory: Optional directory to store results in.
+        :param max_memory_bytes: Maximum total size of the results kept in memory.
+        :param max_disk_bytes: Maximum total size of the results kept on disk.
+        """
+        self._directory = directory
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str, kind: str) -> bytes:
+        """Looks up a result.
+
+        :param key: Key of the result, from `result_key`.
+        :param kind: Kind of the result, such as "ips".
+        :return: The result, or None if it isn't in the cache.
+        """
+        with self._lock:
+            data = self._entries.get((key, kind))
+            if data is not None:
+                self._entries.move_to_end((key, kind))
+                self.hits += 1
+                return data
+
+        data = self._read(key, kind)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, kind, data)
+        return data
+
+    def put(self, key: str, kind: str, data: bytes):
+        """Stores a result.
+
+        :param key: Key of the result, from `result_key`.
+        :param kind: Kind of the result, such as "ips".
+        :param data: The result.
+        """
+        data = bytes(data)
+        with self._lock:
+            self._remember(key, kind, data)
+        self._write(key, kind, data)
+
+    def clear(self):
+        """Removes every result from memory. Results on disk are left alone."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key: str, kind: str, data: bytes):
+        if len(data) > self._max_memory_bytes:
+            return
+        previous = self._entries.pop((key, kind), None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._entries[(key, kind)] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self._max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path(self, key: str, kind: str) -> str:
+        return os.path.join(self._directory, key[:2], f"{key}.{kind}")
+
+    def _read(self, key: str, kind: str) -> bytes:
+        if self._directory is None:
+            return None
+        path = self._path(key, kind)
+        try:
+            with open(path, "rb") as result_file:
+                data = result_file.read()
+            # The modification time doubles as the last time the result was used.
+            os.utime(path)
+        except FileNotFoundError:
+            # Another process may have evicted it between the open and the utime.
+            return None
+        return data
+
+    def _write(self, key: str, kind: str, data: bytes):
+        if self._directory is None or len(data) > self._max_disk_bytes:
+            return
+        path = self._path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so other processes never see a partial result.
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as result_file:
+                result_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self._max_disk_bytes:
+                self._evict_from_disk()
+
+    def _disk_files(self) -> list:
+        files = []
+        for directory, _, names in os.walk(self._directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, status.st_size, status.st_mtime))
+        return files
+
+    def _evict_from_disk(self):
+        # Other processes may have added or removed files, so start from what's actually there.
+        files = sorted(self._disk_files(), key=lambda file: file[2])
+        self._disk_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self._disk_bytes <= self._max_disk_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
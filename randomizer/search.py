@@ -0,0 +1,163 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from doslib.items import Items
+from doslib.rom import Rom
+from randomizer.flags import Flags
+from randomizer.randomize import RANDOMIZE_PIPELINE
+from randomizer.spoiler import SPOILER_INPUTS
+
+SearchResult = namedtuple("SearchResult", ["seed", "score"])
+
+# The ROM, as given to each worker process once (rather than with every candidate).
+_worker_rom = None
+
+
+def search_seeds(rom_data: bytearray, flags: Flags, scorer, matches: int = 1, budget: int = 100,
+                 time_budget: float = None, max_workers: int = None, search_seed: str = None) -> list:
+    """Searches for seeds that meet some criteria.
+
+    Candidate seeds are only randomized as far as the model (SPOILER_INPUTS: placement, shops, chests, bosses,
+    starting gear, etc.). Events aren't assembled and nothing is packed into a ROM, so rejected candidates are cheap.
+
+    :param rom_data: The vanilla ROM.
+    :param flags: Flags to randomize with.
+    :param scorer: Called with a dictionary of the candidate's artifacts. Returns None or False to reject the
+                   candidate, otherwise its score (True counts as 1). With more than one worker, this must be
+                   picklable: a module-level function, or a functools.partial of one.
+    :param matches: Stop after this many candidates have been accepted.
+    :param budget: Stop after this many candidates have been tried.
+    :param time_budget: Optional number of seconds to stop after.
+    :param max_workers: Number of processes to evaluate candidates in. 1 evaluates them in this process.
+    :param search_seed: Optional seed for the candidate seeds, to make the search repeatable.
+    :return: The accepted seeds as SearchResults, best score first.
+    """
+    rng = random.Random(search_seed)
+    candidates = [hex(rng.randint(0, 0xffffffff))[2:] for _ in range(budget)]
+    deadline = time.monotonic() + time_budget if time_budget is not None else None
+    # Results of the candidates evaluated so far, by index; None for the rejected ones.
+    evaluated = {}
+    # Candidates before this index have all been evaluated, and `prefix_matches` of them were accepted.
+    prefix = 0
+    prefix_matches = 0
+
+    def evaluated_result(index: int, score):
+        evaluated[index] = SearchResult(candidates[index], float(score)) if score is not None and score is not False \
+            else None
+
+    def finished() -> bool:
+        # Only stop once every candidate before the last match has been evaluated, so the matches are the same ones
+        # a sequential search would find, whichever workers finish first.
+        nonlocal prefix, prefix_matches
+        while prefix_matches < matches and prefix in evaluated:
+            if evaluated[prefix] is not None:
+                prefix_matches += 1
+            prefix += 1
+        return prefix_matches >= matches or (deadline is not None and time.monotonic() >= deadline)
+
+    if max_workers == 1:
+        _init_worker(rom_data)
+        for index, candidate in enumerate(candidates):
+            if finished():
+                break
+            evaluated_result(index, _evaluate(candidate, flags, scorer))
+    else:
+        max_workers = max_workers if max_workers is not None else os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(bytes(rom_data),)) as executor:
+            # Only keep a couple of candidates per worker queued, so little work is wasted once the search is over.
+            in_flight = 2 * max_workers
+            pending = list(enumerate(candidates))
+            running = {}
+            while not finished() and (len(pending) > 0 or len(running) > 0):
+                while len(pending) > 0 and len(running) < in_flight:
+                    index, candidate = pending.pop(0)
+                    running[executor.submit(_evaluate, candidate, flags, scorer)] = index
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    evaluated_result(running.pop(future), future.result())
+
+            for future in running.keys():
+                future.cancel()
+
+    # Candidates accepted after the first `matches` (by the order they were generated in) were only evaluated because
+    # they ran alongside earlier ones, so they're dropped. Ties go to the candidate that was generated first, so the
+    # result doesn't depend on timing.
+    accepted = [(index, evaluated[index]) for index in sorted(evaluated) if evaluated[index] is not None][:matches]
+    accepted.sort(key=lambda entry: (-entry[1].score, entry[0]))
+    return [result for _, result in accepted]
+
+
+def load_scorer(name: str):
+    """Loads a scorer given as "module:function", such as "randomizer.search:no_early_s_gear".
+
+    :param name: Name of the scorer.
+    :return: The scorer.
+    """
+    if ":" not in name:
+        raise RuntimeError(f"Scorer must be given as module:function, not '{name}'")
+    module_name, function_name = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _init_worker(rom_data: bytearray):
+    global _worker_rom
+    _worker_rom = Rom(bytearray(rom_data))
+
+
+def _evaluate(seed: str, flags: Flags, scorer):
+    artifacts = RANDOMIZE_PIPELINE.run(seed, flags, {"rom": _worker_rom}, targets=list(SPOILER_INPUTS))
+    return scorer(artifacts)
+
+
+def has_bosses(artifacts: dict, bosses: tuple = ()) -> bool:
+    """Accepts seeds where each of the given bosses replaces one of the fiends.
+
+    Use with functools.partial, e.g. `partial(has_bosses, bosses=("Chaos", "Atomos"))`.
+    """
+    if artifacts["boss_choices"] is None:
+        return False
+    chosen = [boss.replace("\\x00", "") for boss in artifacts["boss_choices"]]
+    return all(boss in chosen for boss in bosses)
+
+
+def gear_grades_in_zone(artifacts: dict, zone: str) -> list:
+    """Lists the grades of the gear given out as key item rewards in a zone.
+
+    :param artifacts: Artifacts of a candidate.
+    :param zone: Zone of the key item locations (as in KeyItemPlacement.tsv), such as "early".
+    :return: The grades.
+    """
+    items = artifacts["items"]
+    grades = []
+    for placement in artifacts["placement"].all_placements():
+        if placement.zone != zone or placement.extra is None or not placement.extra.startswith("give_item_ex"):
+            continue
+        _, item_type, item_id = placement.extra.split()
+        item_list = items.get_by_type(Items.index_to_name(int(item_type, 0)))
+        grades.append(item_list[int(item_id, 0)].grade)
+    return grades
+
+
+def no_early_s_gear(artifacts: dict) -> bool:
+    """Accepts seeds that don't give out S-grade gear in the early zone."""
+    return "S" not in gear_grades_in_zone(artifacts, "early")
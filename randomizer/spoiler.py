@@ -0,0 +1,141 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import re
+
+from doslib.dos_utils import load_tsv
+from doslib.items import Items
+from doslib.maps import MoneyChest
+from randomizer.flags import Flags
+from randomizer.resultcache import RANDOMIZER_VERSION
+from randomizer.treasure import ChestData
+
+# Artifacts of the randomizer pipeline that the spoiler is built from.
+SPOILER_INPUTS = ("items", "placement", "shop_data", "chests", "boss_choices", "start_gear")
+
+# The fiends, in the order BossData replaces them.
+FIEND_NAMES = ("Lich", "Marilith", "Kraken", "Tiamat")
+
+CLASS_NAMES = ("Warrior", "Thief", "Monk", "Red Mage", "White Mage", "Black Mage")
+
+# Icons and terminators in names from the data files.
+NAME_ESCAPES = re.compile(r"\\(u[0-9a-fA-F]{4}|x00)")
+
+
+def write_spoiler(stream, seed: str, flags: Flags, artifacts: dict):
+    """Writes the spoiler for a randomization as JSON.
+
+    :param stream: Text stream to write to.
+    :param seed: Seed of the randomization.
+    :param flags: Flags of the randomization.
+    :param artifacts: Artifacts produced by the randomizer pipeline (at least every one in SPOILER_INPUTS).
+    """
+    for chunk in iter_spoiler(seed, flags, artifacts):
+        stream.write(chunk)
+
+
+def iter_spoiler(seed: str, flags: Flags, artifacts: dict):
+    """Generates the spoiler for a randomization as chunks of JSON, one section entry at a time.
+
+    :param seed: Seed of the randomization.
+    :param flags: Flags of the randomization.
+    :param artifacts: Artifacts produced by the randomizer pipeline (at least every one in SPOILER_INPUTS).
+    :return: A generator of strings that together make up the JSON document.
+    """
+    items = artifacts["items"]
+    header = {"seed": seed, "flags": flags.encode(), "version": RANDOMIZER_VERSION}
+    yield json.dumps(header)[:-1]
+
+    sections = [
+        ("key_items", _key_items(artifacts["placement"])),
+        ("shops", _shops(items, artifacts["shop_data"])),
+        ("chests", _chests(items, artifacts["chests"])),
+        ("bosses", _bosses(artifacts["boss_choices"])),
+        ("start_gear", _start_gear(items, artifacts["start_gear"])),
+    ]
+    for name, entries in sections:
+        yield f", {json.dumps(name)}: ["
+        for index, entry in enumerate(entries):
+            yield ("" if index == 0 else ", ") + json.dumps(entry)
+        yield "]"
+    yield "}\n"
+
+
+def _display_name(name: str) -> str:
+    return NAME_ESCAPES.sub("", name) if name is not None else None
+
+
+def _item_name(items: Items, type_name: str, item_id: int) -> str:
+    item_list = items.get_by_type(type_name)
+    if 0 <= item_id < len(item_list):
+        return _display_name(item_list[item_id].name)
+    return None
+
+
+def _key_items(placement):
+    for details in placement.all_placements():
+        yield details._asdict()
+
+
+def _shops(items: Items, shop_data):
+    spell_names = {}
+    for spell in load_tsv("data/SpellData.tsv"):
+        spell_names[spell[0]] = spell[1]
+
+    for index, inventory in enumerate(shop_data.shop_inventories):
+        yield {
+            "shop": index,
+            "magic": [spell_names.get(spell_id) for spell_id in inventory.magic],
+            "weapons": [_item_name(items, "weapon", item_id) for item_id in inventory.weapons],
+            "armor": [_item_name(items, "armor", item_id) for item_id in inventory.armor],
+            "items": [_item_name(items, "item", item_id) for item_id in inventory.items]
+        }
+
+
+def _chests(items: Items, chests: list):
+    locations = {}
+    for chest in load_tsv("data/ChestData.tsv"):
+        chest_data = ChestData(*chest)
+        locations[chest_data.chest_index] = chest_data.map
+
+    for index, chest in enumerate(chests):
+        entry = {"chest": index, "location": locations.get(index)}
+        if isinstance(chest, MoneyChest):
+            entry["gil"] = chest.qty
+        elif 1 <= chest.item_type <= 3:
+            entry["type"] = Items.index_to_name(chest.item_type)
+            entry["item"] = _item_name(items, entry["type"], chest.item_id)
+        else:
+            entry["type"] = chest.item_type
+            entry["item"] = chest.item_id
+        yield entry
+
+
+def _bosses(boss_choices: list):
+    if boss_choices is None:
+        return
+    for fiend, boss in zip(FIEND_NAMES, boss_choices):
+        yield {"fiend": fiend, "boss": _display_name(boss)}
+
+
+def _start_gear(items: Items, classes_data: list):
+    if classes_data is None:
+        return
+    for name, class_data in zip(CLASS_NAMES, classes_data):
+        yield {
+            "class": name,
+            "weapon": _item_name(items, "weapon", class_data.weapon_id),
+            "armor": _item_name(items, "armor", class_data.armor_id)
+        }
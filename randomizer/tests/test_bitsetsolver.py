@@ -0,0 +1,142 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import os
+import random
+import tempfile
+import unittest
+
+from doslib.dos_utils import resolve_path
+from randomizer.bitsetsolver import BitsetSolver
+from randomizer.placement import ClingoPlacement, PlandoConflict, PlandoError, PROGRAM_FILES, parse_pairs
+
+HAS_CLINGO = importlib.util.find_spec("clingo") is not None
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+def _shuffled(placement: tuple, seed: int) -> tuple:
+    rewards = [pairing.reward for pairing in placement]
+    random.Random(seed).shuffle(rewards)
+    return tuple(ClingoPlacement(reward, pairing.source) for reward, pairing in zip(rewards, placement))
+
+
+def _clingo_accepts(placement: tuple) -> bool:
+    import clingo
+
+    control = clingo.Control()
+    for program in PROGRAM_FILES:
+        control.load(resolve_path(program))
+    control.add("base", [], "".join(f":- not pair({pairing.reward},{pairing.source})." for pairing in placement))
+    control.ground([("base", [])])
+    return control.solve().satisfiable
+
+
+class TestBitsetSolver(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.solver = BitsetSolver()
+
+    def test_compiles_programs(self):
+        self.assertEqual(len(self.solver.items), 28)
+        self.assertEqual(len(self.solver.locations), 28)
+        caravan = self.solver.locations.index("caravan")
+        self.assertEqual(self.solver.items[self.solver.fixed[caravan]], "bottle")
+
+    def test_placements_are_valid(self):
+        for seed in range(50):
+            placement = self.solver.solve(seed)
+            self.assertTrue(self.solver.is_valid(placement), placement)
+            self.assertEqual(placement, self.solver.solve(seed))
+
+    def test_rejects_invalid_placements(self):
+        placement = self.solver.solve(0)
+        self.assertFalse(self.solver.is_valid(placement[1:]))
+        self.assertFalse(self.solver.is_valid(placement[:-1] + (ClingoPlacement(placement[-1].reward, "sara"),)))
+        self.assertFalse(any(self.solver.is_valid(_shuffled(placement, seed)) for seed in range(20)))
+
+    def test_plando(self):
+        pinned = parse_pairs(["ship:bikke", "excalibur:king"])
+        self.assertEqual(pinned, (ClingoPlacement("excalibur", "king"), ClingoPlacement("ship", "bikke")))
+        forbidden = (ClingoPlacement("lute", "sara"),)
+        for seed in range(10):
+            placement = self.solver.solve(seed, pinned, forbidden)
+            self.assertTrue(self.solver.is_valid(placement))
+            self.assertTrue(set(pinned) <= set(placement))
+            self.assertNotIn(forbidden[0], placement)
+
+    def test_plando_conflicts(self):
+        excalibur = ClingoPlacement("excalibur", "king")
+        for pinned, forbidden in (((excalibur, ClingoPlacement("lute", "king")), ()),
+                                  ((excalibur,), (excalibur,)),
+                                  ((), (ClingoPlacement("bottle", "caravan"),)),
+                                  ((ClingoPlacement("crown", "astos"),), ()),
+                                  ((ClingoPlacement("airship", "vampire"), ClingoPlacement("canal", "sarda")), ())):
+            with self.assertRaises(PlandoConflict):
+                self.solver.solve(0, pinned, forbidden)
+        with self.assertRaises(PlandoError) as raised:
+            self.solver.solve(0, (ClingoPlacement("excalibur", "nowhere"),))
+        self.assertNotIsInstance(raised.exception, PlandoConflict)
+        with self.assertRaises(PlandoError) as raised:
+            parse_pairs(["excalibur"])
+        self.assertNotIsInstance(raised.exception, PlandoConflict)
+
+    def test_item_locations(self):
+        placement = self.solver.solve(0)
+        item_at = self.solver.item_locations(placement)
+        for pairing in placement:
+            self.assertEqual(self.solver.items[item_at[self.solver.locations.index(pairing.source)]], pairing.reward)
+        self.assertIsNone(self.solver.item_locations(placement[1:]))
+
+    @unittest.skipUnless(HAS_NUMPY, "NumPy is not installed")
+    def test_batch_agrees_with_is_valid(self):
+        placements = [self.solver.solve(seed) for seed in range(10)]
+        placements += [_shuffled(placement, seed) for seed, placement in enumerate(placements)]
+        placements += [placements[0][1:], placements[0][:-1] + (ClingoPlacement(placements[0][-1].reward, "sara"),)]
+        valid = self.solver.validate_batch(self.solver.placement_matrix(placements))
+        self.assertEqual(valid.tolist(), [self.solver.is_valid(placement) for placement in placements])
+        self.assertTrue(valid[:10].all())
+
+    @unittest.skipUnless(HAS_NUMPY, "NumPy is not installed")
+    def test_batch_rejects_out_of_range_items(self):
+        item_at = self.solver.item_locations(self.solver.solve(0))
+        self.assertEqual(self.solver.validate_batch([item_at, [len(item_at)] + item_at[1:]]).tolist(), [True, False])
+        with self.assertRaises(RuntimeError):
+            self.solver.validate_batch([item_at[1:]])
+
+    def test_rejects_unknown_statements(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".lp", delete=False) as program:
+            program.write("item(lute).\nlocation(sara).\nopen(sara) :- not has(lute).\n")
+        try:
+            with self.assertRaises(RuntimeError):
+                BitsetSolver((program.name,))
+        finally:
+            os.unlink(program.name)
+
+    @unittest.skipUnless(HAS_CLINGO, "clingo is not installed")
+    def test_agrees_with_clingo(self):
+        from randomizer.clingo import solve_placement_for_seed
+
+        for seed in range(10):
+            self.assertTrue(_clingo_accepts(self.solver.solve(seed)))
+            self.assertTrue(self.solver.is_valid(solve_placement_for_seed(seed)))
+
+            # Mostly invalid, but both solvers must agree on each one.
+            shuffled = _shuffled(self.solver.solve(seed), seed)
+            self.assertEqual(self.solver.is_valid(shuffled), _clingo_accepts(shuffled))
+
+
+if __name__ == '__main__':
+    unittest.main()
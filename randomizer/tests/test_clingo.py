@@ -0,0 +1,117 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from doslib.dos_utils import resolve_path
+
+HAS_CLINGO = importlib.util.find_spec("clingo") is not None
+
+SEEDS = (1, 0xdeadbeef, 42, 7, 0x12345678)
+
+
+def _solve_with_new_control(seed: int) -> tuple:
+    # How placements were solved before the ground program was reused: load and ground the programs for every seed.
+    import clingo
+    from randomizer.clingo import ClingoPlacement, PROGRAM_FILES
+
+    control = clingo.Control()
+    for program in PROGRAM_FILES:
+        control.load(resolve_path(program))
+    control.configuration.solve.models = 1
+    control.configuration.solver.sign_def = "rnd"
+    control.configuration.solver.seed = seed
+    control.ground([("base", [])])
+    with control.solve(yield_=True) as handle:
+        symbols = next(iter(handle)).symbols(shown=True)
+    return tuple(ClingoPlacement(*(argument.name for argument in symbol.arguments))
+                 for symbol in symbols if symbol.name == "pair")
+
+
+@unittest.skipUnless(HAS_CLINGO, "clingo is not installed")
+class TestKeyItemSolver(unittest.TestCase):
+
+    def setUp(self):
+        from randomizer.clingo import KeyItemSolver
+        self.solver = KeyItemSolver()
+
+    def tearDown(self):
+        self.solver.close()
+
+    def test_matches_new_control(self):
+        # Solve each seed twice, in between others, to show that nothing carries over from one solve to the next.
+        for seed in SEEDS + tuple(reversed(SEEDS)):
+            self.assertEqual(self.solver.solve(seed), _solve_with_new_control(seed))
+
+    def test_placement_is_complete(self):
+        placement = self.solver.solve(SEEDS[0])
+        self.assertIn(("bottle", "caravan"), placement)
+        self.assertEqual(len({pairing.reward for pairing in placement}), len(placement))
+        self.assertEqual(len({pairing.source for pairing in placement}), len(placement))
+
+    def test_concurrent(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            concurrent = list(executor.map(self.solver.solve, SEEDS * 4))
+        self.assertEqual(concurrent, [self.solver.solve(seed) for seed in SEEDS * 4])
+
+    def test_plando(self):
+        from randomizer.clingo import ClingoPlacement
+
+        pinned = (ClingoPlacement("excalibur", "king"), ClingoPlacement("ship", "bikke"))
+        forbidden = (ClingoPlacement("lute", "sara"),)
+        for seed in SEEDS:
+            placement = self.solver.solve(seed, pinned, forbidden)
+            self.assertTrue(set(pinned) <= set(placement))
+            self.assertNotIn(forbidden[0], placement)
+        self.assertEqual(self.solver.solve(SEEDS[0]), _solve_with_new_control(SEEDS[0]))
+
+    def test_plando_conflicts(self):
+        from randomizer.clingo import ClingoPlacement, PlandoError
+        from randomizer.placement import PlandoConflict
+
+        excalibur, lute = ClingoPlacement("excalibur", "king"), ClingoPlacement("lute", "king")
+        with self.assertRaises(PlandoConflict) as raised:
+            self.solver.solve(SEEDS[0], (excalibur, lute))
+        self.assertEqual(set(raised.exception.pinned), {excalibur, lute})
+
+        with self.assertRaises(PlandoConflict) as raised:
+            self.solver.solve(SEEDS[0], (excalibur,), (excalibur,))
+        self.assertEqual((raised.exception.pinned, raised.exception.forbidden), ((excalibur,), (excalibur,)))
+
+        with self.assertRaises(PlandoConflict):
+            self.solver.solve(SEEDS[0], forbidden=(ClingoPlacement("bottle", "caravan"),))
+        # A pair naming a location that doesn't exist isn't a conflict, it's a mistake.
+        with self.assertRaises(PlandoError) as raised:
+            self.solver.solve(SEEDS[0], (ClingoPlacement("excalibur", "nowhere"),))
+        self.assertNotIsInstance(raised.exception, PlandoConflict)
+
+    def test_statistics(self):
+        result = self.solver.solve_with_statistics(SEEDS[0])
+        self.assertEqual(result.placement, self.solver.solve(SEEDS[0]))
+        self.assertEqual(set(result.statistics), {"choices", "conflicts", "ground_ms", "solve_ms"})
+        self.assertEqual(self.solver.totals()["solves"], 2)
+
+    def test_conflict_limit(self):
+        from randomizer.clingo import SolverLimitReached, SolverLimits
+
+        self.solver.limits = SolverLimits(conflict_limit=0)
+        with self.assertRaises(SolverLimitReached):
+            self.solver.solve(SEEDS[1])
+        self.assertEqual(self.solver.totals()["limits_reached"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import contextvars
+import json
+import threading
+import unittest
+
+from doslib.rom import Rom
+from randomizer.counters import HotPathCounters
+from stream.inputstream import InputStream
+from stream.outputstream import OutputStream
+
+
+class _Reader(object):
+    def read(self, rom: Rom) -> int:
+        stream = rom.open_bytestream(0, 8)
+        return stream.get_u32() + stream.get_u16() + stream.get_u8()
+
+
+def _write() -> bytearray:
+    stream = OutputStream()
+    stream.put_u32(0x12345678)
+    stream.put_bytes(bytearray(100))
+    return stream.get_buffer()
+
+
+class TestHotPathCounters(unittest.TestCase):
+
+    def test_counts_by_subsystem(self):
+        rom = Rom(bytearray(range(16)))
+        counters = HotPathCounters()
+        with counters.counting():
+            _Reader().read(rom)
+            _write()
+
+        counts = counters.counts()
+        self.assertEqual(counts["_Reader"], {"input_streams": 1, "bytes_sliced": 8 + 2 + 4, "read_u8": 1,
+                                             "read_u16": 1, "read_u32": 1})
+        writes = counts[f"{__name__}._write"]
+        self.assertEqual(writes["write_u32"], 1)
+        self.assertEqual(writes["write_bytes"], 100)
+        self.assertGreaterEqual(writes["buffer_growths"], 1)
+        self.assertEqual(counters.totals()["read_u8"], 1)
+        self.assertIn("_Reader", counters.report())
+        self.assertEqual(json.loads(counters.to_json())["totals"]["write_u32"], 1)
+
+    def test_counts_own_context(self):
+        rom = Rom(bytearray(range(16)))
+        counters = HotPathCounters()
+        with counters.counting():
+            # A thread with a context of its own, such as the prefetcher's, isn't counted.
+            other = threading.Thread(target=_Reader().read, args=(rom,))
+            other.start()
+            other.join()
+            # One that runs in a copy of the context, like the pipeline's workers, is.
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(_write,))
+            worker.start()
+            worker.join()
+        self.assertEqual(list(counters.counts()), [f"{__name__}._write"])
+
+    def test_uninstall(self):
+        originals = (InputStream.get_u8, OutputStream.put_u8, Rom.apply_patches)
+        counters = HotPathCounters()
+        with counters.counting():
+            self.assertNotEqual(InputStream.get_u8, originals[0])
+            with self.assertRaises(RuntimeError):
+                HotPathCounters().install()
+        self.assertEqual((InputStream.get_u8, OutputStream.put_u8, Rom.apply_patches), originals)
+
+        # Nothing is counted once they're uninstalled.
+        _Reader().read(Rom(bytearray(16)))
+        self.assertEqual(counters.counts(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
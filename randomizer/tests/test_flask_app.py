@@ -0,0 +1,77 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.synthetic_rom import build_synthetic_rom
+
+HAS_FLASK = importlib.util.find_spec("flask") is not None and importlib.util.find_spec("ips_util") is not None
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "flask-app.py")
+
+
+@unittest.skipUnless(HAS_FLASK, "flask and ips_util are not installed")
+class TestFlaskApp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        spec = importlib.util.spec_from_file_location("flask_app", APP_PATH)
+        cls.app = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(os.environ, {"RANDOMIZER_PREFETCH_DEPTH": "0"}):
+            spec.loader.exec_module(cls.app)
+
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.app.ROM_PATH = os.path.join(cls.directory.name, "ff-dos.gba")
+        with open(cls.app.ROM_PATH, "wb") as rom_file:
+            rom_file.write(build_synthetic_rom())
+        cls.client = cls.app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.job_queue.shutdown()
+        cls.directory.cleanup()
+
+    def _spoiler(self, pins: list):
+        return self.client.post("/spoiler", data={"seed": "seed", "flags": "Py", "pin": pins})
+
+    def test_plando(self):
+        response = self._spoiler(["excalibur:king"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_malformed_pair(self):
+        response = self._spoiler(["excalibur"])
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_pair(self):
+        response = self._spoiler(["excalibur:nowhere"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["pinned"], ["excalibur:nowhere"])
+
+    def test_conflicting_pairs(self):
+        response = self._spoiler(["excalibur:king", "lute:king"])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["pinned"], ["lute:king"])
+
+        # astos only opens with the crown.
+        response = self._spoiler(["crown:astos"])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()["pinned"], ["crown:astos"])
+
+
+if __name__ == '__main__':
+    unittest.main()
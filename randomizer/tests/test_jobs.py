@@ -0,0 +1,102 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import threading
+import unittest
+
+from randomizer.jobs import Job, JobQueue
+from randomizer.pipeline import Progress
+
+
+def _work(value: int, progress=None, cancel=None) -> int:
+    progress(Progress("work", False, 0.0))
+    progress(Progress("work", True, 1.0))
+    return value * 2
+
+
+def _blocked(started: threading.Event, release: threading.Event, progress=None, cancel=None):
+    progress(Progress("first", True, 0.5))
+    started.set()
+    release.wait()
+    cancel.raise_if_cancelled()
+    return "finished"
+
+
+def _broken(progress=None, cancel=None):
+    raise RuntimeError("broken")
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = JobQueue(max_workers=2, max_finished=2)
+
+    def tearDown(self):
+        self.jobs.shutdown()
+
+    def test_result(self):
+        job = self.jobs.submit(_work, 21)
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, 42)
+        self.assertEqual(job.as_dict()["progress"], 1.0)
+        self.assertIs(self.jobs.get(job.id), job)
+
+    def test_progress_and_cancel(self):
+        started, release = threading.Event(), threading.Event()
+        job = self.jobs.submit(_blocked, started, release)
+        self.assertTrue(started.wait(10))
+        self.assertEqual((job.status, job.stage, job.progress), (Job.RUNNING, "first", 0.5))
+
+        self.jobs.cancel(job.id)
+        release.set()
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertIsNone(job.result)
+
+    def test_failure(self):
+        job = self.jobs.submit(_broken)
+        self.assertTrue(job.wait(10))
+        self.assertEqual((job.status, job.error), (Job.FAILED, "broken"))
+
+    def test_shutdown_cancels_queued_jobs(self):
+        jobs = JobQueue(max_workers=1)
+        started, release = threading.Event(), threading.Event()
+        running = jobs.submit(_blocked, started, release)
+        queued = jobs.submit(_work, 21, kind="ips")
+        self.assertTrue(started.wait(10))
+
+        shutdown = threading.Thread(target=jobs.shutdown)
+        shutdown.start()
+        self.assertTrue(queued.wait(10))
+        self.assertEqual((queued.status, queued.kind), (Job.CANCELLED, "ips"))
+        self.assertIsNone(queued.result)
+
+        release.set()
+        shutdown.join(10)
+        self.assertTrue(running.finished)
+        self.assertEqual(running.status, Job.DONE)
+
+    def test_forgets_old_jobs(self):
+        finished = []
+        for value in range(3):
+            finished.append(self.jobs.submit(_work, value))
+            finished[-1].wait(10)
+        self.assertIsNone(self.jobs.get(finished[0].id))
+        self.assertIsNotNone(self.jobs.get(finished[2].id))
+        self.assertIsNone(self.jobs.get("missing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
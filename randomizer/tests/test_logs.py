@@ -0,0 +1,57 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import json
+import logging
+import unittest
+
+from randomizer.logs import configure_logging, log_context
+
+
+class TestLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = configure_logging(logging.INFO, json_lines=True, stream=self.stream)
+        self.logger = logging.getLogger("randomizer.tests")
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        root.setLevel(logging.WARNING)
+
+    def _records(self) -> list:
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines(self):
+        with log_context(request_id="request"):
+            with log_context(seed="seed"):
+                self.logger.info("Randomizing %s", "seed")
+            self.logger.warning("Done")
+        self.logger.info("Outside")
+
+        first, second, third = self._records()
+        self.assertEqual(first["message"], "Randomizing seed")
+        self.assertEqual((first["seed"], first["request_id"]), ("seed", "request"))
+        self.assertEqual((second["seed"], second["request_id"], second["level"]), (None, "request", "WARNING"))
+        self.assertEqual((third["seed"], third["request_id"]), (None, None))
+
+    def test_level(self):
+        self.logger.debug("Not formatted: %s", self)
+        self.assertEqual(self._records(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
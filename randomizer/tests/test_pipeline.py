@@ -0,0 +1,170 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import unittest
+
+from randomizer.flags import Flags
+from randomizer.pipeline import CancellationToken, Cancelled, Pipeline, Stage, StageCache, derive_seed
+from randomizer.timing import StageTimer
+
+
+def _roll(context, base: int) -> dict:
+    return {f"{context.stage_name}_value": base + context.rng.randint(0, 1000)}
+
+
+def _combine(context, left_value: int, right_value: int) -> dict:
+    return {"combined_patches": {0x0: bytearray([left_value & 0xff, right_value & 0xff])}}
+
+
+def _scaled_roll(context, base: int) -> dict:
+    return {f"{context.stage_name}_value": int(base * context.flags.scale_levels) + context.rng.randint(0, 1000)}
+
+
+def _make_pipeline() -> Pipeline:
+    # Declared out of order on purpose.
+    return Pipeline([
+        Stage("combine", _combine, inputs=["left_value", "right_value"], outputs=["combined_patches"]),
+        Stage("left", _roll, inputs=["base"], outputs=["left_value"]),
+        Stage("right", _roll, inputs=["base"], outputs=["right_value"]),
+        Stage("unused", _roll, inputs=["base"], outputs=["unused_value"]),
+    ])
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_dependency_order(self):
+        names = [stage.name for stage in _make_pipeline().stages()]
+        self.assertLess(names.index("left"), names.index("combine"))
+        self.assertLess(names.index("right"), names.index("combine"))
+
+    def test_independent_streams(self):
+        artifacts = _make_pipeline().run("seed", Flags(), {"base": 0})
+        self.assertNotEqual(artifacts["left_value"], artifacts["right_value"])
+        self.assertNotEqual(derive_seed("seed", "left"), derive_seed("seed", "right"))
+
+    def test_deterministic_across_workers(self):
+        sequential = _make_pipeline().run("seed", Flags(), {"base": 5})
+        for _ in range(5):
+            concurrent = _make_pipeline().run("seed", Flags(), {"base": 5}, max_workers=4)
+            self.assertEqual(sequential, concurrent)
+
+    def test_targets_skip_stages(self):
+        timer = StageTimer()
+        artifacts = _make_pipeline().run("seed", Flags(), {"base": 0}, targets=["combined_patches"], timer=timer)
+        self.assertNotIn("unused_value", artifacts)
+        self.assertEqual(sorted(record.name for record in timer.stages()), ["combine", "left", "right"])
+        combine = [record for record in timer.stages() if record.name == "combine"][0]
+        self.assertEqual(combine.bytes_patched, 2)
+
+    def test_duplicate_output(self):
+        with self.assertRaises(RuntimeError):
+            Pipeline([
+                Stage("first", _roll, outputs=["first_value"]),
+                Stage("second", _roll, outputs=["first_value"]),
+            ])
+
+    def test_cycle(self):
+        with self.assertRaises(RuntimeError):
+            Pipeline([
+                Stage("first", _roll, inputs=["second_value"], outputs=["first_value"]),
+                Stage("second", _roll, inputs=["first_value"], outputs=["second_value"]),
+            ])
+
+    def test_missing_input(self):
+        with self.assertRaises(RuntimeError):
+            _make_pipeline().run("seed", Flags(), {})
+
+    def test_wrong_outputs(self):
+        pipeline = Pipeline([Stage("bad", lambda context: {"other": 1}, outputs=["expected"])])
+        with self.assertRaises(RuntimeError):
+            pipeline.run("seed", Flags(), {})
+
+    def test_cache_reruns_only_affected_stages(self):
+        pipeline = Pipeline([
+            Stage("combine", _combine, inputs=["left_value", "right_value"], outputs=["combined_patches"]),
+            Stage("left", _roll, inputs=["base"], outputs=["left_value"]),
+            Stage("right", _scaled_roll, inputs=["base"], outputs=["right_value"], flags=["scale_levels"]),
+        ])
+        cache = StageCache()
+        first = pipeline.run("seed", Flags(), {"base": 10}, cache=cache)
+
+        flags = Flags()
+        flags.scale_levels = 2.0
+        timer = StageTimer()
+        second = pipeline.run("seed", flags, {"base": 10}, timer=timer, cache=cache)
+        cached = {record.name: record.cached for record in timer.stages()}
+        self.assertEqual(cached, {"left": True, "right": False, "combine": False})
+        self.assertEqual(first["left_value"], second["left_value"])
+        self.assertEqual(second, pipeline.run("seed", flags, {"base": 10}))
+
+        # A different seed or input misses the cache.
+        timer = StageTimer()
+        pipeline.run("other", flags, {"base": 10}, timer=timer, cache=cache)
+        self.assertFalse(any(record.cached for record in timer.stages()))
+        timer = StageTimer()
+        pipeline.run("seed", flags, {"base": 11}, timer=timer, cache=cache)
+        self.assertFalse(any(record.cached for record in timer.stages()))
+
+    def test_cache_concurrent(self):
+        cache = StageCache()
+        first = _make_pipeline().run("seed", Flags(), {"base": 5}, max_workers=4, cache=cache)
+        timer = StageTimer()
+        second = _make_pipeline().run("seed", Flags(), {"base": 5}, timer=timer, max_workers=4, cache=cache)
+        self.assertEqual(first, second)
+        self.assertTrue(all(record.cached for record in timer.stages()))
+
+    def test_cache_skips_uncacheable(self):
+        pipeline = Pipeline([Stage("fresh", _roll, inputs=["base"], outputs=["fresh_value"], cacheable=False)])
+        cache = StageCache()
+        pipeline.run("seed", Flags(), {"base": 0}, cache=cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_evicts(self):
+        cache = StageCache(max_entries=2)
+        cache.put("a", {})
+        cache.put("b", {})
+        cache.get("a")
+        cache.put("c", {})
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_progress(self):
+        for max_workers in (1, 4):
+            updates = []
+            _make_pipeline().run("seed", Flags(), {"base": 0}, max_workers=max_workers, progress=updates.append)
+            self.assertEqual(len(updates), 8)
+            self.assertEqual(sorted(update.stage for update in updates if update.finished),
+                             ["combine", "left", "right", "unused"])
+            fractions = [update.fraction for update in updates]
+            self.assertEqual(fractions, sorted(fractions))
+            self.assertEqual(fractions[-1], 1.0)
+
+    def test_cancel(self):
+        for max_workers in (1, 4):
+            cancel = CancellationToken()
+
+            def cancel_after_left(update):
+                if update.stage == "left" and update.finished:
+                    cancel.cancel()
+
+            updates = []
+            with self.assertRaises(Cancelled):
+                _make_pipeline().run("seed", Flags(), {"base": 0}, targets=["combined_patches"],
+                                     max_workers=max_workers, cancel=cancel,
+                                     progress=lambda update: (updates.append(update), cancel_after_left(update)))
+            self.assertNotIn("combine", [update.stage for update in updates])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from randomizer import placementpool
+from randomizer.placement import ClingoPlacement
+from randomizer.placementpool import PlacementPool, build_pool, write_pool
+
+HAS_CLINGO = importlib.util.find_spec("clingo") is not None
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+PLACEMENTS = [
+    (ClingoPlacement("lute", "sara"), ClingoPlacement("canoe", "king"), ClingoPlacement("bottle", "caravan")),
+    (ClingoPlacement("canoe", "sara"), ClingoPlacement("lute", "king"), ClingoPlacement("bottle", "caravan")),
+]
+
+
+class TestPlacementPool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "pool.bin")
+        placementpool.reload_pool()
+
+    def tearDown(self):
+        placementpool.reload_pool()
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        write_pool(self.path, PLACEMENTS)
+        pool = PlacementPool.load(self.path)
+        self.assertTrue(pool.is_current())
+        self.assertEqual(len(pool), 2)
+        self.assertEqual([pool.placement(index) for index in range(2)], PLACEMENTS)
+
+    def test_invalid_placement(self):
+        with self.assertRaises(RuntimeError):
+            write_pool(self.path, PLACEMENTS + [(ClingoPlacement("lute", "sara"), ClingoPlacement("canoe", "sara"),
+                                                 ClingoPlacement("bottle", "caravan"))])
+
+    def test_truncated(self):
+        write_pool(self.path, PLACEMENTS)
+        with open(self.path, "rb") as pool_file:
+            data = pool_file.read()
+        with self.assertRaises(RuntimeError):
+            PlacementPool(data[:-1])
+
+    def test_lookup_by_seed(self):
+        write_pool(self.path, PLACEMENTS)
+        with mock.patch.object(placementpool, "POOL_PATH", self.path):
+            self.assertEqual(placementpool.solve_placement(0x10001), PLACEMENTS[1])
+            self.assertEqual(placementpool.placement_source(), PlacementPool.load(self.path).digest)
+
+    def test_stale_pool_is_ignored(self):
+        write_pool(self.path, PLACEMENTS)
+        stale_hashes = (("asp/KeyItemSolvingShip.lp", bytes(32)),)
+        with mock.patch.object(placementpool, "POOL_PATH", self.path), \
+                mock.patch.object(placementpool, "program_hashes", return_value=stale_hashes), \
+                self.assertLogs(placementpool.logger, "WARNING"):
+            self.assertIsNone(placementpool.get_pool())
+            self.assertEqual(placementpool.placement_source(), placementpool.LIVE_SOLVE)
+
+    @unittest.skipUnless(HAS_NUMPY, "NumPy is not installed")
+    def test_validate_pool(self):
+        from randomizer.bitsetsolver import get_solver as get_bitset_solver
+
+        solver = get_bitset_solver()
+        placements = [solver.solve(seed) for seed in range(3)]
+        # The same rewards in reverse order, which can't be beaten.
+        rewards = [pairing.reward for pairing in placements[0]]
+        stuck = tuple(ClingoPlacement(reward, pairing.source)
+                      for reward, pairing in zip(reversed(rewards), placements[0]))
+        self.assertFalse(solver.is_valid(stuck))
+
+        write_pool(self.path, placements + [stuck])
+        self.assertEqual(placementpool.validate_pool(PlacementPool.load(self.path)), [3])
+
+    @unittest.skipUnless(HAS_CLINGO, "clingo is not installed")
+    def test_build_matches_solver(self):
+        from randomizer.clingo import solve_placement_for_seed
+
+        solved = build_pool(self.path, 4, max_workers=1)
+        pool = PlacementPool.load(self.path)
+        self.assertEqual(len(pool), 4)
+        placements = {frozenset(pool.placement(index)) for index in range(4)}
+        self.assertEqual(len(placements), 4)
+        self.assertTrue(placements <= {frozenset(solve_placement_for_seed(seed)) for seed in range(solved)})
+
+    @unittest.skipUnless(HAS_CLINGO, "clingo is not installed")
+    def test_limit_raises(self):
+        from randomizer import clingo
+
+        def reach_limit(seed: int, pinned: tuple, forbidden: tuple):
+            raise clingo.SolverLimitReached(f"Solving seed {seed} took too long")
+
+        with mock.patch.object(placementpool, "POOL_PATH", self.path), \
+                mock.patch.object(clingo, "solve_placement_for_seed", side_effect=reach_limit), \
+                self.assertRaises(clingo.SolverLimitReached):
+            placementpool.solve_placement(42)
+
+if __name__ == '__main__':
+    unittest.main()
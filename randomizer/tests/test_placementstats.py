@@ -0,0 +1,91 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import importlib.util
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from randomizer import placementstats
+from randomizer.bitsetsolver import BitsetSolver
+from randomizer.placement import ClingoPlacement
+
+HAS_CLINGO = importlib.util.find_spec("clingo") is not None
+
+# Small enough to count by brute force. The solving program puts the bottle at the caravan.
+DATA_PROGRAM = """
+item(lute). item(bottle). item(crown). item(canoe). item(airship).
+location(king). location(sara). location(caravan). location(astos). location(ice).
+open(king). open(sara).
+open(astos) :- has(crown).
+open(caravan) :- has(airship).
+open(ice) :- has(canoe), has(lute).
+"""
+
+
+class TestPlacementStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self.directory.name, "data.lp")
+        with open(self.data_path, "w") as data_file:
+            data_file.write(DATA_PROGRAM)
+        self.programs = ("asp/KeyItemSolvingShip.lp", self.data_path)
+        self.solver = BitsetSolver(self.programs)
+        self.cache_dir = os.path.join(self.directory.name, "cache")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _brute_force_count(self) -> int:
+        count = 0
+        for rewards in itertools.permutations(self.solver.items):
+            placement = tuple(ClingoPlacement(reward, source) for reward, source in zip(rewards, self.solver.locations))
+            count += 1 if self.solver.is_valid(placement) else 0
+        return count
+
+    def test_estimate(self):
+        estimate = placementstats.estimate_count(self.solver, 20000)
+        expected = self._brute_force_count()
+        self.assertGreater(expected, 0)
+        self.assertLess(abs(estimate["count"] - expected), 4 * estimate["standard_error"] + 1e-9)
+        self.assertEqual(sum(map(sum, estimate["frequencies"])),
+                         round(estimate["beatable_share"] * 20000) * len(self.solver.items))
+
+    @unittest.skipUnless(HAS_CLINGO, "clingo is not installed")
+    def test_exact_count(self):
+        report = placementstats.build_report(self.programs, samples=50, count_samples=100, exact_time_limit=30)
+        self.assertEqual(report["exact"], {"count": self._brute_force_count(), "complete": True})
+        self.assertEqual([sum(row) for row in report["solver"]["frequencies"]], [50] * len(self.solver.items))
+        self.assertEqual(len(placementstats.skew(report)), len(self.solver.items) * len(self.solver.locations))
+
+    def test_cached_per_program(self):
+        first = placementstats.get_report(self.programs, samples=0, count_samples=100, cache_dir=self.cache_dir)
+        with mock.patch.object(placementstats, "build_report") as build_report:
+            self.assertEqual(placementstats.get_report(self.programs, samples=0, count_samples=100,
+                                                       cache_dir=self.cache_dir), first)
+            build_report.assert_not_called()
+
+        # Any change to a program means a new report.
+        with open(self.data_path, "a") as data_file:
+            data_file.write("% Edited\n")
+        with mock.patch.object(placementstats, "build_report", return_value={}) as build_report:
+            placementstats.get_report(self.programs, samples=0, count_samples=100, cache_dir=self.cache_dir)
+            build_report.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import time
+import unittest
+
+from randomizer.flags import Flags
+from randomizer.pipeline import Pipeline, Stage, StageCache
+from randomizer.prefetch import PlacementPrefetcher
+
+
+def _solve(context) -> dict:
+    return {"key_item_solution": (context.seed, context.rng.randint(0, 0xffffffff))}
+
+
+def _use(context, key_item_solution: tuple) -> dict:
+    return {"result": key_item_solution}
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.stage = Stage("key_item_placement", _solve, outputs=["key_item_solution"], flags=["no_shuffle"])
+        self.pipeline = Pipeline([self.stage, Stage("use", _use, inputs=["key_item_solution"], outputs=["result"])])
+        self.cache = StageCache()
+        counter = itertools.count()
+        self.prefetcher = PlacementPrefetcher(self.cache, depth=3, seed_factory=lambda: f"seed{next(counter)}",
+                                              stage=self.stage)
+
+    def tearDown(self):
+        self.prefetcher.stop()
+
+    def _wait_until_full(self):
+        deadline = time.monotonic() + 10
+        while self.prefetcher.metrics()["queue_depth"] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_prefetched_seed_is_cached(self):
+        self.prefetcher.start()
+        self._wait_until_full()
+        seed = self.prefetcher.next_seed()
+        self.assertEqual(seed, "seed0")
+
+        artifacts = self.pipeline.run(seed, Flags(), {}, cache=self.cache)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(artifacts, self.pipeline.run(seed, Flags(), {}))
+
+    def test_metrics(self):
+        self.assertEqual(self.prefetcher.next_seed(), "seed0")
+        self.prefetcher.start()
+        self._wait_until_full()
+        self.prefetcher.next_seed()
+
+        metrics = self.prefetcher.metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"], metrics["queue_capacity"]), (1, 1, 3))
+        self.assertGreaterEqual(metrics["refill_ms"]["count"], 3)
+        self.assertIsNotNone(metrics["refill_ms"]["mean"])
+
+
+if __name__ == '__main__':
+    unittest.main()
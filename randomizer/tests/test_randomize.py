@@ -0,0 +1,131 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import io
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic_rom import build_synthetic_rom
+from randomizer.flags import Flags
+from randomizer.pipeline import StageCache
+from randomizer.placement import ClingoPlacement
+from randomizer.randomize import ALL_FLAGS, randomize
+from randomizer.timing import StageTimer
+
+
+class TestRandomize(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rom_data = build_synthetic_rom()
+
+    def _flags(self, **values) -> Flags:
+        flags = Flags()
+        flags.no_shuffle = True
+        for name, value in values.items():
+            setattr(flags, name, value)
+        return flags
+
+    def test_deterministic(self):
+        flags = self._flags()
+        first = randomize(self.rom_data, "seed", flags)
+        self.assertEqual(len(first), len(self.rom_data))
+        self.assertNotEqual(first, self.rom_data)
+        self.assertEqual(first, randomize(self.rom_data, "seed", flags))
+        self.assertNotEqual(first, randomize(self.rom_data, "other seed", flags))
+
+    def test_deterministic_across_workers(self):
+        flags = self._flags(scale_levels=0.5, fiend_ribbons=True, boss_shuffle=True, new_items=True)
+        sequential = randomize(self.rom_data, "seed", flags)
+        self.assertEqual(sequential, randomize(self.rom_data, "seed", flags, max_workers=4))
+
+    def test_standard_flags(self):
+        flags = self._flags(standard_shops=True, standard_treasure=True, default_start_gear=True)
+        self.assertEqual(len(randomize(self.rom_data, "seed", flags)), len(self.rom_data))
+
+    def test_python_key_item_solver(self):
+        flags = self._flags(no_shuffle=False, key_item_solver="python")
+        spoiler = io.StringIO()
+        randomized = randomize(self.rom_data, "seed", flags, spoiler=spoiler)
+        self.assertEqual(randomized, randomize(self.rom_data, "seed", flags))
+        self.assertNotEqual(randomized, randomize(self.rom_data, "seed", self._flags()))
+        self.assertIn("Py", json.loads(spoiler.getvalue())["flags"])
+
+    def test_cached_credits_follow_solver(self):
+        cache = StageCache()
+        randomize(self.rom_data, "seed", self._flags(), cache=cache)
+        timer = StageTimer()
+        flags = self._flags(key_item_solver="python")
+        randomized = randomize(self.rom_data, "seed", flags, timings=timer, cache=cache)
+        # The credits show the flag string, which has "Py" in it.
+        self.assertFalse({record.name: record.cached for record in timer.stages()}["credits"])
+        self.assertEqual(randomized, randomize(self.rom_data, "seed", flags))
+
+    def test_credits_declare_encoded_flags(self):
+        # A value for each type of flag that differs from its default.
+        changed = {bool: True, str: "python", tuple: (ClingoPlacement("excalibur", "king"),), float: 0.5}
+        for name, value in vars(Flags()).items():
+            flags = Flags()
+            setattr(flags, name, changed[type(value)])
+            if flags.encode() != Flags().encode():
+                self.assertIn(name, ALL_FLAGS)
+
+    def test_plando(self):
+        flags = self._flags(no_shuffle=False, key_item_solver="python",
+                            plando_pins=(ClingoPlacement("excalibur", "king"),))
+        spoiler = io.StringIO()
+        randomize(self.rom_data, "seed", flags, spoiler=spoiler)
+        key_items = {entry["source"]: entry["reward"] for entry in json.loads(spoiler.getvalue())["key_items"]}
+        self.assertEqual(key_items["king"], "excalibur")
+
+    def test_spoiler(self):
+        flags = self._flags()
+        spoiler = io.StringIO()
+        randomized = randomize(self.rom_data, "seed", flags, spoiler=spoiler)
+        self.assertEqual(randomized, randomize(self.rom_data, "seed", flags))
+
+        decoded = json.loads(spoiler.getvalue())
+        self.assertEqual(decoded["seed"], "seed")
+        self.assertEqual(decoded["flags"], flags.encode())
+        self.assertGreater(len(decoded["key_items"]), 0)
+        self.assertGreater(len(decoded["shops"]), 0)
+        self.assertGreater(len(decoded["chests"]), 0)
+        # boss_shuffle is set to keep the original fiends.
+        self.assertEqual(len(decoded["bosses"]), 4)
+        self.assertEqual(len(decoded["start_gear"]), 6)
+
+    def test_parallel_seeds(self):
+        flags = self._flags()
+        seeds = ["first", "second"]
+        expected = {seed: randomize(self.rom_data, seed, flags) for seed in seeds}
+
+        # Start every randomization at the same time, so they overlap as much as possible.
+        barrier = threading.Barrier(len(seeds) * 2)
+
+        def run(seed: str) -> bytearray:
+            barrier.wait()
+            return randomize(self.rom_data, seed, flags)
+
+        with ThreadPoolExecutor(max_workers=len(seeds) * 2) as executor:
+            futures = [(seed, executor.submit(run, seed)) for seed in seeds * 2]
+            results = [(seed, future.result()) for seed, future in futures]
+
+        for seed, result in results:
+            self.assertEqual(result, expected[seed])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+import tempfile
+import unittest
+
+from randomizer.flags import Flags
+from randomizer.resultcache import ResultCache, result_key
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_key(self):
+        flags = Flags()
+        key = result_key("rom", flags, "seed")
+        self.assertEqual(key, result_key("rom", Flags(), "seed"))
+        self.assertNotEqual(key, result_key("other rom", flags, "seed"))
+        self.assertNotEqual(key, result_key("rom", flags, "other seed"))
+        self.assertNotEqual(key, result_key("rom", flags, "seed", version="0"))
+        self.assertNotEqual(result_key("rom", flags, "seed", placements="clingo"),
+                            result_key("rom", flags, "seed", placements="pool"))
+
+        # These encode to the same flag string, but don't randomize the same way.
+        two_thirds = Flags()
+        two_thirds.scale_levels = 1.0 / 1.5
+        five_eighths = Flags()
+        five_eighths.scale_levels = 1.0 / 1.6
+        self.assertEqual(two_thirds.encode(), five_eighths.encode())
+        self.assertNotEqual(result_key("rom", two_thirds, "seed"), result_key("rom", five_eighths, "seed"))
+
+    def test_memory(self):
+        cache = ResultCache(max_memory_bytes=10)
+        self.assertIsNone(cache.get("a", "ips"))
+        cache.put("a", "ips", b"1234")
+        cache.put("b", "ips", b"1234")
+        self.assertEqual(cache.get("a", "ips"), b"1234")
+        self.assertIsNone(cache.get("a", "rom"))
+
+        # "b" is the least recently used, so it makes room for "c".
+        cache.put("c", "ips", b"1234")
+        self.assertIsNone(cache.get("b", "ips"))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ResultCache(directory).put("abcd", "ips", b"patch")
+
+            # A new cache (as in another process) finds it on disk.
+            cache = ResultCache(directory)
+            self.assertEqual(cache.get("abcd", "ips"), b"patch")
+            cache.clear()
+            self.assertEqual(cache.get("abcd", "ips"), b"patch")
+
+    def test_disk_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache(directory, max_memory_bytes=0, max_disk_bytes=10)
+            cache.put("aa", "ips", b"1234")
+            cache.put("bb", "ips", b"1234")
+            os.utime(os.path.join(directory, "aa", "aa.ips"), (0, 0))
+            os.utime(os.path.join(directory, "bb", "bb.ips"), (1, 1))
+            self.assertEqual(cache.get("aa", "ips"), b"1234")
+
+            cache.put("cc", "ips", b"1234")
+            self.assertIsNone(cache.get("bb", "ips"))
+            self.assertEqual(cache.get("aa", "ips"), b"1234")
+            self.assertEqual(cache.get("cc", "ips"), b"1234")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import time
+import unittest
+from functools import partial
+
+from benchmarks.synthetic_rom import build_synthetic_rom
+from randomizer.flags import Flags
+from randomizer.search import has_bosses, load_scorer, no_early_s_gear, search_seeds
+
+
+def _first_boss_length(artifacts: dict) -> int:
+    return len(artifacts["boss_choices"][0])
+
+
+def _slow_long_first_boss(artifacts: dict):
+    length = len(artifacts["boss_choices"][0])
+    # Better candidates take longer, so worse ones generated after them are accepted first.
+    time.sleep(0.02 * length)
+    return length if length >= 12 else None
+
+
+def _reject(artifacts: dict) -> bool:
+    return False
+
+
+class TestSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rom_data = build_synthetic_rom()
+        cls.flags = Flags()
+        cls.flags.no_shuffle = True
+
+    def test_matches(self):
+        results = search_seeds(self.rom_data, self.flags, partial(has_bosses, bosses=()), matches=3, budget=10,
+                               max_workers=1, search_seed="search")
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results, search_seeds(self.rom_data, self.flags, partial(has_bosses, bosses=()), matches=3,
+                                               budget=10, max_workers=1, search_seed="search"))
+
+    def test_budget(self):
+        self.assertEqual(search_seeds(self.rom_data, self.flags, _reject, budget=3, max_workers=1), [])
+
+    def test_scores(self):
+        results = search_seeds(self.rom_data, self.flags, _first_boss_length, matches=5, budget=5, max_workers=1)
+        self.assertEqual([result.score for result in results],
+                         sorted([result.score for result in results], reverse=True))
+
+    def test_process_pool(self):
+        sequential = search_seeds(self.rom_data, self.flags, _first_boss_length, matches=4, budget=4, max_workers=1,
+                                  search_seed="pool")
+        parallel = search_seeds(self.rom_data, self.flags, _first_boss_length, matches=4, budget=4, max_workers=2,
+                                search_seed="pool")
+        self.assertEqual(sequential, parallel)
+
+    def test_process_pool_stops_like_sequential(self):
+        # Fewer matches than candidates: later candidates that finish first mustn't take the place of earlier ones.
+        sequential = search_seeds(self.rom_data, self.flags, _slow_long_first_boss, matches=1, budget=12,
+                                  max_workers=1, search_seed="pool")
+        parallel = search_seeds(self.rom_data, self.flags, _slow_long_first_boss, matches=1, budget=12, max_workers=3,
+                                search_seed="pool")
+        self.assertEqual(sequential, parallel)
+
+    def test_load_scorer(self):
+        self.assertIs(load_scorer("randomizer.search:no_early_s_gear"), no_early_s_gear)
+        with self.assertRaises(RuntimeError):
+            load_scorer("no_early_s_gear")
+
+
+if __name__ == '__main__':
+    unittest.main()
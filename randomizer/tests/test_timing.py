@@ -0,0 +1,84 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import tracemalloc
+import unittest
+
+from randomizer.timing import StageTimer
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_bytes_patched(self):
+        timer = StageTimer()
+        patches = {0x10: bytearray(4)}
+        with timer.stage("first", patches):
+            patches[0x20] = bytearray(8)
+            patches[0x30] = (0x1, 0x2)
+        with timer.stage("second", patches):
+            pass
+
+        stages = timer.stages()
+        self.assertEqual([stage.name for stage in stages], ["first", "second"])
+        self.assertEqual(stages[0].bytes_patched, 10)
+        self.assertEqual(stages[1].bytes_patched, 0)
+        self.assertGreaterEqual(stages[0].elapsed_ns, 0)
+
+    def test_record_survives_exception(self):
+        timer = StageTimer()
+        with self.assertRaises(RuntimeError):
+            with timer.stage("broken"):
+                raise RuntimeError("Stage failed")
+        self.assertEqual(len(timer.stages()), 1)
+
+    def test_json(self):
+        timer = StageTimer()
+        with timer.stage("ips_diff") as record:
+            record.bytes_patched = 42
+        decoded = json.loads(timer.to_json())
+        self.assertEqual(decoded["stages"][0]["name"], "ips_diff")
+        self.assertEqual(decoded["stages"][0]["bytes_patched"], 42)
+        self.assertEqual(decoded["total_ns"], timer.total_ns())
+        self.assertTrue(timer.server_timing().startswith("ips_diff;dur="))
+
+    def test_profile_memory(self):
+        timer = StageTimer(profile_memory=True)
+        with timer.stage("allocate"):
+            kept = bytearray(1024 * 1024)
+        with timer.stage("nothing"):
+            pass
+
+        allocate, nothing = timer.stages()
+        self.assertGreaterEqual(allocate.peak_bytes, len(kept))
+        self.assertGreaterEqual(allocate.net_bytes, len(kept))
+        self.assertGreaterEqual(allocate.top_allocations[0].size_diff, len(kept))
+        self.assertTrue(allocate.top_allocations[0].site.startswith(__file__))
+        self.assertLess(nothing.peak_bytes, len(kept))
+        self.assertFalse(tracemalloc.is_tracing())
+
+        decoded = json.loads(timer.to_json())
+        self.assertEqual(decoded["stages"][0]["peak_bytes"], allocate.peak_bytes)
+        self.assertIn("allocate", timer.memory_report())
+
+    def test_no_memory_by_default(self):
+        timer = StageTimer()
+        with timer.stage("allocate"):
+            pass
+        self.assertIsNone(timer.stages()[0].peak_bytes)
+        self.assertNotIn("peak_bytes", json.loads(timer.to_json())["stages"][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
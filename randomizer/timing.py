@@ -0,0 +1,172 @@
+#  Copyright 2020 Nicole Borrelli
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+AllocationSite = namedtuple("AllocationSite", ["site", "size_diff", "count_diff"])
+
+
+class StageRecord(object):
+    """Timing information for one stage of a randomization."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed_ns = 0
+        self.bytes_patched = 0
+        self.cached = False
+        # Only set when the timer profiles memory.
+        self.peak_bytes = None
+        self.net_bytes = None
+        self.top_allocations = []
+
+    def as_dict(self) -> dict:
+        record = {
+            "name": self.name,
+            "elapsed_ns": self.elapsed_ns,
+            "bytes_patched": self.bytes_patched,
+            "cached": self.cached
+        }
+        if self.peak_bytes is not None:
+            record["peak_bytes"] = self.peak_bytes
+            record["net_bytes"] = self.net_bytes
+            record["top_allocations"] = [allocation._asdict() for allocation in self.top_allocations]
+        return record
+
+
+
+class StageTimer(object):
+    """Collects the time spent, and bytes patched, by each stage of a randomization.
+
+    With `profile_memory` set, each stage also records (via tracemalloc) the peak memory it allocated above what was
+    in use when it started, the memory it left allocated, and the lines that allocated the most. tracemalloc is
+    started for the duration of each stage if it isn't already running. Tracing is process-wide, so stages must run
+    one at a time for the numbers to mean anything, and everything runs noticeably slower while it's on.
+    """
+
+    def __init__(self, profile_memory: bool = False, top_allocations: int = 5):
+        """
+        :param profile_memory: Whether to record the memory allocated by each stage.
+        :param top_allocations: Number of allocation sites to record for each stage.
+        """
+        self._stages = []
+        self.profile_memory = profile_memory
+        self._top_allocations = top_allocations
+        self._tracing_lock = threading.Lock()
+        self._tracing_depth = 0
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str, patches: dict = None):
+        """Times a block of code as a named stage.
+
+        :param name: Name of the stage.
+        :param patches: Optional patch dictionary. Bytes added to it while the stage runs are counted as patched
+                        by the stage.
+        :return: The StageRecord for the stage, which may be updated by the caller.
+        """
+        record = StageRecord(name)
+        start_size = patch_size(patches) if patches is not None else 0
+        snapshot = self._start_memory_profile() if self.profile_memory else None
+        start = time.monotonic_ns()
+        try:
+            yield record
+        finally:
+            record.elapsed_ns = time.monotonic_ns() - start
+            if patches is not None:
+                record.bytes_patched += patch_size(patches) - start_size
+            if snapshot is not None:
+                self._finish_memory_profile(record, snapshot)
+            self._stages.append(record)
+
+    def _start_memory_profile(self) -> tuple:
+        with self._tracing_lock:
+            if self._tracing_depth == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._tracing_depth += 1
+
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        return current, snapshot
+
+    def _finish_memory_profile(self, record: StageRecord, start: tuple):
+        start_current, start_snapshot = start
+        current, peak = tracemalloc.get_traced_memory()
+        record.peak_bytes = max(0, peak - start_current)
+        record.net_bytes = current - start_current
+
+        # Leave tracemalloc's, and the timer's, own bookkeeping out of the allocation sites.
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        differences = snapshot.compare_to(start_snapshot.filter_traces(ignore), "lineno")
+        for difference in differences:
+            if len(record.top_allocations) >= self._top_allocations or difference.size_diff <= 0:
+                break
+            frame = difference.traceback[0]
+            record.top_allocations.append(
+                AllocationSite(f"{frame.filename}:{frame.lineno}", difference.size_diff, difference.count_diff))
+
+        with self._tracing_lock:
+            self._tracing_depth -= 1
+            if self._tracing_depth == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def stages(self) -> list:
+        return self._stages
+
+    def total_ns(self) -> int:
+        return sum(record.elapsed_ns for record in self._stages)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": [record.as_dict() for record in self._stages],
+            "total_ns": self.total_ns()
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict())
+
+    def memory_report(self) -> str:
+        """Formats the memory used by each stage as a table, followed by each stage's top allocation sites."""
+        lines = [f"{'stage':<24}{'peak KiB':>12}{'net KiB':>12}"]
+        for record in self._stages:
+            if record.peak_bytes is not None:
+                lines.append(f"{record.name:<24}{record.peak_bytes / 1024:>12.1f}{record.net_bytes / 1024:>12.1f}")
+        for record in self._stages:
+            if len(record.top_allocations) > 0:
+                lines.append(f"{record.name}:")
+                for allocation in record.top_allocations:
+                    lines.append(f"  {allocation.size_diff / 1024:>10.1f} KiB in {allocation.count_diff:>6} blocks: "
+                                 f"{allocation.site}")
+        return "\n".join(lines)
+
+    def server_timing(self) -> str:
+        """Formats the stages as the value of a `Server-Timing` HTTP header (durations are in ms)."""
+        return ", ".join(f"{record.name};dur={record.elapsed_ns / 1000000:.3f}" for record in self._stages)
+
+
+def patch_size(patches: dict) -> int:
+    """Counts the number of bytes in a patch dictionary.
+
+    :param patches: Patches as a dictionary. Keys are offsets, values are patch data.
+    :return: Total size of the patch data in bytes.
+    """
+    return sum(len(data) for data in patches.values())
@@ -14,7 +14,6 @@
 
 import random
 from collections import namedtuple
-from copy import deepcopy
 
 from doslib.dos_utils import load_tsv
 from doslib.item import Item
@@ -31,7 +30,8 @@ class InventoryGenerator(object):
         self.rng = random.Random()
         self.rng.seed(seed)
 
-        self.items = deepcopy(items)
+        # Nothing here modifies the items, so they're shared with the caller instead of copied.
+        self.items = items
 
         self.chests_data = []
         chest_data_file = "data/ChestData.tsv"
@@ -174,9 +174,15 @@ const saveData = (function() {
 }());
 
 function newSeed() {
-    var seed = Math.floor(Math.random() * 0xffffffff).toString(16);
-    document.getElementById("rom-seed").value = seed
-    updateHash()
+    // Ask the server first: its seeds have their key items placed already, so they randomize faster.
+    fetch('/seed')
+        .then(response => response.json())
+        .then(data => data.seed)
+        .catch(() => Math.floor(Math.random() * 0xffffffff).toString(16))
+        .then(seed => {
+            document.getElementById("rom-seed").value = seed
+            updateHash()
+        });
 }
 
 function updateHash() {